@@ -11,6 +11,9 @@ import sys
 from dnload.assembler import Assembler
 from dnload.assembler_file import AssemblerFile
 from dnload.assembler_segment import AssemblerSegment
+from dnload.cache import Cache
+from dnload.cache import run_command_cached
+from dnload.cache import set_cache
 from dnload.common import executable_find
 from dnload.common import executable_search
 from dnload.common import generate_temporary_filename
@@ -19,16 +22,32 @@ from dnload.common import is_listing
 from dnload.common import is_verbose
 from dnload.common import listify
 from dnload.common import locate
+from dnload.common import parallel_map
 from dnload.common import remove_blob
 from dnload.common import run_command
+from dnload.common import set_job_count
 from dnload.common import set_temporary_directory
 from dnload.common import set_verbose
 from dnload.compiler import Compiler
+from dnload.compression import compress_data
 from dnload.custom_help_formatter import CustomHelpFormatter
+from dnload.definition_database import generate_definition_database
+from dnload.elf_file import ElfFile
+from dnload.elf_image import link_elf_image
+from dnload.elf_image import set_direct_link
+from dnload.elfling import ELFLING_OUTPUT
+from dnload.elfling import ELFLING_UNCOMPRESSED
+from dnload.function_order_search import search_function_order
 from dnload.glsl import Glsl
 from dnload.glsl import single_character_alphabet
+from dnload.glsl_preprocessor import GlslPreprocessor
+from dnload.library_hash_index import collect_hash_indexes
+from dnload.library_hash_index import find_hash_collisions
+from dnload.library_hash_index import search_symbol_hash
 from dnload.library_definition import g_library_definitions
 from dnload.linker import Linker
+from dnload.option_search import search_build_options
+from dnload.option_search import SEARCH_RUN_TIMEOUT
 from dnload.platform_var import g_osarch
 from dnload.platform_var import g_osname
 from dnload.platform_var import g_osversion
@@ -46,12 +65,19 @@ from dnload.platform_var import replace_osarch
 from dnload.platform_var import replace_osname
 from dnload.platform_var import replace_platform_variable
 from dnload.preprocessor import Preprocessor
+from dnload.section_order_search import search_section_order
+from dnload.segment_merge_search import search_segment_merge
 from dnload.symbol import generate_loader_dlfcn
 from dnload.symbol import generate_loader_hash
 from dnload.symbol import generate_loader_vanilla
 from dnload.symbol import generate_symbol_definitions_direct
 from dnload.symbol import generate_symbol_definitions_table
 from dnload.symbol import generate_symbol_table
+from dnload.symbol_hash import generate_sdbm_multipliers
+from dnload.symbol_hash import get_symbol_hash
+from dnload.symbol_hash import SDBM_MULTIPLIER_SEARCH_COUNT
+from dnload.symbol_hash import SymbolHash
+from dnload.symbol_order_search import search_symbol_order
 from dnload.symbol_source_database import g_symbol_sources
 from dnload.template import Template
 
@@ -276,7 +302,7 @@ g_template_header = Template("""#ifndef DNLOAD_H
 #else
 #include <stdint.h>
 #endif
-[[INCLUDE_C]][[INCLUDE_FFTW]][[INCLUDE_FREETYPE]][[INCLUDE_MATH]][[INCLUDE_NCURSES]][[INCLUDE_OPENGL]][[INCLUDE_OPUS]][[INCLUDE_OPUSFILE]][[INCLUDE_PNG]][[INCLUDE_RAND]][[INCLUDE_SDL]][[INCLUDE_SNDFILE]]
+[[INCLUDE_C]][[INCLUDE_FFTW]][[INCLUDE_FREETYPE]][[INCLUDE_MATH]][[INCLUDE_NCURSES]][[INCLUDE_OPENGL]][[INCLUDE_OPUS]][[INCLUDE_OPUSFILE]][[INCLUDE_PNG]][[INCLUDE_RAND]][[INCLUDE_SDL]][[INCLUDE_SNDFILE]][[INCLUDE_GENERATED]]
 /// Macro stringification helper (adds indirection).
 #define DNLOAD_MACRO_STR_HELPER(op) #op
 /// Macro stringification.
@@ -612,8 +638,11 @@ def compress_file(compression, filedrop_interp, pretty, src, dst):
         raise RuntimeError("unknown compression format '%s'" % compression)
     # Create the header string.
     header = "%sI=/tmp/i;%s $0|%s>$I%s;%s$I%s" % (str_header, str_tail, str_cat, str_chmod, str_ld, str_cleanup)
-    # Compress the file.
-    (compressed, se) = run_command(command + [src], False)
+    # Compress the file, fall back to external xz if in-process compression is not available.
+    with open(src, "rb") as rfd:
+        compressed = compress_data(rfd.read(), compression)
+    if compressed is None:
+        (compressed, se) = run_command_cached(command + [src], [src], [], False)
     wfd = open(dst, "wb")
     wfd.write((header + "\n").encode())
     wfd.write(compressed)
@@ -642,18 +671,14 @@ def find_global_tmpdir():
 
 def find_library_definition(op):
     """Find library definition with name."""
-    for ii in g_library_definitions:
-        if ii.get_name() == op:
-            return ii
-    return None
+    return g_library_definitions.find_library_definition(op)
 
 def find_symbol(op):
     """Find single symbol with name."""
-    for ii in g_library_definitions:
-        ret = ii.find_symbol(op)
-        if ret:
-            return ret
-    raise RuntimeError("symbol '%s' not known, please add it to the script" % (op))
+    ret = g_library_definitions.find_symbol(op)
+    if ret:
+        return ret
+    raise RuntimeError("symbol '%s' not known, please add it to the script or specify a header declaring it with --library-header" % (op))
 
 def find_symbols(lst):
     """Find symbol object(s) corresponding to symbol string(s)."""
@@ -663,8 +688,12 @@ def find_symbols(lst):
     return ret
 
 def generate_binary_minimal(source_file, compiler, assembler, linker, objcopy, elfling, libraries, output_file,
-                            additional_sources=[], interp_needed=False, merge_allowed=True):
-    """Generate a binary using all possible tricks. Return whether or not reprocess is necessary."""
+                            additional_sources=[], interp_needed=False, merge_allowed=True, peephole=True,
+                            remove_unreachable=True, compression=None, function_order="source",
+                            search_sections=False):
+    """Generate a binary using all possible tricks. Return whether or not reprocess is necessary.
+
+    Orders of functions and sections can be searched for the smallest output of given compression."""
     output_file_s = generate_temporary_filename(output_file + ".S")
     if source_file:
         compiler.compile_asm(source_file, output_file_s, True)
@@ -724,9 +753,11 @@ def generate_binary_minimal(source_file, compiler, assembler, linker, objcopy, e
         if additional_file:
             additional_asm = AssemblerFile(additional_file)
             asm.incorporate(additional_asm, re.sub(r'[\/\.]', '_', output_file + "_extra"))
-    # Sort sections after generation, then crunch the source.
+    # Sort sections after generation, remove code and data not reachable from entry points, then crunch the source.
     asm.sort_sections(assembler)
-    asm.crunch()
+    if remove_unreachable:
+        asm.remove_unreachable(("_start", ELFLING_OUTPUT, ELFLING_UNCOMPRESSED))
+    asm.crunch(peephole)
     # May be necessary to have two PT_LOAD headers as opposed to one.
     phdr_count = 2
     segment_phdr_load_bss = None
@@ -775,13 +806,34 @@ def generate_binary_minimal(source_file, compiler, assembler, linker, objcopy, e
             replace_platform_variable("e_shstrndx", 7)  # Merges with rwx flags.
         else:
             replace_platform_variable("phdr32_dynamic_p_flags", 21)  # Merges with DT_DEBUG in dynamic section.
-        segments = merge_segments(segments_head) + segments_mid + merge_segments(segments_tail)
+        # Segments after the last phdr may be reordered.
+        segments = search_segment_merge(segments_head, len(segments_head), assembler) + segments_mid + \
+            search_segment_merge(segments_tail, 1, assembler)
     else:
         segments = segments_head + segments_mid + segments_tail
     # Create content of earlier sections and write source when done.
     if asm.hasSectionAlignment():
         asm.getSectionAlignment().create_content(assembler)
     bss_section.create_content(assembler, "end")
+    # Linker script and final processing do not depend on the assembler source.
+    output_file_ld = generate_temporary_filename(output_file + ".ld")
+    output_file_unprocessed = generate_temporary_filename(output_file + ".unprocessed")
+    output_file_stripped = generate_temporary_filename(output_file + ".stripped")
+    linker.generate_linker_script(output_file_ld, True)
+    linker.set_linker_script(output_file_ld)
+    # Some platforms cannot skip the extra objcopy step. Reason unknown.
+    if (not osarch_is_aarch64()) and (not osarch_is_arm32l()):
+        objcopy = None
+    # Content after first PT_LOAD is zeroed instead of truncated if there is a fake .bss segment.
+    zero = (0 < bss_section.get_alignment())
+    # Search function and section order before writing, elfling depends on position of the alignment section.
+    if (("source" != function_order) or search_sections) and (not elfling):
+        header = "".join([ii.generate_source(assembler) for ii in segments])
+        if "source" != function_order:
+            search_function_order(asm, header, assembler, linker, objcopy, zero, compression,
+                                  "search" == function_order)
+        if search_sections:
+            search_section_order(asm, header, assembler, linker, objcopy, zero, compression)
     # Write headers out first.
     fd = open(output_file_final_s, "w")
     header_sizes = 0
@@ -797,21 +849,8 @@ def generate_binary_minimal(source_file, compiler, assembler, linker, objcopy, e
         print("Wrote assembler source: '%s'" % (output_file_final_s))
     # Assemble headers
     assembler.assemble(output_file_final_s, output_file_final_o)
-    link_files = [output_file_final_o]
-    # Link all generated files.
-    output_file_ld = generate_temporary_filename(output_file + ".ld")
-    output_file_unprocessed = generate_temporary_filename(output_file + ".unprocessed")
-    output_file_stripped = generate_temporary_filename(output_file + ".stripped")
-    linker.generate_linker_script(output_file_ld, True)
-    linker.set_linker_script(output_file_ld)
-    # Some platforms cannot skip the extra objcopy step. Reason unknown.
-    if (not osarch_is_aarch64()) and (not osarch_is_arm32l()):
-        objcopy = None
-    linker.link_binary(objcopy, link_files, output_file_unprocessed)
-    if bss_section.get_alignment():
-        readelf_zero(output_file_unprocessed, output_file_stripped)
-    else:
-        readelf_truncate(output_file_unprocessed, output_file_stripped)
+    # Link into final binary, directly writing the image if possible.
+    link_elf_image(linker, objcopy, output_file_final_o, output_file_unprocessed, output_file_stripped, zero)
 
 def generate_elfling(output_file, compiler, elfling, definition_ld):
     """Generate elfling stub."""
@@ -911,6 +950,23 @@ def generate_glsl_extract(fname, preprocessor, definition_ld, mode, freqs, inlin
         return glsl_db.getBlobs()
     return []
 
+def generate_include_generated(symbols, includes):
+    """Generate includes for headers of generated symbol definitions that are not already included."""
+    included = "".join(includes.values())
+    headers = []
+    for ii in symbols:
+        for jj in ii.get_library().get_headers():
+            if jj not in headers:
+                headers += [jj]
+    ret = ""
+    for ii in headers:
+        if ("\"%s\"" % (ii) in included) or ("<%s>" % (ii) in included):
+            continue
+        ret += "#include \"%s\"\n" % (ii)
+    if ret:
+        return "\n" + ret
+    return ""
+
 def generate_include_rand(implementation_rand, target_search_path, definition_ld):
     """Generates the rand()/srand() include."""
     regex_rand_header = re.compile(r'%s[-_\s]+rand\.h(h|pp|xx)?' % (implementation_rand))
@@ -945,96 +1001,37 @@ def make_executable(op):
     if not os.stat(op)[stat.ST_MODE] & stat.S_IXUSR:
         run_command(["chmod", "+x", op])
 
-def merge_segments(lst):
-    """Try to merge segments in a given list in-place."""
-    ii = 0
-    while True:
-        jj = ii + 1
-        if len(lst) <= jj:
-            return lst
-        seg1 = lst[ii]
-        seg2 = lst[jj]
-        if seg1.merge(seg2):
-            if seg2.empty():
-                del lst[jj]
-            else:
-                ii += 1
-        else:
-            ii += 1
-    return lst
+def order_symbols(symbols, order, group_libraries):
+    """Order symbols by given listing of names, symbols not listed follow in their current order."""
+    positions = {}
+    for (idx, ii) in enumerate(order):
+        positions.setdefault(ii, idx)
+    ret = sorted(symbols, key=lambda x: positions.get(x.get_name(), len(order)))
+    # Libraries are ordered by their first symbol.
+    if group_libraries:
+        libraries = []
+        for ii in ret:
+            if ii.get_library().get_name() not in libraries:
+                libraries += [ii.get_library().get_name()]
+        ret = sorted(ret, key=lambda x: libraries.index(x.get_library().get_name()))
+    return ret
+
+def preprocess_symbol_names(preprocessor, source_file, prefix):
+    """Preprocess given C source file, then analyze it for symbol names."""
+    return extract_symbol_names(preprocessor.preprocess(source_file), prefix)
 
 def raise_unknown_address_size():
     """Common function to raise an error if os architecture address size is unknown."""
     raise RuntimeError("platform '%s' addressing size unknown" % (g_osarch))
 
-def readelf_get_info(op):
-    """Read information from an ELF file using readelf. Return as dictionary."""
-    ret = {}
-    (so, se) = run_command(["readelf", "-l", op])
-    match = re.search(r'LOAD\s+\S+\s+(\S+)\s+\S+\s+(\S+)\s+\S+\s+RWE', so, re.MULTILINE)
-    if match:
-        ret["base"] = int(match.group(1), 16)
-        ret["size"] = int(match.group(2), 16)
-    else:
-        raise RuntimeError("could not read first PT_LOAD from executable '%s'" % (op))
-    # Entry point is locale-dependant so attempt to read it from the second line.
-    match = re.match(r'\s*\n.*EXEC.*\n*.*\s+(0x\S+)\n', so, re.MULTILINE)
-    if match:
-        ret["entry"] = int(match.group(1), 16) - ret["base"]
-    else:
-        raise RuntimeError("could not read entry point from executable '%s'" % (op))
-    return ret
-
 def readelf_list_und_symbols(op):
     """List UND symbols found from a file."""
-    (so, se) = run_command(["readelf", "--symbols", op])
-    match = re.findall(r'GLOBAL\s+DEFAULT\s+UND\s+(\S+)\s+', so, re.MULTILINE)
-    if match:
-        return match
+    with ElfFile(op) as elf:
+        ret = elf.get_und_symbols()
+    if ret:
+        return ret
     return None
 
-def readelf_probe(src, dst, size):
-    """Probe ELF size, copy source to destination on equal size and return None, or return truncation size."""
-    info = readelf_get_info(src)
-    truncate_size = info["size"]
-    if size == truncate_size:
-        if is_verbose():
-            print("Executable size equals PT_LOAD size (%u bytes), no operation necessary." % (size))
-        shutil.copy(src, dst)
-        return None
-    return truncate_size
-
-def readelf_truncate(src, dst):
-    """Truncate file to size reported by readelf first PT_LOAD file size."""
-    size = os.path.getsize(src)
-    truncate_size = readelf_probe(src, dst, size)
-    if truncate_size is None:
-        return
-    if is_verbose():
-        print("Truncating file size to PT_LOAD size: %u bytes" % (truncate_size))
-    rfd = open(src, "rb")
-    wfd = open(dst, "wb")
-    wfd.write(rfd.read(truncate_size))
-    rfd.close()
-    wfd.close()
-
-def readelf_zero(src, dst):
-    """Zero bytes in ELF file starting from first PT_LOAD size."""
-    size = os.path.getsize(src)
-    truncate_size = readelf_probe(src, dst, size)
-    if truncate_size is None:
-        return
-    if is_verbose():
-        print("Filling file with 0 after PT_LOAD size: %u bytes" % (truncate_size))
-    rfd = open(src, "rb")
-    wfd = open(dst, "wb")
-    wfd.write(rfd.read(truncate_size))
-    rfd.close()
-    while truncate_size < size - 1:
-        wfd.write("\0")
-        truncate_size += 1
-    wfd.close()
-
 def replace_conflicting_library(symbols, src_name, dst_name):
     """Replace conflicting library reference in a symbol set if necessary."""
     src_found = symbols_has_library(symbols, src_name)
@@ -1058,6 +1055,39 @@ def replace_conflicting_library(symbols, src_name, dst_name):
             ret += [ii]
     return ret
 
+def search_hash_function(symbols, libraries, linker):
+    """Search smallest hash function variant with which the import by hash loader finds all symbols correctly."""
+    hash_functions = [SymbolHash("sdbm")]
+    # CRC32 is only available as an intrinsic on x86.
+    if osarch_is_ia32() or osarch_is_amd64():
+        hash_functions += [SymbolHash("crc32")]
+    for ii in generate_sdbm_multipliers(SDBM_MULTIPLIER_SEARCH_COUNT)[1:]:
+        hash_functions += [SymbolHash("sdbm", ii)]
+    names = list(map(lambda x: x.get_name(), symbols))
+    ret = search_symbol_hash(names, libraries, linker, hash_functions)
+    if is_verbose():
+        print("Found hash function: '%s'" % (str(ret)))
+    return ret
+
+def select_hash_function(hash_function, hash_function_auto, symbols, libraries, linker):
+    """Select hash function with which the import by hash loader finds all symbols correctly."""
+    candidates = [hash_function]
+    if hash_function_auto:
+        candidates += sorted(set(("crc32", "sdbm")) - set(candidates))
+    names = list(map(lambda x: x.get_name(), symbols))
+    collisions = []
+    for ii in candidates:
+        collisions = find_hash_collisions(names, collect_hash_indexes(libraries, linker, ii), ii)
+        if not collisions:
+            if (ii != hash_function) and is_verbose():
+                print("Switching to hash function '%s' to avoid hash collisions." % (ii))
+            return ii
+        if is_verbose():
+            for (name, fname, colliding_name) in collisions:
+                print("Hash function '%s' would load '%s' from '%s' as '%s'." % (ii, name, fname, colliding_name))
+    collision_strings = list(map(lambda x: "%s (%s in '%s')" % (x[0], x[2] or "null symbol", x[1]), collisions))
+    raise RuntimeError("hash collisions with hash function '%s': %s" % (candidates[-1], ", ".join(collision_strings)))
+
 def set_program_start(op):
     """Set label to start program execution from."""
     replace_platform_variable("start", op)
@@ -1098,6 +1128,7 @@ def main():
     global g_osname
     compression = str(PlatformVar("compression"))
     default_assembler_list = ["/usr/local/bin/as", "as"]
+    default_cache_directory = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "dnload")
     default_compiler_list = ["g++11", "g++-11", "g++9", "g++-9", "g++", "clang++"]
     default_linker_list = ["/usr/local/bin/ld", "ld"]
     default_preprocessor_list = ["cpp", "clang-cpp"]
@@ -1122,28 +1153,37 @@ def main():
     parser.add_argument("-A", "--assembler", default=None, help="Try to use given assembler executable as opposed to autodetect.")
     parser.add_argument("-B", "--objcopy", default=None, help="Try to use given objcopy executable as opposed to autodetect.")
     parser.add_argument("-C", "--compiler", default=None, help="Try to use given compiler executable as opposed to autodetect.")
+    parser.add_argument("--cache-dir", default=default_cache_directory, help="Directory to store cached build stage outputs in.\n(default: %(default)s)")
     parser.add_argument("-d", "--definition-ld", default="DNLOAD_USE_LD", help="Definition to use for checking whether to use 'safe' mechanism instead of dynamic loading.\n(default: %(default)s)")
     parser.add_argument("-D", "--define", default=[], action="append", help="Additional preprocessor definition.")
     parser.add_argument("-e", "--elfling", action="store_true", help="Use elfling packer if available.")
     parser.add_argument("-E", "--preprocess-only", action="store_true", help="Preprocess only, do not generate compiled output.")
     parser.add_argument("-F", "--filedrop-mode", default="auto", choices=("header", "native", "cross", "auto"), help="File dropping and interpreter calling mode.\n\theader:\n\t\tAdd explicit PT_INTERP header into the binary.\n\tnative:\n\t\tCall dynamic linker for the native platform.\n\tcross:\n\t\tCall dynamic linker assuming cross-platform emulation.\n\tauto:\n\t\tTry to autodetect and create the smallest binary to be ran on current machine.\n(default: %(default)s)")
+    parser.add_argument("--function-order", default="source", choices=("source", "call-graph", "search"), help="Order of functions in the output, only affects 'maximum' method:\n\tsource:\n\t\tKeep functions in the order compiler emits them.\n\tcall-graph:\n\t\tPlace callers next to callees, kept only if compressed output is smaller.\n\tsearch:\n\t\tRefine call graph order by moving single functions, scoring candidates by compressed size.\n(default: %(default)s)")
     parser.add_argument("--gles", default="auto", choices=("yes", "no", "auto"), help="OpenGL ES, detection override:\n\tyes:\n\t\tAssume GLES as opposed to regular OpenGL.\n\tyes:\n\t\tAssume regular OpenGL.\n\tauto:\n\t\tTry to autodetect if platform uses GLES.\n(default: %(default)s)")
     parser.add_argument("-h", "--help", action="store_true", help="Print this help string and exit.")
-    parser.add_argument("-H", "--hash-function", default="auto", choices=("crc32", "sdbm", "auto"), help="Hash function to use for hashing function names:\n\tcrc32:\n\t\tCRC32 intrisic hash.\n\tsdbm:\n\t\tSDBM hash.\n\tauto:\n\t\tUse smallest implementation.\n(default: %(default)s)")
+    parser.add_argument("-H", "--hash-function", default="auto", choices=("crc32", "gnu", "sdbm", "search", "auto"), help="Hash function to use for hashing function names:\n\tcrc32:\n\t\tCRC32 intrisic hash.\n\tgnu:\n\t\tGNU hash, look symbols up from DT_GNU_HASH tables of libraries.\n\tsdbm:\n\t\tSDBM hash.\n\tsearch:\n\t\tSearch seeded and truncated hashes for the smallest one without collisions in libraries linked against.\n\tauto:\n\t\tUse smallest implementation.\n(default: %(default)s)")
     parser.add_argument("-I", "--include-directory", default=[], action="append", help="Add an include directory to be searched for header files.")
     parser.add_argument("--interp", default=None, type=str, help="Use given interpreter as opposed to platform default.")
+    parser.add_argument("-j", "--jobs", default=1, type=int, help="Number of concurrent jobs to run, 0 to use all available processors.\n(default: %(default)s)")
     parser.add_argument("-k", "--linker", default=None, help="Try to use given linker executable as opposed to autodetect.")
     parser.add_argument("-l", "--library", default=[], action="append", help="Add a library to be linked against.")
+    parser.add_argument("--library-header", default=[], action="append", help="Header declaring functions of a library in form 'library:header', used to generate definitions\nfor symbols not known to dnload. May be specified multiple times.")
     parser.add_argument("-L", "--library-directory", default=[], action="append", help="Add a library directory to be searched for libraries when linking.")
     parser.add_argument("-m", "--method", default="maximum", choices=("vanilla", "dlfcn", "hash", "maximum"), help="Method to use for decreasing output file size:\n\tvanilla:\n\t\tProduce binary normally, use no tricks except unpack header.\n\tdlfcn:\n\t\tUse dlopen/dlsym to decrease size without dependencies to any specific object format.\n\thash:\n\t\tUse knowledge of object file format to perform 'import by hash' loading, but do not break any specifications.\n\tmaximum:\n\t\tUse all available techniques to decrease output file size. Resulting file may violate object file specification.\n(default: %(default)s)")
     parser.add_argument("--march", type=str, help="When compiling code, use given architecture as opposed to autodetect.")
     parser.add_argument("--nice-exit", action="store_true", help="Do not use debugger trap, exit with proper system call.")
     parser.add_argument("--nice-filedump", action="store_true", help="Do not use dirty tricks in compression header, also remove filedumped binary when done.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use or update the build stage cache.")
+    parser.add_argument("--no-dead-code", action="store_true", help="Do not remove code and data not reachable from the entry point from generated assembler code.")
+    parser.add_argument("--no-direct-link", action="store_true", help="Always link the final binary with the linker as opposed to writing the ELF image directly.\nOnly affects 'maximum' method.")
+    parser.add_argument("--no-peephole", action="store_true", help="Do not apply peephole size optimizations to generated assembler code.")
     parser.add_argument("--merge-headers", default="auto", choices=("yes", "no", "auto"), help="ELF header merging policy:\n\tno:\n\t\tHeaders concatenated sequentially.\n\tyes:\n\t\tTry to interleave headers to decrease file size.\n\tauto:\n\t\tUse interleaving if target platform allows.\n(default: %(default)s)")
     parser.add_argument("--glsl-mode", default="full", choices=("none", "nosquash", "full"), help="GLSL crunching mode.\n\tnone:\n\t\tJust remove whitespace.\n\tnosquash:\n\t\tRefrain from squashing statements together, otherwise same as full.\n\tfull:\n\t\tTry to minimize file size by any means necessary.\n(default: %(default)s)")
     parser.add_argument("--glsl-inlines", default=-1, type=int, help="Maximum number of inline operations to do for GLSL.\n(default: unlimited)")
     parser.add_argument("--glsl-renames", default=-1, type=int, help="Maximum number of rename operations to do for GLSL.\n(default: unlimited)")
     parser.add_argument("--glsl-simplifys", default=-1, type=int, help="Maximum number of simplify operations to do for GLSL.\n(default: unlimited)")
+    parser.add_argument("--glsl-preprocessor", default="internal", choices=("internal", "external"), help="Preprocessor to use for GLSL sources:\n\tinternal:\n\t\tPreprocess in-process.\n\texternal:\n\t\tUse the same preprocessor executable as for C/C++ sources.\n(default: %(default)s)")
     parser.add_argument("--linux", action="store_true", help="Try to target Linux if not in Linux. Equal to '-O linux'.")
     parser.add_argument("-o", "--output-file", default=[], nargs="*", help="Name of output file to generate\nIf the name specified features a path, it will be used verbatim. Otherwise the binary will be created in the same path as source file(s) compiled.\nIf only processing GLSL files, this parameter can be specified multiple times, but must be specified exactly once per input GLSL file.")
     parser.add_argument("-O", "--operating-system", help="Try to target given operating system insofar cross-compilation is possible.")
@@ -1151,6 +1191,11 @@ def main():
     parser.add_argument("--preprocessor", default=None, help="Try to use given preprocessor executable as opposed to autodetect.")
     parser.add_argument("--rand", default="bsd", choices=("bsd", "gnu", "auto"), help="rand() implementation to use.\n\tbsd: FreeBSD libc\n\tgnu: GNU glibc\n\tauto: Autodetect based on compiling platform.\n(default: %(default)s)")
     parser.add_argument("--rpath", default=[], action="append", help="Extra rpath locations for linking.")
+    parser.add_argument("--search", action="store_true", help="Build all combinations of hash function, header merging, symtab, filedrop and unpack header options left for autodetection concurrently, keep the smallest output.\nCombinations are only required to build unless '--search-run' is specified.")
+    parser.add_argument("--search-run", action="store_true", help="When searching option combinations, run each binary built and only accept binaries that exit cleanly,\nexit through debugger trap or are still running after %i seconds." % (SEARCH_RUN_TIMEOUT))
+    parser.add_argument("--search-section-order", action="store_true", help="Search order of sections in the output for the smallest compressed size, assembling and\nlinking candidate orders concurrently. Only affects 'maximum' method.")
+    parser.add_argument("--search-symbol-order", action="store_true", help="Search order of symbols and libraries in the symbol table for the smallest output, building\ncandidate orders concurrently.")
+    parser.add_argument("--symbol-order", default=None, help="Comma-separated order of symbols in the symbol table, symbols not listed follow in default\norder. Symbols are kept grouped by library in dlfcn mode.")
     parser.add_argument("--symtab-mode", default="auto", choices=("auto", "safe", "unsafe"), help="Method for scouring DT_SYMTAB:\n\tsafe:\n\t\tMake less assumptions about header layout.\n\tunsafe:\n\t\tAssume optimal header layout to decrease code size.\n\tauto:\n\t\tTry to autodetect based on target platform.\n(default: %(default)s)")
     parser.add_argument("-s", "--search-path", default=[], action="append", help="Directory to search for the header file to generate. May be specified multiple times. If not given, searches paths of source files to compile. If not given and no source files to compile, current path will be used.")
     parser.add_argument("-S", "--strip-binary", default=None, help="Try to use given strip executable as opposed to autodetect.")
@@ -1187,6 +1232,12 @@ def main():
     glsl_mode = args.glsl_mode
     include_directories += args.include_directory
     libraries = args.library
+    library_headers = {}
+    for ii in args.library_header:
+        (library, separator, header) = ii.partition(":")
+        if not (library and separator and header):
+            raise RuntimeError("invalid library header '%s', expected 'library:header'" % (ii))
+        library_headers[library] = library_headers.get(library, []) + [header]
     library_directories += args.library_directory
     linker = args.linker
     nice_filedump = args.nice_filedump
@@ -1203,6 +1254,26 @@ def main():
     if args.verbose:
         set_verbose(True)
 
+    # Concurrency.
+    set_job_count(args.jobs)
+
+    # Final link.
+    if args.no_direct_link:
+        set_direct_link(False)
+
+    # Build stage cache.
+    if not args.no_cache:
+        try:
+            set_cache(Cache(args.cache_dir))
+        except OSError:
+            print("WARNING: cache directory '%s' not usable, not caching" % (args.cache_dir))
+
+    # Search for best build options, variants are built by separate dnload processes.
+    if args.search:
+        return search_build_options(parser, args, args.temporary_directory)
+    if args.search_symbol_order:
+        return search_symbol_order(parser, args, args.temporary_directory)
+
     # Definitions.
     if args.nice_exit:
         definitions += ["DNLOAD_NO_DEBUGGER_TRAP"]
@@ -1281,6 +1352,10 @@ def main():
     preprocessor = Preprocessor(executable_find(preprocessor, preprocessor_list, "preprocessor"))
     preprocessor.set_definitions(definitions)
     preprocessor.set_include_dirs(include_directories)
+    if "external" == args.glsl_preprocessor:
+        glsl_preprocessor = preprocessor
+    else:
+        glsl_preprocessor = GlslPreprocessor(definitions, include_directories)
 
     # Process GLSL source if given.
     if source_files_glsl:
@@ -1290,7 +1365,7 @@ def main():
             raise RuntimeError("specified output files '%s' must match input glsl files '%s'" % (str(output_file_list), str(source_files_glsl)))
         if output_file_list:
             source_files_glsl = zip(source_files_glsl, output_file_list)
-        glsl_db = generate_glsl(source_files_glsl, preprocessor, definition_ld, glsl_mode, None, glsl_inlines, glsl_renames, glsl_simplifys)
+        glsl_db = generate_glsl(source_files_glsl, glsl_preprocessor, definition_ld, glsl_mode, None, glsl_inlines, glsl_renames, glsl_simplifys)
         if output_file_list:
             glsl_db.write()
         else:
@@ -1403,11 +1478,15 @@ def main():
         definitions += ["DNLOAD_NO_FIXED_R_DEBUG_ADDRESS"]
 
     # Select hash function.
+    hash_function_auto = False
     if compilation_mode in ("hash", "maximum"):
         if args.hash_function == "auto":
             args.hash_function = "sdbm"
+            hash_function_auto = True
             if is_verbose():
                 print("Autodetected hash function: '%s'" % (args.hash_function))
+        elif (args.hash_function == "search") and args.preprocess_only:
+            raise RuntimeError("cannot search hash function without libraries to link against")
         if args.hash_function == "crc32":
             if osarch_is_ia32() or osarch_is_amd64():
                 extra_compiler_flags += ["-msse4.2"]
@@ -1466,14 +1545,32 @@ def main():
                     print("Using character frequency data: " + str(freqs))
             except FileNotFoundError:
                 freqs = {}
-            glsl_blobs += generate_glsl_extract(ii, preprocessor, definition_ld, glsl_mode, freqs, glsl_inlines, glsl_renames, glsl_simplifys)
+            glsl_blobs += generate_glsl_extract(ii, glsl_preprocessor, definition_ld, glsl_mode, freqs, glsl_inlines, glsl_renames, glsl_simplifys)
     # Search symbols from source files.
     symbols = set()
-    for ii in source_files:
-        source = preprocessor.preprocess(ii)
-        source_symbols = extract_symbol_names(source, symbol_prefix)
-        symbols = symbols.union(source_symbols)
-    symbols = find_symbols(symbols)
+    for ii in parallel_map(preprocess_symbol_names, [preprocessor] * len(source_files), source_files, [symbol_prefix] * len(source_files)):
+        symbols = symbols.union(ii)
+    # Generate definitions for symbols not known to dnload from shared objects and headers.
+    unknown_symbols = [ii for ii in sorted(symbols) if not g_library_definitions.find_symbol(ii)]
+    if unknown_symbols:
+        preprocessor.set_library_directories(library_directories)
+        database = generate_definition_database(unknown_symbols, libraries, library_headers, preprocessor)
+        g_library_definitions.set_definition_database(database)
+    symbols = find_symbols(sorted(symbols))
+    # Some libraries cannot co-exist, but have some symbols with identical names.
+    symbols = replace_conflicting_library(symbols, "SDL", "SDL2")
+    # Verify import by hash against the libraries to link against, hash function may need to change.
+    if (not args.preprocess_only) and (compilation_mode in ("hash", "maximum")):
+        real_symbols = list(filter(lambda x: not x.is_verbatim(), symbols))
+        libraries = collect_libraries(libraries, extra_libraries, real_symbols, compilation_mode)
+        if args.hash_function == "search":
+            hash_function = search_hash_function(real_symbols, libraries, linker)
+        else:
+            hash_function = select_hash_function(args.hash_function, hash_function_auto, real_symbols, libraries, linker)
+        if hash_function != args.hash_function:
+            args.hash_function = hash_function
+            if (get_symbol_hash(hash_function).get_name() == "crc32") and (osarch_is_ia32() or osarch_is_amd64()):
+                compiler.add_extra_compiler_flags("-msse4.2")
     if "dlfcn" == compilation_mode:
         symbols = sorted(symbols)
     elif "maximum" == compilation_mode:
@@ -1483,8 +1580,8 @@ def main():
         symbols = []
         for ii in sorted(sortable_symbols):
             symbols += [ii[1]]
-    # Some libraries cannot co-exist, but have some symbols with identical names.
-    symbols = replace_conflicting_library(symbols, "SDL", "SDL2")
+    if args.symbol_order:
+        symbols = order_symbols(symbols, args.symbol_order.split(","), "dlfcn" == compilation_mode)
     # Header includes.
     subst = {}
     if symbols_has_library(symbols, "c"):
@@ -1509,6 +1606,9 @@ def main():
         subst["INCLUDE_SDL"] = g_template_include_sdl.format()
     if symbols_has_library(symbols, "sndfile"):
         subst["INCLUDE_SNDFILE"] = g_template_include_sndfile.format()
+    include_generated = generate_include_generated(symbols, subst)
+    if include_generated:
+        subst["INCLUDE_GENERATED"] = include_generated
     # Workarounds for specific symbol implementations - must be done before symbol definitions.
     if symbols_has_symbol(symbols, "rand"):
         subst["INCLUDE_RAND"] = generate_include_rand(args.rand, target_search_path, definition_ld)
@@ -1594,7 +1694,9 @@ def main():
             print("Using output file '%s' after source file '%s'." % (output_file, source_file))
 
     source_file = source_files[0]
-    libraries = collect_libraries(libraries, extra_libraries, real_symbols, compilation_mode)
+    # Libraries have already been collected for import by hash.
+    if compilation_mode not in ("hash", "maximum"):
+        libraries = collect_libraries(libraries, extra_libraries, real_symbols, compilation_mode)
     compiler.generate_compiler_flags()
     compiler.generate_linker_flags()
     compiler.set_libraries(libraries)
@@ -1607,14 +1709,16 @@ def main():
     if "maximum" == compilation_mode:
         objcopy = executable_find(objcopy, default_objcopy_list, "objcopy")
         generate_binary_minimal(source_file, compiler, assembler, linker, objcopy, elfling, libraries, output_file,
-                                source_files_additional, interp_needed, args.merge_headers)
+                                source_files_additional, interp_needed, args.merge_headers, not args.no_peephole,
+                                not args.no_dead_code, compression, args.function_order, args.search_section_order)
         # Now have complete binary, may need to reprocess.
         if elfling:
             output_file_stripped = generate_temporary_filename(output_file + ".stripped")
             output_file_extracted = generate_temporary_filename(output_file + ".extracted")
             elfling.compress(output_file_stripped, output_file_extracted)
             generate_binary_minimal(None, compiler, assembler, linker, objcopy, elfling, libraries, output_file,
-                                    source_files_additional, interp_needed, args.merge_headers)
+                                    source_files_additional, interp_needed, args.merge_headers, not args.no_peephole,
+                                    not args.no_dead_code, compression, args.function_order, args.search_section_order)
     elif "hash" == compilation_mode:
         output_file_s = generate_temporary_filename(output_file + ".S")
         output_file_final_s = generate_temporary_filename(output_file + ".final.S")
@@ -1641,7 +1745,7 @@ def main():
     if compilation_mode in ("vanilla", "dlfcn", "hash"):
         strip = executable_find(strip, default_strip_list, "strip")
         shutil.copy(output_file_unprocessed, output_file_stripped)
-        run_command([strip, "-K", ".bss", "-K", ".text", "-K", ".data", "-R", ".comment", "-R", ".eh_frame", "-R", ".eh_frame_hdr", "-R", ".fini", "-R", ".gnu.hash", "-R", ".gnu.version", "-R", ".jcr", "-R", ".note", "-R", ".note.ABI-tag", "-R", ".note.tag", output_file_stripped])
+        run_command_cached([strip, "-K", ".bss", "-K", ".text", "-K", ".data", "-R", ".comment", "-R", ".eh_frame", "-R", ".eh_frame_hdr", "-R", ".fini", "-R", ".gnu.hash", "-R", ".gnu.version", "-R", ".jcr", "-R", ".note", "-R", ".note.ABI-tag", "-R", ".note.tag", output_file_stripped], [output_file_stripped], [output_file_stripped])
 
     # If GLSL blobs exist, generate frequency analysis of the output while disregarding the blobs.
     if glsl_blobs:
@@ -1,8 +1,10 @@
 import os
 
+from dnload.cache import run_command_cached
+from dnload.cache import tool_digest
 from dnload.common import is_listing
+from dnload.common import is_verbose
 from dnload.common import listify
-from dnload.common import run_command
 
 ########################################
 # Assembler ############################
@@ -41,7 +43,7 @@ class Assembler:
     def assemble(self, src, dst):
         """Assemble a file."""
         cmd = [self.__executable, src, "-o", dst] + self.__assembler_flags_extra
-        (so, se) = run_command(cmd)
+        (so, se) = run_command_cached(cmd, [src], [dst])
         if 0 < len(se) and is_verbose():
             print(se)
 
@@ -109,3 +111,7 @@ class Assembler:
         else:
             ret += ".globl %s\n%s:\n" % (op, op)
         return ret
+
+    def generate_key_parts(self):
+        """Generate listing of strings identifying assembler output for cache keys."""
+        return [tool_digest(self.__executable)] + self.__assembler_flags_extra
@@ -1,8 +1,10 @@
 import re
 
+from dnload.assembler_line import AssemblerLine
 from dnload.assembler_section import AssemblerSection
 from dnload.assembler_section_alignment import is_assembler_section_alignment
 from dnload.assembler_section_bss import AssemblerSectionBss
+from dnload.assembler_section_bss import is_assembler_section_bss
 from dnload.common import human_readable_bytes
 from dnload.common import is_verbose
 from dnload.common import listify
@@ -30,23 +32,19 @@ class AssemblerFile:
         lines = fd.readlines()
         fd.close()
         current_section = AssemblerSection("text")
-        sectionre = re.compile(r'^\s*\.section\s+\"?\.([a-zA-Z0-9_]+)[\.\s]')
-        directivere = re.compile(r'^\s*\.(bss|data|rodata|text)')
         discarded_sections = []
         for ii in lines:
-            # Try both expressions first.
-            match = sectionre.match(ii)
-            if not match:
-                match = directivere.match(ii)
-            # If match, start new section.
-            if match:
+            line = AssemblerLine(ii.rstrip("\n"))
+            section_name = get_section_name(line)
+            # If section changes, start new section.
+            if section_name:
                 if is_valid_section(current_section):
                     self.add_sections(current_section)
                 else:
                     discarded_sections += [current_section]
-                current_section = AssemblerSection(match.group(1), ii)
+                current_section = AssemblerSection(section_name, ii)
             else:
-                current_section.add_content(ii)
+                current_section.add_content(line)
         if not current_section.empty():
             if is_valid_section(current_section):
                 self.add_sections(current_section)
@@ -59,21 +57,29 @@ class AssemblerFile:
                 section_names = list(map(lambda x: x.get_name(), discarded_sections))
                 print("%i discarded sections in '%s': %s" % (len(discarded_sections), fname, section_names))
 
-    def crunch(self):
-        """Crunch sections, potentially removing dead code."""
+    def crunch(self, peephole=True):
+        """Crunch sections, potentially removing dead code. Peephole rewrites are applied if requested."""
+        stats = {}
         for ii in self.__sections:
             ii.crunch()
+            if not peephole:
+                continue
+            for (name, (count, saved)) in ii.crunch_peephole().items():
+                (total_count, total_saved) = stats.get(name, (0, 0))
+                stats[name] = (total_count + count, total_saved + saved)
+        if is_verbose() and stats:
+            for name in sorted(stats.keys()):
+                print("Peephole rule '%s': %i rewrites, %i bytes saved" % (name, stats[name][0], stats[name][1]))
+            print("Peephole rules saved %i bytes in total" % (sum([ii[1] for ii in stats.values()])))
+        return stats
 
     def generate_fake_bss(self, assembler, und_symbols=None, elfling=None):
         """Remove local labels that would seem to generate .bss, make a fake .bss section."""
         bss = AssemblerSectionBss()
         for ii in self.__sections:
-            while True:
-                entry = ii.extract_bss(und_symbols)
-                if not entry:
-                    break
-                if not entry.is_und_symbol():
-                    bss.add_element(entry)
+            for jj in ii.extract_bss(und_symbols):
+                if not jj.is_und_symbol():
+                    bss.add_element(jj)
         if elfling:
             bss.add_element(AssemblerBssElement(ELFLING_WORK, elfling.get_work_size()))
         bss_size = bss.get_size()
@@ -104,6 +110,22 @@ class AssemblerFile:
                 ret += ii.generate_file_output()
         return ret
 
+    def generate_fixed_output(self):
+        """Generate output of sections that cannot be reordered."""
+        reorderable = self.get_reorderable_sections()
+        return "".join([ii.generate_file_output() for ii in self.__sections if ii not in reorderable])
+
+    def get_reorderable_sections(self):
+        """Get sections that can be reordered, fake .bss and alignment sections must stay in place after them."""
+        return [ii for ii in self.__sections if not (is_assembler_section_alignment(ii) or is_assembler_section_bss(ii))]
+
+    def get_section_index(self):
+        """Get sections indexed by name, sections with the same name are listed in order."""
+        ret = {}
+        for ii in self.__sections:
+            ret.setdefault(ii.get_name(), []).append(ii)
+        return ret
+
     def getSectionAlignment(self):
         """Accessor."""
         for ii in self.__sections:
@@ -118,7 +140,7 @@ class AssemblerFile:
     def hasEntryPoint(self):
         """Tell if entry point exists somewhere within this file."""
         for ii in self.__sections:
-            if ii.want_entry_point():
+            if ii.want_entry_point() is not None:
                 return True
         return False
 
@@ -128,7 +150,7 @@ class AssemblerFile:
         labels = []
         # Gather global names that cannot be renamed.
         for ii in other.__sections:
-            globls = globls.union(ii.gather_globals())
+            globls |= ii.gather_globals()
         # Gather all labels.
         for ii in other.__sections:
             if jump_point_name:
@@ -141,26 +163,24 @@ class AssemblerFile:
             raise RuntimeError("incorporating '%s': jump point not defined but entry point exists" % (str(other)))
         # Suffix all labels with given label to prevent generated code name clashes.
         if label_name:
-            labels.sort(key=len, reverse=True)
+            renames = {}
+            for ii in labels:
+                renames[ii] = ii + label_name
             for ii in other.__sections:
-                ii.replace_labels(labels, label_name)
+                ii.replace_labels(renames)
         self.add_sections(other.__sections)
 
+    def reorder_sections(self, op):
+        """Reorder sections, given reorderable sections in new order. Other sections follow in their current order."""
+        self.__sections = list(op) + [ii for ii in self.__sections if ii not in op]
+
     def sort_sections(self, assembler, data_in_front=True):
         """Sort sections into an order that is more easily compressible."""
-        text_sections = []
-        rodata_sections = []
-        data_sections = []
-        other_sections = []
-        for ii in self.__sections:
-            if "text" == ii.get_name():
-                text_sections += [ii]
-            elif "rodata" == ii.get_name():
-                rodata_sections += [ii]
-            elif "data" == ii.get_name():
-                data_sections += [ii]
-            else:
-                other_sections += [ii]
+        index = self.get_section_index()
+        text_sections = index.pop("text", [])
+        rodata_sections = index.pop("rodata", [])
+        data_sections = index.pop("data", [])
+        other_sections = [ii for ii in self.__sections if ii.get_name() in index]
         text_section_str = []
         rodata_section_str = []
         data_section_str = []
@@ -183,6 +203,17 @@ class AssemblerFile:
         if is_verbose():
             print("Sorted sections: " + ", ".join(filter(lambda x: x, section_str)))
 
+    def split_functions(self):
+        """Split code sections into sections containing one function each so functions can be reordered."""
+        reorderable = self.get_reorderable_sections()
+        sections = []
+        for ii in self.__sections:
+            if ("text" == ii.get_name()) and (ii in reorderable):
+                sections += ii.split_functions()
+            else:
+                sections += [ii]
+        self.__sections = sections
+
     def remove_rodata(self):
         """Remove .rodata sections by merging them into the previous/next .text section."""
         new_sections = []
@@ -208,6 +239,48 @@ class AssemblerFile:
             new_sections[0].replace_content(rodata_section)
         self.__sections = new_sections
 
+    def remove_unreachable(self, roots):
+        """Remove code and data not reachable from given root symbols. Returns listing of removed symbol names.
+
+        Only blocks of code and data sections may be removed. Blocks that define nothing and all other sections are
+        always reachable."""
+        reorderable = self.get_reorderable_sections()
+        blocks = []
+        definitions = {}
+        queue = list(listify(roots))
+        for ii in self.__sections:
+            if (ii not in reorderable) or (ii.get_name() not in ("bss", "data", "rodata", "text")):
+                queue += ii.gather_identifiers()
+                continue
+            for (first, last, defined, referenced) in ii.gather_blocks():
+                if not defined:
+                    queue += list(referenced)
+                for jj in defined:
+                    definitions[jj] = len(blocks)
+                blocks += [(ii, first, last, defined, referenced)]
+        reachable = set()
+        while queue:
+            idx = definitions.get(queue.pop())
+            if (idx is not None) and (idx not in reachable):
+                reachable.add(idx)
+                queue += list(blocks[idx][4])
+        ret = []
+        for ii in self.__sections:
+            erased = []
+            for (jj, block) in enumerate(blocks):
+                if (block[0] is not ii) or (not block[3]) or (jj in reachable):
+                    continue
+                names = sorted(block[3])
+                if is_verbose():
+                    print("Removing unreachable '%s' from %s: %i lines" % (", ".join(names), ii.get_name(),
+                                                                           block[2] - block[1]))
+                erased += [(block[1], block[2])]
+                ret += names
+            ii.erase_blocks(erased)
+        if is_verbose() and ret:
+            print("Removed %i unreachable symbol(s)" % (len(ret)))
+        return ret
+
     def write(self, op, assembler, section_names=None):
         """Write an output assembler file or append to an existing file."""
         output = self.generate_file_output(section_names)
@@ -233,6 +306,18 @@ class AssemblerFile:
 # Functions ############################
 ########################################
 
+def get_section_name(op):
+    """Get name of section started by given line, return None if line does not start a section."""
+    if op.is_directive("section"):
+        match = re.match(r'\"?\.([a-zA-Z0-9_]+)([\.\s]|$)', op.get_operands())
+        if match:
+            return match.group(1)
+    elif op.is_directive():
+        match = re.match(r'(bss|data|rodata|text)', op.get_name())
+        if match:
+            return match.group(1)
+    return None
+
 def is_valid_section(op):
     """Tells if a section is valid and contributes to the binary."""
     return not (op.get_name() == "note")
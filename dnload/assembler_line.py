@@ -0,0 +1,123 @@
+import re
+
+from dnload.common import listify
+
+########################################
+# Globals ##############################
+########################################
+
+# Comment, label, directive and instruction lines.
+g_comment_re = re.compile(r'^\s*[#;]')
+g_label_re = re.compile(r'^\s*([^\s:"#;]+):')
+g_statement_re = re.compile(r'^\s*(\S+)\s*(.*?)\s*$')
+
+# Identifiers in operands, string literals are matched separately to skip them.
+g_identifier_re = re.compile(r'("(?:[^"\\]|\\.)*")|(?<![\w@%])([A-Za-z_\.][\w\.\$]*)')
+
+########################################
+# AssemblerLine ########################
+########################################
+
+class AssemblerLine:
+    """One parsed line of assembler source.
+
+    Line kind, name and operands are parsed once on construction. Original text is preserved for output."""
+
+    def __init__(self, text):
+        """Constructor."""
+        self.__text = text
+        self.__kind = "empty"
+        self.__name = None
+        self.__operands = ""
+        if g_comment_re.match(text):
+            self.__kind = "comment"
+            return
+        match = g_label_re.match(text)
+        if match:
+            self.__kind = "label"
+            self.__name = match.group(1)
+            return
+        match = g_statement_re.match(text)
+        if not match:
+            return
+        if match.group(1).startswith("."):
+            self.__kind = "directive"
+            self.__name = match.group(1)[1:].lower()
+        else:
+            self.__kind = "instruction"
+            self.__name = match.group(1).lower()
+        self.__operands = match.group(2)
+
+    def get_identifiers(self):
+        """Get identifiers in operands, string literals are skipped."""
+        return [ii.group(2) for ii in g_identifier_re.finditer(self.__operands) if ii.group(2)]
+
+    def get_indent(self):
+        """Get leading whitespace."""
+        return self.__text[:len(self.__text) - len(self.__text.lstrip())]
+
+    def get_kind(self):
+        """Accessor."""
+        return self.__kind
+
+    def get_name(self):
+        """Get label name, directive name without the dot or instruction mnemonic. Names other than labels are in
+        lowercase."""
+        return self.__name
+
+    def get_operand_list(self):
+        """Get operands split at commas."""
+        if not self.__operands:
+            return []
+        return [ii.strip() for ii in self.__operands.split(",")]
+
+    def get_operands(self):
+        """Accessor."""
+        return self.__operands
+
+    def get_text(self):
+        """Accessor."""
+        return self.__text
+
+    def is_comment(self):
+        """Tell if this is a comment line."""
+        return "comment" == self.__kind
+
+    def is_directive(self, op=None):
+        """Tell if this is a directive, optionally one of given names."""
+        return ("directive" == self.__kind) and ((op is None) or (self.__name in listify(op)))
+
+    def is_instruction(self, op=None):
+        """Tell if this is an instruction, optionally one of given mnemonics."""
+        return ("instruction" == self.__kind) and ((op is None) or (self.__name in listify(op)))
+
+    def is_label(self, op=None):
+        """Tell if this is a label, optionally one of given names."""
+        return ("label" == self.__kind) and ((op is None) or (self.__name in listify(op)))
+
+    def rename(self, op):
+        """Rename identifiers according to given mapping. Returns a new line or this line if nothing changed."""
+        changed = [False]
+
+        def replace(match):
+            identifier = match.group(2)
+            if identifier and (identifier in op):
+                changed[0] = True
+                return op[identifier]
+            return match.group(0)
+        text = g_identifier_re.sub(replace, self.__text)
+        if not changed[0]:
+            return self
+        return AssemblerLine(text)
+
+    def __str__(self):
+        """String representation."""
+        return self.__text
+
+########################################
+# Functions ############################
+########################################
+
+def parse_assembler_lines(op):
+    """Parse assembler source into a listing of lines."""
+    return [AssemblerLine(ii) for ii in op.strip("\n").split("\n")]
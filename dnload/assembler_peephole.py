@@ -0,0 +1,222 @@
+import re
+
+from dnload.assembler_line import AssemblerLine
+from dnload.platform_var import osarch_is_amd64
+from dnload.platform_var import osarch_is_ia32
+
+########################################
+# Globals ##############################
+########################################
+
+# 32-bit halves of 64-bit registers. Stack pointer is never rewritten.
+REGISTERS_64_TO_32 = {
+    "rax": "eax", "rbx": "ebx", "rcx": "ecx", "rdx": "edx", "rsi": "esi", "rdi": "edi", "rbp": "ebp", "r8": "r8d",
+    "r9": "r9d", "r10": "r10d", "r11": "r11d", "r12": "r12d", "r13": "r13d", "r14": "r14d", "r15": "r15d",
+    }
+
+# Directives that do not emit anything executed between instructions.
+PEEPHOLE_NEUTRAL_DIRECTIVES = ("align", "balign", "loc", "p2align")
+
+# Instructions that read flags, given without condition codes or operand size suffixes.
+PEEPHOLE_FLAGS_READ = ("adc", "cmov", "dec", "fcmov", "inc", "j", "lahf", "pushf", "rcl", "rcr", "sbb", "set")
+
+# Instructions that overwrite all flags used by conditional instructions without reading them.
+PEEPHOLE_FLAGS_WRITE = ("add", "and", "cmp", "comisd", "comiss", "neg", "or", "sub", "test", "ucomisd", "ucomiss",
+                        "xor")
+
+# Instructions that neither read nor write flags, given as prefixes.
+PEEPHOLE_FLAGS_NONE = ("bswap", "cltd", "cltq", "cqto", "cvt", "cwtl", "lea", "mov", "nop", "not", "pop", "push",
+                       "xchg")
+
+########################################
+# Functions ############################
+########################################
+
+def are_flags_dead(lst, idx):
+    """Tell if flags written at given line index are never read.
+
+    Scans forward until flags are overwritten or control leaves the function through a call or return, after which the
+    ABI does not preserve flags. Labels, jumps and anything not known cause flags to be considered live."""
+    for ii in range(idx + 1, len(lst)):
+        line = lst[ii]
+        if line.is_comment() or ("empty" == line.get_kind()):
+            continue
+        if line.is_directive():
+            if line.get_name().startswith("cfi_") or line.is_directive(PEEPHOLE_NEUTRAL_DIRECTIVES):
+                continue
+            return False
+        if not line.is_instruction():
+            return False
+        name = line.get_name()
+        if name.startswith("call") or name.startswith("ret"):
+            return True
+        if name.startswith("jmp"):
+            return False
+        if [jj for jj in PEEPHOLE_FLAGS_READ if name.startswith(jj)]:
+            return False
+        if strip_size_suffix(name) in PEEPHOLE_FLAGS_WRITE:
+            return True
+        # SSE arithmetic does not touch flags.
+        if re.match(r'[a-z]+(ss|sd|ps|pd)$', name) or name.startswith("pxor"):
+            continue
+        if [jj for jj in PEEPHOLE_FLAGS_NONE if name.startswith(jj)] and (not name.startswith("popf")):
+            continue
+        return False
+    return False
+
+def get_register_size(op):
+    """Get size of encoding a general-purpose register, 1 if an extended register requiring a REX prefix."""
+    return 1 if re.match(r'r\d+', op) else 0
+
+def is_general_register(op):
+    """Tell if given register name is a 32-bit or 64-bit general-purpose register other than the stack pointer."""
+    return (op in REGISTERS_64_TO_32) or (op in REGISTERS_64_TO_32.values())
+
+def parse_immediate(op):
+    """Parse an immediate operand, return None if not a numeric immediate."""
+    if not op.startswith("$"):
+        return None
+    try:
+        return int(op[1:], 0)
+    except ValueError:
+        return None
+
+def parse_register_immediate(op):
+    """Parse (immediate, register) operands of a line, return (None, None) if not in that form."""
+    operands = op.get_operand_list()
+    if (2 != len(operands)) or (not operands[1].startswith("%")):
+        return (None, None)
+    value = parse_immediate(operands[0])
+    if value is None:
+        return (None, None)
+    return (value, operands[1][1:].lower())
+
+def peephole_cmp_zero_test(lst, idx, uses_red_zone):
+    """Rewrite comparison of a register against zero into a test of register against itself.
+
+    Both leave all flags read by conditional instructions in the same state."""
+    line = lst[idx]
+    if not line.is_instruction(("cmpl", "cmpq")):
+        return None
+    operands = line.get_operand_list()
+    if (2 != len(operands)) or (0 != parse_immediate(operands[0])) or (not operands[1].startswith("%")):
+        return None
+    register = operands[1][1:]
+    if not is_general_register(register):
+        return None
+    text = "%s%s\t%%%s, %%%s" % (line.get_indent(), "test" + line.get_name()[3:], register, register)
+    return ([AssemblerLine(text)], 1)
+
+def peephole_mov_zero_extend(lst, idx, uses_red_zone):
+    """Rewrite 64-bit moves of small non-negative immediates into 32-bit moves that zero the upper half."""
+    line = lst[idx]
+    if (not osarch_is_amd64()) or (not line.is_instruction(("movabsq", "movq"))):
+        return None
+    (value, register) = parse_register_immediate(line)
+    if (value is None) or (register not in REGISTERS_64_TO_32) or (0 > value) or (0xFFFFFFFF < value):
+        return None
+    if ("movq" == line.get_name()) and (0x7FFFFFFF < value):
+        return None
+    original_size = 10 if ("movabsq" == line.get_name()) else 7
+    text = "%smovl\t$%s, %%%s" % (line.get_indent(), line.get_operand_list()[0][1:], REGISTERS_64_TO_32[register])
+    return ([AssemblerLine(text)], original_size - 5 - get_register_size(register))
+
+def peephole_mov_zero_xor(lst, idx, uses_red_zone):
+    """Rewrite moving zero into a register into exclusive or of the register with itself if flags are dead."""
+    line = lst[idx]
+    if not line.is_instruction(("movl", "movq")):
+        return None
+    (value, register) = parse_register_immediate(line)
+    if (0 != value) or (not is_general_register(register)) or (not are_flags_dead(lst, idx)):
+        return None
+    if "movq" == line.get_name():
+        if register not in REGISTERS_64_TO_32:
+            return None
+        register = REGISTERS_64_TO_32[register]
+        original_size = 7
+    else:
+        original_size = 5 + get_register_size(register)
+    text = "%sxorl\t%%%s, %%%s" % (line.get_indent(), register, register)
+    return ([AssemblerLine(text)], original_size - 2 - get_register_size(register))
+
+def peephole_optimize(lst):
+    """Apply peephole rules to a listing of lines.
+
+    First matching rule is applied to each line. Returns tuple of new listing and dictionary from rule name to
+    (rewrite count, bytes saved)."""
+    if not (osarch_is_amd64() or osarch_is_ia32()):
+        return (lst, {})
+    uses_red_zone = False
+    if osarch_is_amd64():
+        for ii in lst:
+            if ii.is_instruction() and re.search(r'-\d+\(%(rsp|rbp)[,\)]', ii.get_operands()):
+                uses_red_zone = True
+                break
+    ret = []
+    stats = {}
+    for ii in range(len(lst)):
+        replaced = None
+        for (name, function) in g_peephole_rules:
+            replaced = function(lst, ii, uses_red_zone)
+            if replaced:
+                (count, saved) = stats.get(name, (0, 0))
+                stats[name] = (count + 1, saved + replaced[1])
+                ret += replaced[0]
+                break
+        if not replaced:
+            ret += [lst[ii]]
+    return (ret, stats)
+
+def peephole_push_pop_immediate(lst, idx, uses_red_zone):
+    """Rewrite moving a small immediate into a register into pushing the immediate and popping it into the register.
+
+    Push writes below the stack pointer, so on amd64 the rule is not applied if the red zone may be in use."""
+    line = lst[idx]
+    if osarch_is_amd64():
+        if uses_red_zone or (not line.is_instruction(("movl", "movq"))):
+            return None
+        (value, register) = parse_register_immediate(line)
+        if value is None:
+            return None
+        # Push sign-extends to 64 bits, 32-bit moves zero-extend.
+        if "movl" == line.get_name():
+            register64 = [ii for ii in REGISTERS_64_TO_32 if REGISTERS_64_TO_32[ii] == register]
+            if (not register64) or (0 > value) or (127 < value):
+                return None
+            original_size = 5 + get_register_size(register)
+            register = register64[0]
+        else:
+            if (register not in REGISTERS_64_TO_32) or (-128 > value) or (127 < value):
+                return None
+            original_size = 7
+        push = "pushq"
+        pop = "popq"
+    elif osarch_is_ia32():
+        if not line.is_instruction("movl"):
+            return None
+        (value, register) = parse_register_immediate(line)
+        if (value is None) or (not is_general_register(register)) or ("esp" == register) or (-128 > value) or \
+                (127 < value):
+            return None
+        original_size = 5
+        push = "pushl"
+        pop = "popl"
+    else:
+        return None
+    indent = line.get_indent()
+    lines = [AssemblerLine("%s%s\t$%i" % (indent, push, value)), AssemblerLine("%s%s\t%%%s" % (indent, pop, register))]
+    return (lines, original_size - 3 - get_register_size(register))
+
+def strip_size_suffix(op):
+    """Remove AT&T operand size suffix from a mnemonic if it has one."""
+    if (op[-1:] in ("b", "w", "l", "q")) and (op[:-1] in PEEPHOLE_FLAGS_WRITE):
+        return op[:-1]
+    return op
+
+# Peephole rules in order of preference, rewrites saving the most bytes first.
+g_peephole_rules = (
+    ("mov-zero-xor", peephole_mov_zero_xor),
+    ("push-pop-immediate", peephole_push_pop_immediate),
+    ("mov-zero-extend", peephole_mov_zero_extend),
+    ("cmp-zero-test", peephole_cmp_zero_test),
+    )
@@ -1,6 +1,9 @@
 import re
 
 from dnload.assembler_bss_element import AssemblerBssElement
+from dnload.assembler_line import AssemblerLine
+from dnload.assembler_line import parse_assembler_lines
+from dnload.assembler_peephole import peephole_optimize
 from dnload.common import is_verbose
 from dnload.elfling import ELFLING_UNCOMPRESSED
 from dnload.platform_var import g_osarch
@@ -16,22 +19,29 @@ from dnload.platform_var import PlatformVar
 ########################################
 
 class AssemblerSection:
-    """Section in an existing assembler source file."""
+    """Section in an existing assembler source file.
+
+    Content is kept as parsed lines with a lazily built label index, crunching passes operate on the parsed lines."""
 
     def __init__(self, section_name, section_tag=None):
         """Constructor."""
         self.__name = section_name
         self.__tag = section_tag
         self.__content = []
+        self.__labels = None
 
     def add_content(self, line):
         """Add one or more lines of content."""
-        for ii in line.strip("\n").split("\n"):
-            self.__content += [ii + "\n"]
+        if isinstance(line, AssemblerLine):
+            self.__content += [line]
+        else:
+            self.__content += parse_assembler_lines(line)
+        self.__labels = None
 
     def clear_content(self):
         """Clear all content."""
         self.__content = []
+        self.__labels = None
 
     def crunch(self):
         """Remove all offending content."""
@@ -47,26 +57,26 @@ class AssemblerSection:
         """Replace all .align declarations with minimal byte alignment."""
         desired = int(PlatformVar("align"))
         adjustments = []
-        for ii in range(len(self.__content)):
-            line = self.__content[ii]
-            match = re.match(r'(\s*)\.align\s+(\d+).*', line, re.I)
+        for (ii, line) in enumerate(self.__content):
+            if not line.is_directive("align"):
+                continue
+            match = re.match(r'(\d+)', line.get_operands())
             if not match:
                 continue
             # Compiler thinking aligning to less than desired platform alignment is probably ok.
-            align = get_align_bytes(int(match.group(2)))
+            align = get_align_bytes(int(match.group(1)))
             if align <= desired:
                 continue
             # Some alignment directives are necessary due to data access.
             if not can_minimize_align(align):
                 continue
-            self.__content[ii] = "%s.balign %i\n" % (match.group(1), desired)
+            self.__content[ii] = AssemblerLine("%s.balign %i" % (line.get_indent(), desired))
             adjustments += ["%i -> %i" % (align, desired)]
         # Data sections may be reshuffled and require minimal align as first line.
         if self.__name in ["data", "rodata"]:
-            match = re.match(r'(\s*)\.b?align\s.*', self.__content[0], re.I)
-            if not match:
-                first_align = "\t.balign %i\n" % (int(PlatformVar("align")))
-                self.__content.insert(0, first_align)
+            if (not self.__content) or (not self.__content[0].is_directive(("align", "balign"))):
+                self.__content.insert(0, AssemblerLine("\t.balign %i" % (int(PlatformVar("align")))))
+                self.__labels = None
         if is_verbose() and adjustments:
             print("Alignment adjustment(%s): %s" % (self.get_name(), ", ".join(adjustments)))
 
@@ -75,37 +85,35 @@ class AssemblerSection:
         self.crunch_entry_push("_start")
         self.crunch_entry_push(ELFLING_UNCOMPRESSED)
         self.crunch_jump_pop(ELFLING_UNCOMPRESSED)
-        lst = self.want_line(r'\s*(int\s+\$(0x3|0x80)|syscall)\s+.*')
-        if lst:
-            ii = lst[0] + 1
-            jj = ii
-            while True:
-                if (jj >= len(self.__content)) or (not can_erase_footer(self.__content[jj])):
-                    if is_verbose():
-                        print("Erasing function footer after '%s': %i lines" % (lst[1], jj - ii))
-                    self.erase(ii, jj)
-                    break
+        for (ii, line) in enumerate(self.__content):
+            if not is_exit_line(line):
+                continue
+            jj = ii + 1
+            while (jj < len(self.__content)) and can_erase_footer(self.__content[jj]):
                 jj += 1
+            if is_verbose():
+                print("Erasing function footer after '%s': %i lines" % (line.get_text().strip(), jj - ii - 1))
+            self.erase(ii + 1, jj)
+            break
 
     def crunch_entry_push(self, op):
         """Crunch amd64/ia32 push directives from given line listing."""
-        lst = self.want_label(op)
-        if not lst:
+        idx = self.want_label(op)
+        if idx is None:
             return
-        ii = lst[0] + 1
+        ii = idx + 1
         jj = ii
         stack_decrement = 0
         reinstated_lines = []
         while True:
             current_line = self.__content[jj]
-            match = re.match(r'\s*(push\w).*%(\w+)', current_line, re.IGNORECASE)
-            if match:
-                stack_decrement += get_push_size(match.group(1))
+            if current_line.is_instruction() and re.match(r'push\w', current_line.get_name()) and \
+                    ("%" in current_line.get_operands()):
+                stack_decrement += get_push_size(current_line.get_name()[:5])
                 jj += 1
                 continue
             # Preserve comment lines as they are.
-            match = re.match(r'^\s*[#;].*', current_line, re.IGNORECASE)
-            if match:
+            if current_line.is_comment():
                 reinstated_lines += [current_line]
                 jj += 1
                 continue
@@ -115,85 +123,56 @@ class AssemblerSection:
                 jj += 1
                 continue
             # Stop at stack decrement.
-            match = re.match(r'\s*sub.*\s+[^\d]*(\d+),\s*%(rsp|esp)', current_line, re.IGNORECASE)
-            if match:
+            decrement = get_stack_decrement(current_line)
+            if decrement is not None:
                 # Align to 16 bytes if necessary.
                 if osname_is_linux() and osarch_is_64_bit():
                     if osarch_is_amd64():
                         # Just ignore increment, there's probably enough stack.
-                        self.__content[jj] = re.sub(r'subq(\s*).*', r'andq\g<1>$0xFFFFFFFFFFFFFFF0, %rsp', current_line)
+                        text = re.sub(r'subq(\s*).*', r'andq\g<1>$0xFFFFFFFFFFFFFFF0, %rsp', current_line.get_text())
                     else:
                         raise RuntimeError("no stack alignment instruction for current architecture")
                 else:
-                    total_decrement = int(match.group(1)) + stack_decrement
-                    self.__content[jj] = re.sub(r'\d+', str(total_decrement), current_line)
+                    text = re.sub(r'\d+', str(decrement + stack_decrement), current_line.get_text())
+                self.__content[jj] = AssemblerLine(text)
                 break
             # Do nothing if suspicious instruction is found.
             if is_verbose():
-                print("Unknown header instruction found, aborting erase: '%s'" % (current_line.strip()))
+                print("Unknown header instruction found, aborting erase: '%s'" % (current_line.get_text().strip()))
             break
         if is_verbose():
             print("Erasing function header from '%s': %i lines" % (op, jj - ii - len(reinstated_lines)))
         self.__content[ii:jj] = reinstated_lines
+        self.__labels = None
 
     def crunch_jump_pop(self, op):
         """Crunch popping before a jump."""
-        lst = self.want_line(r'\s*(jmp\s+%s)\s+.*' % (op))
-        if not lst:
+        for (ii, line) in enumerate(self.__content):
+            if (not line.is_instruction("jmp")) or (line.get_operands() != op):
+                continue
+            jj = ii - 1
+            while (0 <= jj) and self.__content[jj].is_instruction() and re.match(r'pop\S', self.__content[jj].get_name()):
+                jj -= 1
+            if is_verbose():
+                print("Erasing function footer before jump to '%s': %i lines" % (op, ii - jj - 1))
+            self.erase(jj + 1, ii)
             return
-        ii = lst[0]
-        jj = ii - 1
-        while True:
-            if (0 > jj) or not re.match(r'\s*(pop\S).*', self.__content[jj], re.IGNORECASE):
-                if is_verbose():
-                    print("Erasing function footer before jump to '%s': %i lines" % (op, ii - jj - 1))
-                self.erase(jj + 1, ii)
-                break
-            jj -= 1
+
+    def crunch_peephole(self):
+        """Apply peephole rewrites, return dictionary from rule name to (rewrite count, bytes saved)."""
+        (self.__content, ret) = peephole_optimize(self.__content)
+        if ret:
+            self.__labels = None
+        return ret
 
     def crunch_redundant(self):
         """Remove lines that could potentially alter code generation, but are redundant."""
-        removed_lines = -1
-        while True:
-            removed_lines += 1
-            # lst = self.want_line(r'\s*\.file\s+(.*)')
-            # if lst:
-            #     self.erase(lst[0])
-            #     continue
-            # lst = self.want_line(r'\s*\.globl\s+(.*)')
-            # if lst:
-            #     self.erase(lst[0])
-            #     continue
-            # lst = self.want_line(r'\s*\.ident\s+(.*)')
-            # if lst:
-            #     self.erase(lst[0])
-            #     continue
-            # lst = self.want_line(r'\s*\.type\s+(.*)')
-            # if lst:
-            #     self.erase(lst[0])
-            #     continue
-            # lst = self.want_line(r'\s*\.size\s+(.*)')
-            # if lst:
-            #     self.erase(lst[0])
-            #    continue
-            lst = self.want_line(r'\s*\.section\s+(.*)')
-            if lst:
-                self.erase(lst[0])
-                continue
-            lst = self.want_line(r'\s*\.(bss)\s+')
-            if lst:
-                self.erase(lst[0])
-                continue
-            lst = self.want_line(r'\s*\.(data)\s+')
-            if lst:
-                self.erase(lst[0])
-                continue
-            lst = self.want_line(r'\s*\.(text)\s+')
-            if lst:
-                self.erase(lst[0])
-                continue
-            break
-        return removed_lines
+        content = [ii for ii in self.__content if not ii.is_directive(("section", "bss", "data", "text"))]
+        ret = len(self.__content) - len(content)
+        if ret:
+            self.__content = content
+            self.__labels = None
+        return ret
 
     def empty(self):
         """Tell if this section is empty."""
@@ -208,103 +187,201 @@ class AssemblerSection:
         if first > last:
             return
         self.__content[first:last] = []
+        self.__labels = None
+
+    def erase_blocks(self, op):
+        """Erase blocks given as listing of (first line, last line) tuples."""
+        erased = set()
+        for (first, last) in op:
+            erased.update(range(first, last))
+        if erased:
+            self.__content = [line for (ii, line) in enumerate(self.__content) if ii not in erased]
+            self.__labels = None
 
     def extract_bss(self, und_symbols):
-        """Extract a variable that should go to .bss section."""
-        # Test for relevant .bss element.
-        found = self.extract_bss_object()
-        if found:
-            return AssemblerBssElement(found[0], found[1], und_symbols)
-        found = self.extract_comm_object()
-        if found:
-            return AssemblerBssElement(found[0], found[1], und_symbols)
-        return None
+        """Extract all variables that should go to .bss section."""
+        ret = []
+        for ii in self.extract_bss_objects() + self.extract_comm_objects():
+            ret += [AssemblerBssElement(ii[0], ii[1], und_symbols)]
+        return ret
 
-    def extract_comm_object(self):
+    def extract_comm_objects(self):
         """.comm extract."""
-        idx = 0
-        while True:
-            lst = self.want_line(r'\s*\.local\s+(\S+).*', idx)
-            if not lst:
-                break
-            attempt = lst[0]
-            name = lst[1]
-            idx = attempt + 1
-            lst = self.want_line(r'\s*\.comm\s+%s\s*,(.*)' % (name), idx)
-            if not lst:
+        ret = []
+        comms = {}
+        for (ii, line) in enumerate(self.__content):
+            if line.is_directive("comm") and (1 < len(line.get_operand_list())):
+                comms.setdefault(line.get_operand_list()[0], []).append(ii)
+        erased = set()
+        last_erased = -1
+        for (ii, line) in enumerate(self.__content):
+            if (ii <= last_erased) or (not line.is_directive("local")) or (not line.get_operands()):
                 continue
-            size = lst[1]
-            match = re.match(r'\s*(\d+)\s*,\s*(\d+).*', size)
-            if match:
-                size = int(match.group(1))
-            else:
-                size = int(size)
-            self.erase(attempt, lst[0] + 1)
-            return (name, size)
-        return None
+            name = line.get_operands().split()[0]
+            found = [jj for jj in comms.get(name, []) if jj > ii]
+            if not found:
+                continue
+            size = int(self.__content[found[0]].get_operand_list()[1])
+            erased.update(range(ii, found[0] + 1))
+            last_erased = found[0]
+            ret += [(name, size)]
+        if erased:
+            self.__content = [line for (ii, line) in enumerate(self.__content) if ii not in erased]
+            self.__labels = None
+        return ret
 
-    def extract_bss_object(self):
+    def extract_bss_objects(self):
         """Extract .bss objects signified with .object."""
-        idx = 0
-        while True:
-            lst = self.want_line(r'\s*.type\s+(\S+),\s+[@%]object', idx)
-            if not lst:
-                break
-            first_line = lst[0]
-            name = lst[1]
-            idx = first_line + 1
-            lst = self.want_line(r'\s*(%s)\:' % (name), idx, 2)
-            if not lst:
+        ret = []
+        erased = set()
+        for (ii, line) in enumerate(self.__content):
+            if not line.is_directive("type"):
+                continue
+            operands = line.get_operand_list()
+            if (2 != len(operands)) or (operands[1] not in ("@object", "%object")):
+                continue
+            name = operands[0]
+            label = [jj for jj in range(ii + 1, min(ii + 3, len(self.__content))) if self.__content[jj].is_label(name)]
+            if not label:
                 continue
             # .space or .zero must be found, but must also immediately follow the label.
-            idx = lst[0] + 1
-            lst = self.want_line(r'\s*\.(?:space|zero)\s+(\d+)', idx, 2)
-            if (not lst) or (lst[0] != idx):
+            idx = label[0] + 1
+            if (idx >= len(self.__content)) or (not self.__content[idx].is_directive(("space", "zero"))):
+                continue
+            match = re.match(r'(\d+)', self.__content[idx].get_operands())
+            if not match:
                 continue
-            last_line = lst[0] + 1
-            bss_size = int(lst[1])
+            first_line = ii
             # Check if there's an additional label to remove.
-            lst = self.want_line(r'\s*\.(globl|local)\s+%s\s*' % name, first_line - 1, 1)
-            if lst:
-                first_line = lst[0]
-            # Erase and exit.
-            self.erase(first_line, last_line)
-            return (name, bss_size)
-        return None
+            if 0 < ii:
+                previous_line = self.__content[ii - 1]
+                if previous_line.is_directive(("globl", "local")) and (previous_line.get_operands() == name):
+                    first_line = ii - 1
+            erased.update(range(first_line, idx + 1))
+            ret += [(name, int(match.group(1)))]
+        if erased:
+            self.__content = [line for (ii, line) in enumerate(self.__content) if ii not in erased]
+            self.__labels = None
+        return ret
+
+    def gather_blocks(self):
+        """Gather blocks defining symbols, listing of (first line, last line, defined names, referenced names) tuples.
+
+        Code is split at function declarations, data also at labels and symbol assignments. Declaring directives are
+        part of the block they declare. Content before the first block forms a block that defines nothing. Symbols
+        assigned relative to the location counter, such as section anchors, may be used to access anything after
+        them, so blocks assigning them reference all blocks after them."""
+        code = ("text" == self.__name)
+        starts = []
+        content_end = 0
+        in_header = False
+        for (ii, line) in enumerate(self.__content):
+            comm = line.is_directive("comm")
+            data_start = line.is_directive("type") or line.is_label() or is_symbol_assignment_line(line)
+            if is_function_type_line(line) or comm or ((not code) and data_start):
+                if not in_header:
+                    jj = ii
+                    while (content_end < jj) and is_function_preamble_line(self.__content[jj - 1]):
+                        jj -= 1
+                    starts += [jj]
+                    in_header = True
+                if comm:
+                    in_header = False
+                    content_end = ii + 1
+            elif not (is_function_preamble_line(line) or line.is_directive("size") or ("empty" == line.get_kind())):
+                in_header = False
+                content_end = ii + 1
+        prefix = (not starts) or (0 < starts[0])
+        if prefix:
+            starts = [0] + starts
+        ret = []
+        anchored = []
+        for (first, last) in zip(starts, starts[1:] + [len(self.__content)]):
+            defined = set()
+            referenced = set()
+            for line in self.__content[first:last]:
+                if line.is_label():
+                    defined.add(line.get_name())
+                elif line.is_directive("comm") and line.get_operand_list():
+                    defined.add(line.get_operand_list()[0])
+                elif is_symbol_assignment_line(line):
+                    defined.add(line.get_operand_list()[0])
+                    referenced.update(line.get_identifiers())
+                    if "." in line.get_identifiers():
+                        anchored += [len(ret)]
+                elif not line.is_directive(("comm", "globl", "global", "hidden", "local", "size", "type")):
+                    referenced.update(line.get_identifiers())
+            # Content before the first declaration defines nothing so it is never removed.
+            if prefix and (0 == first):
+                defined = set()
+            ret += [(first, last, defined, referenced)]
+        for ii in anchored:
+            for jj in ret[ii + 1:]:
+                ret[ii][3].update(jj[2])
+        return [(first, last, defined, referenced - defined) for (first, last, defined, referenced) in ret]
+
+    def gather_calls(self):
+        """Gather names of direct call and jump targets in order of appearance."""
+        ret = []
+        for ii in self.__content:
+            if (not ii.is_instruction()) or (not re.match(r'(call|jmp)', ii.get_name())):
+                continue
+            match = re.match(r'([A-Za-z_\.][\w\.\$]*)(@PLT)?$', ii.get_operands())
+            if match:
+                ret += [match.group(1)]
+        return ret
 
     def gather_globals(self):
         """Gathers a list of .globl definitions."""
         ret = set()
         for ii in self.__content:
-            match = re.match(r'\s*\.globa?l\s+([\.\w]+).*', ii)
-            if match:
-                ret = ret.union(set([match.group(1)]))
+            if ii.is_directive(("global", "globl")):
+                match = re.match(r'([\.\w]+)', ii.get_operands())
+                if match:
+                    ret.add(match.group(1))
+        return ret
+
+    def gather_identifiers(self):
+        """Gather identifiers referenced anywhere in content."""
+        ret = []
+        for ii in self.__content:
+            ret += ii.get_identifiers()
         return ret
 
     def gather_labels(self, forbidden_labels=[]):
         """Gathers all labels, if forbidden labels are specified, they are excluded."""
         ret = []
-        for ii in self.__content:
-            match = re.match(r'((\.L|_ZL)[^:,\s\(]+)', ii)
-            if match:
-                label = match.group(1)
-                if not (label in forbidden_labels):
-                    ret += [label]
-            match = re.match(r'^([^\.:,\s\(]+):', ii)
-            if match:
-                label = match.group(1)
-                if not (label in forbidden_labels):
-                    ret += [label]
+        seen = set()
+        for (ii, name) in self.get_labels():
+            # Only labels at the start of line, local labels and labels not starting with a dot.
+            if self.__content[ii].get_indent() or (name in forbidden_labels) or (name in seen):
+                continue
+            if name.startswith(".L") or name.startswith("_ZL") or (not name.startswith(".")):
+                ret += [name]
+                seen.add(name)
         return ret
 
     def generate_file_output(self):
         """Generate output for writing to a file."""
-        ret = ""
+        ret = []
         if self.__tag:
-            ret += self.__tag
+            ret += [self.__tag]
         for ii in self.__content:
-            ret += ii
-        return ret
+            ret += [ii.get_text() + "\n"]
+        return "".join(ret)
+
+    def get_function_name(self):
+        """Get name of first function declared in this section, return None if there is none."""
+        for ii in self.__content:
+            if is_function_type_line(ii):
+                return ii.get_operand_list()[0]
+        return None
+
+    def get_labels(self):
+        """Get label index, listing of (line index, name) tuples in order."""
+        if self.__labels is None:
+            self.__labels = [(ii, line.get_name()) for (ii, line) in enumerate(self.__content) if line.is_label()]
+        return self.__labels
 
     def get_name(self):
         """Accessor."""
@@ -313,41 +390,60 @@ class AssemblerSection:
     def merge_content(self, other):
         """Merge content with another section."""
         self.__content += other.__content
+        self.__labels = None
 
     def replace_content(self, op):
         """Replace content of this section with content of given section."""
         self.__content = op.__content
+        self.__labels = None
 
     def replace_entry_point(self, op):
         """Replaces an entry point with given entry point name from this section, should it exist."""
-        lst = self.want_entry_point()
-        if lst:
-            self.__content[lst[0]] = "%s:\n" % op
-
-    def replace_labels(self, labels, append):
-        """Replace all labels."""
-        for ii in range(len(self.__content)):
-            src = self.__content[ii]
-            for jj in labels:
-                dst = src.replace(jj, jj + append)
-                if dst != src:
-                    self.__content[ii] = dst
-                    break
+        idx = self.want_entry_point()
+        if idx is not None:
+            self.__content[idx] = AssemblerLine("%s:" % op)
+            self.__labels = None
+
+    def replace_labels(self, renames):
+        """Replace all labels according to given mapping from old names to new names."""
+        self.__content = [ii.rename(renames) for ii in self.__content]
+        self.__labels = None
+
+    def split_functions(self):
+        """Split into sections containing one function each, return listing of sections.
+
+        Content before the first function forms a section of its own. Directives declaring a function are kept with
+        it."""
+        starts = []
+        for (ii, line) in enumerate(self.__content):
+            if not is_function_type_line(line):
+                continue
+            jj = ii
+            while (0 < jj) and ((not starts) or (starts[-1] < jj - 1)) and \
+                    is_function_preamble_line(self.__content[jj - 1]):
+                jj -= 1
+            starts += [jj]
+        if (not starts) or (starts == [0]):
+            return [self]
+        if 0 < starts[0]:
+            starts = [0] + starts
+        ret = []
+        for (first, last) in zip(starts, starts[1:] + [len(self.__content)]):
+            section = AssemblerSection(self.__name)
+            section.__content = self.__content[first:last]
+            ret += [section]
+        ret[0].__tag = self.__tag
+        return ret
 
     def want_entry_point(self):
         """Want a line matching the entry point function."""
         return self.want_label("_start")
 
     def want_label(self, op):
-        """Want a label from code."""
-        return self.want_line(r'\s*\S*(%s)\S*\:.*' % (op))
-
-    def want_line(self, op, first=0, count=0x7FFFFFFF):
-        """Want a line matching regex from object."""
-        for ii in range(first, min(len(self.__content), first + count)):
-            match = re.match(op, self.__content[ii], re.IGNORECASE)
-            if match:
-                return (ii, match.group(1))
+        """Want index of first label containing given name, return None if not found."""
+        for (ii, name) in self.get_labels():
+            if op in name:
+                return ii
         return None
 
     def __str__(self):
@@ -361,10 +457,10 @@ class AssemblerSection:
 def can_erase_footer(op):
     """Check if a line in footer can be erased."""
     # Label.
-    if re.match(r'\s*\S+\:\s*', op):
+    if op.is_label():
         return False
     # Local variable block for .bss.
-    if re.match(r'\s*\.(comm|local)\s+\S+', op, re.I):
+    if op.is_directive(("comm", "local")) and op.get_operands():
         return False
     # Accept everything else.
     return True
@@ -392,18 +488,53 @@ def get_push_size(op):
     else:
         raise RuntimeError("push size not known for instruction '%s'" % (ins))
 
+def get_stack_decrement(op):
+    """Get stack decrement of a stack pointer subtraction line, return None if not one."""
+    if (not op.is_instruction()) or (not op.get_name().startswith("sub")):
+        return None
+    operands = op.get_operand_list()
+    if (2 != len(operands)) or (operands[1].lower() not in ("%rsp", "%esp")):
+        return None
+    match = re.search(r'(\d+)', operands[0])
+    if not match:
+        return None
+    return int(match.group(1))
+
+def is_exit_line(op):
+    """Tell if line is a system call or trap ending the program."""
+    if op.is_instruction("syscall"):
+        return True
+    return op.is_instruction("int") and (op.get_operands().lower() in ("$0x3", "$0x80"))
+
+def is_function_preamble_line(op):
+    """Tell if line may precede a function type declaration as a part of declaring the function."""
+    return op.is_comment() or op.is_directive(("align", "balign", "globl", "global", "hidden", "local", "p2align"))
+
+def is_function_type_line(op):
+    """Tell if line declares type of a symbol as function."""
+    if not op.is_directive("type"):
+        return False
+    operands = op.get_operand_list()
+    return (2 == len(operands)) and (operands[1] in ("@function", "%function"))
+
 def is_reinstate_line(op):
     """Tell if line is one of the legal lines to exist within entry push."""
+    if not op.is_instruction():
+        return False
+    operands = op.get_operand_list()
     # Zeroing.
-    match = re.match(r'\s*xor.*\s+%(\S+)\s?,.*', op, re.IGNORECASE)
-    if match:
+    if op.get_name().startswith("xor") and (2 <= len(operands)) and operands[0].startswith("%"):
         return True
     # Moving labels (possibly with offsets) into registers.
-    match = re.match(r'\s*(lea|mov)\w\s+[\$]?[a-zA-Z_]\S+,\s+%\w+$', op, re.IGNORECASE)
-    if match:
+    if re.match(r'(lea|mov)\w$', op.get_name()) and (2 == len(operands)) and \
+            re.match(r'[\$]?[a-zA-Z_]\S+$', operands[0]) and re.match(r'%\w+$', operands[1]):
         return True
     return False
 
 def is_stack_save_register(op):
     """Tell if given register is used for saving the stack."""
     return op.lower() in ('rbp', 'ebp')
+
+def is_symbol_assignment_line(op):
+    """Tell if line assigns a value to a symbol."""
+    return op.is_directive(("equ", "equiv", "set")) and (0 < len(op.get_operand_list()))
@@ -53,3 +53,11 @@ class AssemblerSectionBss(AssemblerSection):
     def get_size(self):
         """Get total size."""
         return self.__size
+
+########################################
+# Functions ############################
+########################################
+
+def is_assembler_section_bss(op):
+    """Tell if given object is AssemblerSectionBss."""
+    return isinstance(op, AssemblerSectionBss)
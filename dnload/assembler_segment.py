@@ -148,9 +148,9 @@ class AssemblerSegment:
             ret += ii.generate_source(op, 1, self.__name)
         return ret
 
-    def merge(self, op):
-        """Attempt to merge with given segment."""
-        highest_mergable = 0
+    def get_merge_lengths(self, op):
+        """Get listing of byte counts the tail of this segment can be overlapped with head of given segment."""
+        ret = []
         (head_src, bytestream_src) = self.deconstruct_tail()
         (bytestream_dst, tail_dst) = op.deconstruct_head()
         for ii in range(min(len(bytestream_src), len(bytestream_dst))):
@@ -160,17 +160,34 @@ class AssemblerSegment:
                     mergable = False
                     break
             if mergable:
-                highest_mergable = ii + 1
-        if 0 >= highest_mergable:
+                ret += [ii + 1]
+        return ret
+
+    def get_name(self):
+        """Accessor."""
+        return self.__name
+
+    def merge(self, op, length=None):
+        """Attempt to merge with given segment, at given overlap in bytes or the highest possible overlap."""
+        lengths = self.get_merge_lengths(op)
+        if length is None:
+            length = max(lengths) if lengths else 0
+        if length not in lengths:
             return False
         if is_verbose():
-            print("Merging headers %s and %s at %i bytes." % (self.__name, op.__name, highest_mergable))
-        for ii in range(highest_mergable):
-            bytestream_src[-highest_mergable + ii].merge(bytestream_dst[ii])
-        bytestream_dst[0:highest_mergable] = []
+            print("Merging headers %s and %s at %i bytes." % (self.__name, op.__name, length))
+        self.merge_at(op, length)
+        return True
+
+    def merge_at(self, op, length):
+        """Merge with given segment at given overlap in bytes, the overlap must be valid."""
+        (head_src, bytestream_src) = self.deconstruct_tail()
+        (bytestream_dst, tail_dst) = op.deconstruct_head()
+        for ii in range(length):
+            bytestream_src[-length + ii].merge(bytestream_dst[ii])
+        bytestream_dst[0:length] = []
         self.reconstruct(head_src + bytestream_src)
         op.reconstruct(bytestream_dst + tail_dst)
-        return True
 
     def reconstruct(self, bytestream):
         """Reconstruct data from bytestream."""
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from dnload.common import human_readable_bytes
+from dnload.common import is_verbose
+from dnload.common import run_command
+
+########################################
+# Globals ##############################
+########################################
+
+CACHE_FORMAT = 1
+CACHE_SIZE_DEFAULT = 256 * 1024 * 1024
+
+# Fraction of size limit cache is evicted down to, so eviction is not needed again on next put.
+CACHE_EVICT_TARGET = 0.75
+
+g_cache = None
+g_file_digests = {}
+g_tool_digests = {}
+
+########################################
+# Cache ################################
+########################################
+
+class Cache:
+    """Persistent content-addressed cache for build stage outputs."""
+
+    def __init__(self, directory, max_size=CACHE_SIZE_DEFAULT):
+        """Constructor."""
+        self.__directory = os.path.normpath(directory)
+        self.__max_size = max_size
+        self.__size = None
+        os.makedirs(self.__directory, exist_ok=True)
+
+    def evict(self):
+        """Remove least recently used entries if cache exceeds its size limit. Updates known cache size."""
+        entries = []
+        total_size = 0
+        for ii in os.listdir(self.__directory):
+            bucket = os.path.join(self.__directory, ii)
+            if (2 != len(ii)) or (not os.path.isdir(bucket)):
+                continue
+            for jj in os.listdir(bucket):
+                entry_dir = os.path.join(bucket, jj)
+                try:
+                    used = os.path.getmtime(os.path.join(entry_dir, "entry.json"))
+                    size = sum(map(lambda x: os.path.getsize(os.path.join(entry_dir, x)), os.listdir(entry_dir)))
+                except OSError:
+                    continue
+                entries += [(used, size, entry_dir)]
+                total_size += size
+        self.__size = total_size
+        if total_size <= self.__max_size:
+            return
+        removed = 0
+        for (used, size, entry_dir) in sorted(entries):
+            shutil.rmtree(entry_dir, True)
+            total_size -= size
+            removed += 1
+            if total_size <= self.__max_size * CACHE_EVICT_TARGET:
+                break
+        self.__size = total_size
+        if is_verbose():
+            print("Evicted %i cache entries, cache size: %s" % (removed, human_readable_bytes(total_size)))
+
+    def get(self, key):
+        """Get entry for given key or None if not found or no longer valid."""
+        entry_dir = self.get_entry_directory(key)
+        entry_file = os.path.join(entry_dir, "entry.json")
+        try:
+            with open(entry_file, "r") as fd:
+                entry = json.load(fd)
+        except (OSError, ValueError):
+            return None
+        if entry.get("format") != CACHE_FORMAT:
+            return None
+        # Any dependency having changed invalidates the entry.
+        for (fname, digest) in entry["dependencies"].items():
+            if (not os.path.isfile(fname)) or (file_digest(fname) != digest):
+                return None
+        for ii in entry["blobs"]:
+            if not os.path.isfile(os.path.join(entry_dir, ii)):
+                return None
+        # Mark entry as recently used.
+        try:
+            os.utime(entry_file)
+        except OSError:
+            pass
+        entry["directory"] = entry_dir
+        return entry
+
+    def get_blob(self, entry, name):
+        """Read a data blob from a cache entry."""
+        with open(os.path.join(entry["directory"], name), "rb") as fd:
+            return fd.read()
+
+    def get_directory(self):
+        """Accessor."""
+        return self.__directory
+
+    def get_entry_directory(self, key):
+        """Get directory an entry with given key is stored in."""
+        return os.path.join(self.__directory, key[:2], key)
+
+    def put(self, key, blobs, metadata=None, dependencies=None):
+        """Store data blobs and metadata under given key."""
+        entry = {"format": CACHE_FORMAT, "blobs": sorted(blobs.keys()), "dependencies": {}, "metadata": metadata}
+        if dependencies:
+            for ii in dependencies:
+                entry["dependencies"][ii] = file_digest(ii)
+        entry_dir = self.get_entry_directory(key)
+        bucket = os.path.dirname(entry_dir)
+        os.makedirs(bucket, exist_ok=True)
+        # Write into a temporary directory first so concurrent builds never see partial entries.
+        staging_dir = tempfile.mkdtemp(prefix=".staging_", dir=bucket)
+        for (name, data) in blobs.items():
+            with open(os.path.join(staging_dir, name), "wb") as fd:
+                fd.write(data)
+        with open(os.path.join(staging_dir, "entry.json"), "w") as fd:
+            json.dump(entry, fd)
+        shutil.rmtree(entry_dir, True)
+        try:
+            os.rename(staging_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(staging_dir, True)
+        # Cache is only walked when the size known since last walk may exceed the limit.
+        size = sum([len(ii) for ii in blobs.values()])
+        if (self.__size is None) or (self.__size + size > self.__max_size):
+            self.evict()
+        else:
+            self.__size += size
+
+########################################
+# Functions ############################
+########################################
+
+def command_key(lst, inputs, outputs):
+    """Generate a cache key for a command, its tool and the contents of its input files."""
+    parts = ["command", tool_digest(lst[0])]
+    for ii in lst[1:]:
+        # Files modified in place are both inputs and outputs.
+        if (ii in outputs) or (ii in inputs):
+            if ii in outputs:
+                parts += ["output:%i" % (outputs.index(ii))]
+            if ii in inputs:
+                parts += ["input:%s" % (file_digest(ii))]
+        else:
+            parts += [ii]
+    return generate_key(parts)
+
+def file_digest(op):
+    """Get digest of file contents. Digests are memoized by file identity and modification time."""
+    st = os.stat(op)
+    identity = (os.path.realpath(op), st.st_size, st.st_mtime_ns)
+    if identity in g_file_digests:
+        return g_file_digests[identity]
+    hasher = hashlib.sha256()
+    with open(op, "rb") as fd:
+        while True:
+            data = fd.read(1 << 20)
+            if not data:
+                break
+            hasher.update(data)
+    ret = hasher.hexdigest()
+    g_file_digests[identity] = ret
+    return ret
+
+def generate_key(parts):
+    """Generate a cache key from a listing of strings or bytes."""
+    hasher = hashlib.sha256(("dnload-cache-%i" % (CACHE_FORMAT)).encode())
+    for ii in parts:
+        if not isinstance(ii, bytes):
+            ii = str(ii).encode()
+        hasher.update(b"%i:" % (len(ii)))
+        hasher.update(ii)
+    return hasher.hexdigest()
+
+def get_cache():
+    """Get global cache, may be None."""
+    return g_cache
+
+def read_dependency_file(op):
+    """Read a make-style dependency file, return listing of dependencies."""
+    with open(op, "r") as fd:
+        content = fd.read()
+    content = content.replace("\\\n", " ")
+    match = re.match(r'^[^:]*:(.*)$', content, re.DOTALL)
+    if not match:
+        return []
+    ret = []
+    for ii in re.findall(r'((?:\\ |\S)+)', match.group(1)):
+        fname = os.path.normpath(ii.replace("\\ ", " "))
+        if fname not in ret:
+            ret += [fname]
+    return ret
+
+def run_command_cached(lst, inputs=None, outputs=None, decode_output=True, track_dependencies=False):
+    """Run program identified by list of command line parameters, reusing cached outputs if possible.
+
+    Inputs and outputs are file names present in the command line. If dependency tracking is requested, the command
+    is expected to understand make-style '-MD -MF' dependency generation flags."""
+    inputs = inputs or []
+    outputs = outputs or []
+    cache = get_cache()
+    if not cache:
+        return run_command(lst, decode_output)
+    key = command_key(lst, inputs, outputs)
+    entry = cache.get(key)
+    if entry:
+        for ii in range(len(outputs)):
+            with open(outputs[ii], "wb") as fd:
+                fd.write(cache.get_blob(entry, "output_%i" % (ii)))
+        proc_stdout = cache.get_blob(entry, "stdout")
+        proc_stderr = cache.get_blob(entry, "stderr")
+        if is_verbose():
+            print("Using cached result: %s" % (" ".join(lst)))
+    else:
+        dependencies = []
+        if track_dependencies:
+            (fd, dependency_file) = tempfile.mkstemp(suffix=".d", prefix="dnload_")
+            os.close(fd)
+            try:
+                (proc_stdout, proc_stderr) = run_command(lst + ["-MD", "-MF", dependency_file], False)
+                dependencies = read_dependency_file(dependency_file)
+            finally:
+                os.remove(dependency_file)
+        else:
+            (proc_stdout, proc_stderr) = run_command(lst, False)
+        blobs = {"stdout": proc_stdout, "stderr": proc_stderr}
+        for ii in range(len(outputs)):
+            with open(outputs[ii], "rb") as fd:
+                blobs["output_%i" % (ii)] = fd.read()
+        # Inputs are already part of the key. Relative dependencies stay relative to the working directory so builds
+        # in different directories can share entries.
+        normalized_inputs = list(map(os.path.normpath, inputs))
+        dependencies = list(filter(lambda x: (x not in normalized_inputs) and os.path.isfile(x), dependencies))
+        cache.put(key, blobs, None, dependencies)
+    if decode_output:
+        proc_stdout = proc_stdout.decode()
+        proc_stderr = proc_stderr.decode()
+    return (proc_stdout, proc_stderr)
+
+def set_cache(op):
+    """Set global cache."""
+    global g_cache
+    g_cache = op
+
+def tool_digest(op):
+    """Get identity of an executable to be used in cache keys."""
+    if op in g_tool_digests:
+        return g_tool_digests[op]
+    fname = shutil.which(op)
+    if fname:
+        fname = os.path.realpath(fname)
+        st = os.stat(fname)
+        ret = "%s:%i:%i" % (fname, st.st_size, st.st_mtime_ns)
+    else:
+        ret = op
+    g_tool_digests[op] = ret
+    return ret
@@ -1,3 +1,5 @@
+import concurrent.futures
+import multiprocessing
 import os
 import re
 import subprocess
@@ -6,6 +8,7 @@ import subprocess
 # Globals ##############################
 ########################################
 
+g_jobs = 1
 g_temporary_directory = None
 g_verbose = False
 
@@ -93,6 +96,10 @@ def get_indent(op):
         ret += "  "
     return ret
 
+def get_job_count():
+    """Get number of concurrent jobs to use."""
+    return g_jobs
+
 def human_readable_bytes(op):
     """Create a human-readable byte count from an integer."""
     if 1073741824 < op:
@@ -180,6 +187,21 @@ def generate_temporary_filename(fname):
         return g_temporary_directory + "/" + os.path.basename(fname)
     return fname
 
+def parallel_map(func, *iterables):
+    """Map function over iterables using a process pool, results are returned in input order.
+
+    Function must be defined at module level. Worker processes are forked where possible so they inherit global
+    state such as verbosity, temporary directory and platform variables."""
+    lst = list(zip(*iterables))
+    jobs = min(get_job_count(), len(lst))
+    if 1 >= jobs:
+        return [func(*ii) for ii in lst]
+    context = None
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=context) as executor:
+        return list(executor.map(func, *zip(*lst)))
+
 def remove_blob(data, blob):
     """Removes a blob from a larger data blob."""
     data_len = len(data)
@@ -214,6 +236,13 @@ def run_command(lst, decode_output=True):
         raise RuntimeError("command failed: %i, stderr output:\n%s" % (proc.returncode, proc_stderr))
     return (proc_stdout, proc_stderr)
 
+def set_job_count(op):
+    """Set number of concurrent jobs to use, zero or less to use all available processors."""
+    global g_jobs
+    if 0 >= op:
+        op = os.cpu_count() or 1
+    g_jobs = op
+
 def set_temporary_directory(op):
     """Sets temporary directory."""
     global g_temporary_directory
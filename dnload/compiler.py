@@ -1,6 +1,7 @@
 import os
 import re
 
+from dnload.cache import run_command_cached
 from dnload.common import is_listing
 from dnload.common import is_verbose
 from dnload.common import run_command
@@ -39,7 +40,7 @@ class Compiler(Linker):
         cmd = [self.get_command(), "-S", src, "-o", dst] + self.__standard + self.__compiler_flags + self._compiler_flags_extra + self._definitions + self._include_directories
         if whole_program:
             cmd += self.__compiler_flags_generate_asm
-        (so, se) = run_command(cmd)
+        (so, se) = run_command_cached(cmd, [src], [dst], True, True)
         if 0 < len(se) and is_verbose():
             print(se)
 
@@ -0,0 +1,118 @@
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+from dnload.cache import generate_key
+from dnload.cache import get_cache
+from dnload.common import is_verbose
+from dnload.common import parallel_map
+
+########################################
+# Globals ##############################
+########################################
+
+COMPRESSION_SWEEP_VERSION = 1
+
+COMPRESSION_DEPTHS = (0, 16, 128, 512)
+COMPRESSION_MATCH_FINDERS = ("MF_BT2", "MF_BT3", "MF_BT4", "MF_HC3", "MF_HC4")
+COMPRESSION_NICE_LENGTHS = (32, 64, 128, 192, 273)
+
+# Default dictionary size of 'xzcat -F raw', raw streams must not need more.
+COMPRESSION_RAW_DICT_SIZE_MAX = 8 * 1024 * 1024
+
+########################################
+# Functions ############################
+########################################
+
+def compress_candidate(data, compression, options):
+    """Compress data with given encoder options, return compressed stream or None if it does not decode back."""
+    (fmt, filters, check) = generate_filters(compression, options, len(data))
+    try:
+        ret = lzma.compress(data, format=fmt, check=check, filters=filters)
+    except lzma.LZMAError:
+        return None
+    # Verify the decoder the unpack header uses would produce the original data.
+    if fmt == lzma.FORMAT_RAW:
+        decoded = lzma.decompress(ret, format=fmt, filters=[{"id": lzma.FILTER_LZMA2, "preset": 6}])
+    else:
+        decoded = lzma.decompress(ret, format=fmt)
+    if decoded != data:
+        return None
+    return ret
+
+def compress_data(data, compression):
+    """Compress data for given unpack header, sweeping encoder parameters for the smallest stream.
+
+    Returns None if in-process compression is not available."""
+    if not lzma:
+        return None
+    cache = get_cache()
+    key = generate_key(["compress", COMPRESSION_SWEEP_VERSION, compression, data])
+    if cache:
+        entry = cache.get(key)
+        if entry:
+            if is_verbose():
+                print("Using cached compression result: %i bytes" % (len(cache.get_blob(entry, "stream"))))
+            return cache.get_blob(entry, "stream")
+    # Sweep literal/position parameters first, then match finder parameters for the best of them.
+    reference = generate_reference_options(compression)
+    candidates = [reference]
+    for lc in range(5):
+        for lp in range(5 - lc):
+            for pb in range(5):
+                candidates += [dict(reference, lc=lc, lp=lp, pb=pb)]
+    best = select_smallest(data, compression, candidates)
+    candidates = []
+    for nice_len in COMPRESSION_NICE_LENGTHS:
+        for mf in COMPRESSION_MATCH_FINDERS:
+            for depth in COMPRESSION_DEPTHS:
+                candidates += [dict(best[0], nice_len=nice_len, mf=mf, depth=depth)]
+    best = min(best, select_smallest(data, compression, candidates), key=lambda x: len(x[1]))
+    if is_verbose():
+        print("Selected compression parameters: %s => %i bytes" % (str(best[0]), len(best[1])))
+    if cache:
+        cache.put(key, {"stream": best[1]})
+    return best[1]
+
+def generate_filters(compression, options, size):
+    """Generate lzma module format, filter chain and integrity check for given unpack header."""
+    # Dictionary does not need to be larger than the data, only the dictionary size field depends on it.
+    dict_size = 4096
+    while dict_size < size:
+        dict_size *= 2
+    filt = {"preset": 9 | lzma.PRESET_EXTREME if options.get("extreme") else 9, "dict_size": dict_size}
+    for ii in ("lc", "lp", "pb", "nice_len", "depth"):
+        if ii in options:
+            filt[ii] = options[ii]
+    if "mf" in options:
+        filt["mf"] = getattr(lzma, options["mf"])
+    if "lzma" == compression:
+        filt["id"] = lzma.FILTER_LZMA1
+        return (lzma.FORMAT_ALONE, [filt], -1)
+    filt["id"] = lzma.FILTER_LZMA2
+    if "raw" == compression:
+        filt["dict_size"] = min(dict_size, COMPRESSION_RAW_DICT_SIZE_MAX)
+        return (lzma.FORMAT_RAW, [filt], -1)
+    if "xz" == compression:
+        # Integrity check is not needed for decoding.
+        return (lzma.FORMAT_XZ, [filt], lzma.CHECK_NONE)
+    raise RuntimeError("unknown compression format '%s'" % (compression))
+
+def generate_reference_options(compression):
+    """Get encoder options equivalent to those previously passed to xz."""
+    if "raw" == compression:
+        return {"extreme": True}
+    return {"lc": 1, "lp": 0, "pb": 0, "nice_len": 273}
+
+def select_smallest(data, compression, candidates):
+    """Compress data with all candidate options in parallel, return smallest (options, stream) pair."""
+    results = parallel_map(compress_candidate, [data] * len(candidates), [compression] * len(candidates), candidates)
+    ret = None
+    # Ties are resolved by candidate order so the result is deterministic.
+    for (options, stream) in zip(candidates, results):
+        if stream and ((not ret) or (len(stream) < len(ret[1]))):
+            ret = (options, stream)
+    if not ret:
+        raise RuntimeError("no valid compression parameters for '%s'" % (compression))
+    return ret
@@ -0,0 +1,306 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from dnload.cache import generate_key
+from dnload.cache import get_cache
+from dnload.common import is_verbose
+from dnload.common import listify
+from dnload.elf_file import ElfFile
+from dnload.elf_file import SHN_UNDEF
+from dnload.elf_file import STB_GLOBAL
+from dnload.elf_file import STB_WEAK
+from dnload.elf_file import STT_FUNC
+from dnload.elf_file import STT_GNU_IFUNC
+from dnload.elf_file import STV_DEFAULT
+from dnload.library_hash_index import find_library_file
+from dnload.platform_var import PlatformVar
+
+########################################
+# Globals ##############################
+########################################
+
+# Version of generated definitions, increment when parsing changes to invalidate cached definitions.
+DEFINITION_DATABASE_VERSION = 1
+
+# Macros defined before including headers so extension functions get prototypes.
+DEFINITION_PROTOTYPE_MACROS = ("EGL_EGLEXT_PROTOTYPES", "GL_GLEXT_PROTOTYPES")
+
+# Words that are part of types, never parameter names.
+PARAMETER_TYPE_WORDS = ("_Bool", "char", "const", "double", "float", "int", "long", "restrict", "__restrict", "short",
+                        "signed", "unsigned", "void", "volatile")
+
+# Words that may precede a parameter name without being a type.
+PARAMETER_QUALIFIER_WORDS = ("const", "register", "restrict", "__restrict", "volatile")
+
+# Libraries searched for unknown symbols after explicitly linked libraries, in order.
+g_default_libraries = ("c", "m", PlatformVar("gl_library"), "GLU", "EGL", "SDL2", "SDL", "fftw3", "ncurses", "ogg",
+                       "opus", "opusfile", "png", "sndfile")
+
+# Headers declaring functions of libraries.
+g_library_headers = {
+    "c": ("stdio.h", "stdlib.h", "string.h", "unistd.h"),
+    "EGL": ("EGL/egl.h", "EGL/eglext.h"),
+    "fftw3": ("fftw3.h",),
+    "GL": ("GL/gl.h", "GL/glext.h"),
+    "GLESv2": ("GLES2/gl2.h", "GLES2/gl2ext.h"),
+    "GLU": ("GL/glu.h",),
+    "m": ("math.h",),
+    "ncurses": ("ncurses.h",),
+    "ogg": ("ogg/ogg.h",),
+    "opus": ("opus.h",),
+    "opusfile": ("opusfile.h",),
+    "png": ("png.h",),
+    "SDL": ("SDL.h",),
+    "SDL2": ("SDL.h",),
+    "sndfile": ("sndfile.h",),
+    }
+
+########################################
+# DefinitionDatabase ###################
+########################################
+
+class DefinitionDatabase:
+    """Function definitions generated from headers and exports of shared objects.
+
+    Functions of libraries added earlier take precedence."""
+
+    def __init__(self):
+        """Constructor."""
+        self.__symbols = {}
+
+    def add_library(self, name, headers, definitions):
+        """Add definitions of a library."""
+        for ii in sorted(definitions.keys()):
+            if ii not in self.__symbols:
+                self.__symbols[ii] = (name, headers, definitions[ii])
+
+    def find(self, op):
+        """Find (library name, headers, definition) of a function, return None if not found."""
+        return self.__symbols.get(op)
+
+    def __len__(self):
+        """Number of functions."""
+        return len(self.__symbols)
+
+########################################
+# Functions ############################
+########################################
+
+def generate_definition_database(names, libraries, headers, preprocessor):
+    """Generate definitions for given function names from libraries and headers.
+
+    Explicitly given libraries are searched first, then libraries known by default. Searching stops when all names
+    have been found. The preprocessor is also used to find shared objects of libraries."""
+    ret = DefinitionDatabase()
+    missing = set(names)
+    seen = set()
+    for ii in list(libraries) + [str(jj) for jj in g_default_libraries]:
+        if (not missing) or (ii in seen):
+            continue
+        seen.add(ii)
+        library_headers = headers.get(ii) or g_library_headers.get(ii)
+        if not library_headers:
+            if is_verbose():
+                print("No headers known for library '%s', not generating definitions." % (ii))
+            continue
+        fname = None
+        for jj in listify(preprocessor.get_library_name(ii)):
+            fname = find_library_file(jj, preprocessor.get_library_directories())
+            if fname:
+                break
+        if not fname:
+            continue
+        try:
+            definitions = get_library_definitions(fname, library_headers, preprocessor)
+        except RuntimeError as err:
+            if is_verbose():
+                print("Could not generate definitions for library '%s': %s" % (ii, str(err).strip()))
+            continue
+        ret.add_library(ii, library_headers, definitions)
+        missing -= set(definitions.keys())
+    if is_verbose():
+        print("Generated definitions for %i functions, missing: %s" % (len(ret), str(sorted(missing))))
+    return ret
+
+def get_library_definitions(op, headers, preprocessor):
+    """Get definitions of functions exported by a shared object and declared in headers.
+
+    Definitions are read from the cache if neither the shared object nor the preprocessed headers have changed."""
+    source = preprocess_headers(headers, preprocessor)
+    cache = get_cache()
+    if not cache:
+        return read_library_definitions(op, source)
+    st = os.stat(op)
+    key = generate_key(["library-definitions", DEFINITION_DATABASE_VERSION, os.path.realpath(op), st.st_dev, st.st_ino,
+                        st.st_mtime_ns, source])
+    entry = cache.get(key)
+    if entry:
+        data = json.loads(cache.get_blob(entry, "definitions").decode())
+        if DEFINITION_DATABASE_VERSION == data["version"]:
+            return data["definitions"]
+    ret = read_library_definitions(op, source)
+    data = {"version": DEFINITION_DATABASE_VERSION, "library": op, "headers": list(headers), "definitions": ret}
+    cache.put(key, {"definitions": json.dumps(data, sort_keys=True).encode()})
+    return ret
+
+def parse_declaration(op):
+    """Parse a function declaration into (return type, name, parameter, ...) listing, return None if not possible."""
+    op = " ".join(op.split())
+    op = re.sub(r'\[\[.*?\]\]', "", op)
+    op = remove_balanced(op, ("__attribute__", "__attribute", "__declspec"))
+    words = re.findall(r'[A-Za-z_]\w*', op)
+    # Skip non-declarations, definitions and functions renamed in assembler.
+    for ii in ("__asm", "__asm__", "asm", "inline", "__inline", "__inline__", "static", "typedef"):
+        if ii in words:
+            return None
+    if ("{" in op) or ("=" in op):
+        return None
+    op = re.sub(r'\b(extern|__extension__)\b', "", op).strip()
+    match = re.match(r'^([^()]*?[\s\*])([A-Za-z_]\w*)\s*\((.*)\)$', op)
+    if not match:
+        return None
+    returntype = match.group(1).strip()
+    name = match.group(2)
+    parameters = split_parameters(match.group(3))
+    if (not returntype) or (parameters is None):
+        return None
+    ret = [returntype, name]
+    if parameters != ["void"]:
+        ret += [strip_parameter_name(ii) for ii in parameters]
+    return ret
+
+def parse_declarations(source, names=None):
+    """Parse function declarations from preprocessed C source, return mapping from names to definitions.
+
+    If names are given, only declarations that may declare one of them are parsed."""
+    ret = {}
+    for ii in split_declarations(source):
+        if names and (not [jj for jj in re.findall(r'([A-Za-z_]\w*)\s*\(', ii) if jj in names]):
+            continue
+        definition = parse_declaration(ii)
+        if definition and (definition[1] not in ret):
+            ret[definition[1]] = definition
+    return ret
+
+def preprocess_headers(headers, preprocessor):
+    """Preprocess given headers, return output."""
+    directory = tempfile.mkdtemp(prefix="dnload_definitions_")
+    try:
+        fname = os.path.join(directory, "definitions.c")
+        with open(fname, "w") as fd:
+            for ii in DEFINITION_PROTOTYPE_MACROS:
+                fd.write("#define %s\n" % (ii))
+            for ii in headers:
+                fd.write("#include \"%s\"\n" % (ii))
+        return preprocessor.preprocess(fname)
+    finally:
+        shutil.rmtree(directory, True)
+
+def read_exported_functions(op):
+    """Read names of functions exported by a shared object."""
+    ret = set()
+    with ElfFile(op) as elf:
+        for ii in elf.get_dynamic_symbols():
+            if (SHN_UNDEF == ii["shndx"]) or (not ii["name"]) or (STV_DEFAULT != ii["visibility"]):
+                continue
+            if (ii["bind"] in (STB_GLOBAL, STB_WEAK)) and (ii["type"] in (STT_FUNC, STT_GNU_IFUNC)):
+                ret.add(ii["name"])
+    return ret
+
+def read_library_definitions(op, source):
+    """Read definitions of functions exported by a shared object from preprocessed source."""
+    exports = read_exported_functions(op)
+    ret = {}
+    for (name, definition) in parse_declarations(source, exports).items():
+        if name in exports:
+            ret[name] = definition
+    if is_verbose():
+        print("Generated %i definitions for '%s' from %i exported functions." % (len(ret), op, len(exports)))
+    return ret
+
+def remove_balanced(op, keywords):
+    """Remove keywords and the parenthesized expressions following them from source."""
+    ret = op
+    for ii in keywords:
+        while True:
+            match = re.search(r'\b%s\b\s*\(' % (ii), ret)
+            if not match:
+                break
+            depth = 0
+            end = len(ret)
+            for jj in range(match.end() - 1, len(ret)):
+                if "(" == ret[jj]:
+                    depth += 1
+                elif ")" == ret[jj]:
+                    depth -= 1
+                    if 0 >= depth:
+                        end = jj + 1
+                        break
+            ret = ret[:match.start()] + ret[end:]
+    return ret
+
+def split_declarations(source):
+    """Split preprocessed C source into top-level declarations, function bodies are skipped."""
+    # Skip line markers and other directives.
+    source = "\n".join([ii for ii in source.splitlines() if not ii.lstrip().startswith("#")])
+    ret = []
+    current = ""
+    depth = 0
+    for ii in re.finditer(r'[^{};]*[{};]?', source):
+        token = ii.group(0)
+        if not token:
+            continue
+        current += token
+        if token.endswith("{"):
+            depth += 1
+        elif token.endswith("}"):
+            depth -= 1
+            # Function definitions end at closing brace without a semicolon.
+            if 0 == depth:
+                head = current.split("{")[0].strip()
+                if head.endswith(")") and ("=" not in head):
+                    current = ""
+        elif token.endswith(";") and (0 == depth):
+            ret += [current[:-1]]
+            current = ""
+    return ret
+
+def split_parameters(op):
+    """Split parameter listing at top-level commas, return None if parentheses do not balance."""
+    ret = []
+    current = ""
+    depth = 0
+    for ii in op:
+        if ii in "([":
+            depth += 1
+        elif ii in ")]":
+            depth -= 1
+            if 0 > depth:
+                return None
+        elif ("," == ii) and (0 == depth):
+            ret += [current.strip()]
+            current = ""
+            continue
+        current += ii
+    if 0 != depth:
+        return None
+    if current.strip():
+        ret += [current.strip()]
+    return ret
+
+def strip_parameter_name(op):
+    """Remove name from a parameter declaration, leaving only the type."""
+    ret = re.sub(r'\(\s*\*\s*[A-Za-z_]\w*\s*\)', "(*)", op)
+    match = re.match(r'^(.*?[\s\*])([A-Za-z_]\w*)((\s*\[[^\]]*\])*)$', ret)
+    if not match:
+        return ret
+    name = match.group(2)
+    prefix_words = re.findall(r'[A-Za-z_]\w*', match.group(1))
+    if (name in PARAMETER_TYPE_WORDS) or (not prefix_words) or (prefix_words[-1] in ("enum", "struct", "union")):
+        return ret
+    if not [ii for ii in prefix_words if ii not in PARAMETER_QUALIFIER_WORDS]:
+        return ret
+    return (match.group(1).rstrip() + match.group(3)).strip()
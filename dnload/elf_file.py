@@ -0,0 +1,280 @@
+import mmap
+import struct
+
+########################################
+# Globals ##############################
+########################################
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_INTERP = 3
+
+DT_NULL = 0
+DT_NEEDED = 1
+
+PF_X = 1
+PF_W = 2
+PF_R = 4
+
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_RELA = 4
+SHT_DYNAMIC = 6
+SHT_NOBITS = 8
+SHT_REL = 9
+SHT_DYNSYM = 11
+SHT_GNU_HASH = 0x6ffffff6
+
+SHF_ALLOC = 2
+
+SHN_UNDEF = 0
+SHN_ABS = 0xfff1
+
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STB_WEAK = 2
+
+STV_DEFAULT = 0
+
+STT_FUNC = 2
+STT_SECTION = 3
+STT_GNU_IFUNC = 10
+
+EM_386 = 3
+EM_X86_64 = 62
+
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+########################################
+# ElfFile ##############################
+########################################
+
+class ElfFile:
+    """In-process reader for ELF32 and ELF64 files."""
+
+    def __init__(self, op):
+        """Constructor, reads given file or uses given file contents."""
+        self.__sections = None
+        if isinstance(op, bytes):
+            self.__filename = "<memory>"
+            self.__data = op
+        else:
+            self.__filename = op
+            with open(op, "rb") as fd:
+                try:
+                    self.__data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    self.__data = fd.read()
+        if (len(self.__data) < 16) or (self.__data[:4] != b"\x7fELF"):
+            raise RuntimeError("not an ELF file: '%s'" % (self.__filename))
+        self.__class = self.__data[4]
+        if ELFDATA2LSB == self.__data[5]:
+            self.__endian = "<"
+        elif ELFDATA2MSB == self.__data[5]:
+            self.__endian = ">"
+        else:
+            raise RuntimeError("unknown ELF data encoding in '%s': %i" % (self.__filename, self.__data[5]))
+        if ELFCLASS32 == self.__class:
+            ehdr = self.unpack("HHIIIIIHHHHHH", 16)
+        elif ELFCLASS64 == self.__class:
+            ehdr = self.unpack("HHIQQQIHHHHHH", 16)
+        else:
+            raise RuntimeError("unknown ELF class in '%s': %i" % (self.__filename, self.__class))
+        (self.__type, self.__machine, self.__version, self.__entry, self.__phoff, self.__shoff, self.__flags,
+         self.__ehsize, self.__phentsize, self.__phnum, self.__shentsize, self.__shnum, self.__shstrndx) = ehdr
+        self.__program_headers = self.read_program_headers()
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Exit context."""
+        self.close()
+
+    def close(self):
+        """Release the file mapping."""
+        if isinstance(self.__data, mmap.mmap):
+            self.__data.close()
+
+    def find_program_header(self, ptype, flags=0):
+        """Find first program header of given type that has at least given flags set."""
+        for ii in self.__program_headers:
+            if (ii["type"] == ptype) and ((ii["flags"] & flags) == flags):
+                return ii
+        return None
+
+    def get_dynamic_symbols(self):
+        """Get symbols in dynamic symbol table."""
+        return self.get_symbols(SHT_DYNSYM)
+
+    def get_entry(self):
+        """Accessor."""
+        return self.__entry
+
+    def get_machine(self):
+        """Accessor."""
+        return self.__machine
+
+    def get_needed(self):
+        """Get names of libraries required in dynamic sections, in order."""
+        ret = []
+        if self.is_64_bit():
+            fmt = "qQ"
+            entsize = 16
+        else:
+            fmt = "iI"
+            entsize = 8
+        sections = self.get_sections()
+        for ii in sections:
+            if SHT_DYNAMIC != ii["type"]:
+                continue
+            strtab = sections[ii["link"]]
+            for jj in range(ii["size"] // entsize):
+                (d_tag, d_val) = self.unpack(fmt, ii["offset"] + jj * entsize)
+                if DT_NULL == d_tag:
+                    break
+                if DT_NEEDED == d_tag:
+                    ret += [self.read_string(strtab["offset"] + d_val)]
+        return ret
+
+    def get_program_headers(self):
+        """Accessor."""
+        return self.__program_headers
+
+    def get_relocations(self):
+        """Get relocations from all relocation sections.
+
+        Addend is None for relocations without explicit addend."""
+        ret = []
+        for ii in self.get_sections():
+            if ii["type"] not in (SHT_REL, SHT_RELA):
+                continue
+            if self.is_64_bit():
+                fmt = "QQq" if (SHT_RELA == ii["type"]) else "QQ"
+            else:
+                fmt = "IIi" if (SHT_RELA == ii["type"]) else "II"
+            entsize = ii["entsize"] or struct.calcsize(fmt)
+            for jj in range(ii["size"] // entsize):
+                values = self.unpack(fmt, ii["offset"] + jj * entsize)
+                if self.is_64_bit():
+                    (symbol, rtype) = (values[1] >> 32, values[1] & 0xffffffff)
+                else:
+                    (symbol, rtype) = (values[1] >> 8, values[1] & 0xff)
+                ret += [{"section": ii["info"], "offset": values[0], "type": rtype, "symbol": symbol,
+                         "addend": values[2] if (2 < len(values)) else None}]
+        return ret
+
+    def get_section_data(self, op):
+        """Get contents of given section."""
+        if SHT_NOBITS == op["type"]:
+            return b"\0" * op["size"]
+        return bytes(self.__data[op["offset"]:op["offset"] + op["size"]])
+
+    def get_sections(self):
+        """Get section headers. Section headers are only read when first needed."""
+        if self.__sections is None:
+            self.__sections = self.read_sections()
+        return self.__sections
+
+    def get_symbols(self, section_type=None):
+        """Get symbols from all symbol tables, or only from symbol tables of given type."""
+        ret = []
+        sections = self.get_sections()
+        for ii in sections:
+            if section_type is None:
+                if ii["type"] not in (SHT_SYMTAB, SHT_DYNSYM):
+                    continue
+            elif ii["type"] != section_type:
+                continue
+            ret += self.read_symbols(ii, sections[ii["link"]])
+        return ret
+
+    def get_und_symbols(self):
+        """Get names of global undefined symbols with default visibility."""
+        ret = []
+        for ii in self.get_symbols():
+            if (SHN_UNDEF == ii["shndx"]) and (STB_GLOBAL == ii["bind"]) and (STV_DEFAULT == ii["visibility"]) and ii["name"]:
+                ret += [ii["name"]]
+        return ret
+
+    def is_64_bit(self):
+        """Tells if this is an ELF64 file."""
+        return ELFCLASS64 == self.__class
+
+    def read_program_headers(self):
+        """Read program headers."""
+        ret = []
+        for ii in range(self.__phnum):
+            offset = self.__phoff + ii * self.__phentsize
+            if self.is_64_bit():
+                (ptype, flags, poffset, vaddr, paddr, filesz, memsz, align) = self.unpack("IIQQQQQQ", offset)
+            else:
+                (ptype, poffset, vaddr, paddr, filesz, memsz, flags, align) = self.unpack("IIIIIIII", offset)
+            ret += [{"type": ptype, "flags": flags, "offset": poffset, "vaddr": vaddr, "paddr": paddr,
+                     "filesz": filesz, "memsz": memsz, "align": align}]
+        return ret
+
+    def read_sections(self):
+        """Read section headers."""
+        ret = []
+        if (not self.__shoff) or (not self.__shnum):
+            return ret
+        for ii in range(self.__shnum):
+            offset = self.__shoff + ii * self.__shentsize
+            if self.is_64_bit():
+                shdr = self.unpack("IIQQQQIIQQ", offset)
+            else:
+                shdr = self.unpack("IIIIIIIIII", offset)
+            ret += [{"name_offset": shdr[0], "type": shdr[1], "flags": shdr[2], "addr": shdr[3], "offset": shdr[4],
+                     "size": shdr[5], "link": shdr[6], "info": shdr[7], "addralign": shdr[8], "entsize": shdr[9]}]
+        # Resolve section names if section name string table exists.
+        if self.__shstrndx < len(ret):
+            shstrtab = ret[self.__shstrndx]
+            for ii in ret:
+                ii["name"] = self.read_string(shstrtab["offset"] + ii["name_offset"])
+        else:
+            for ii in ret:
+                ii["name"] = ""
+        return ret
+
+    def read_string(self, offset):
+        """Read a zero-terminated string."""
+        end = self.__data.find(b"\0", offset)
+        if 0 > end:
+            end = len(self.__data)
+        return self.__data[offset:end].decode("latin-1")
+
+    def read_symbols(self, section, strtab):
+        """Read symbols from given symbol table section."""
+        ret = []
+        if self.is_64_bit():
+            fmt = "IBBHQQ"
+            entsize = 24
+        else:
+            fmt = "IIIBBH"
+            entsize = 16
+        if section["entsize"]:
+            entsize = section["entsize"]
+        # First symbol is always the null symbol.
+        for ii in range(1, section["size"] // entsize):
+            values = self.unpack(fmt, section["offset"] + ii * entsize)
+            if self.is_64_bit():
+                (name, info, other, shndx, value, size) = values
+            else:
+                (name, value, size, info, other, shndx) = values
+            ret += [{"name": self.read_string(strtab["offset"] + name), "value": value, "size": size,
+                     "bind": info >> 4, "type": info & 0xf, "visibility": other & 0x3, "shndx": shndx, "index": ii}]
+        return ret
+
+    def unpack(self, fmt, offset):
+        """Unpack values from given offset using file endianness."""
+        return struct.unpack_from(self.__endian + fmt, self.__data, offset)
+
+    def __str__(self):
+        """String representation."""
+        return "ElfFile('%s', %i-bit, entry: 0x%x, %i program headers)" % (self.__filename, 64 if self.is_64_bit() else 32, self.__entry, len(self.__program_headers))
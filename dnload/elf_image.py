@@ -0,0 +1,167 @@
+import struct
+
+from dnload.common import is_verbose
+from dnload.elf_file import ElfFile
+from dnload.elf_file import EM_386
+from dnload.elf_file import EM_X86_64
+from dnload.elf_file import PF_R
+from dnload.elf_file import PF_W
+from dnload.elf_file import PF_X
+from dnload.elf_file import PT_LOAD
+from dnload.elf_file import SHF_ALLOC
+from dnload.elf_file import SHN_ABS
+from dnload.elf_file import SHT_NOBITS
+from dnload.elf_file import SHT_SYMTAB
+from dnload.platform_var import PlatformVar
+
+########################################
+# Globals ##############################
+########################################
+
+# Relocation types that can be resolved when writing the image, by machine. Each type is given as tuple of size in
+# bytes, whether relocation is relative to its own address and overflow check to use.
+RELOCATION_TYPES = {
+    EM_386: {
+        1: (4, False, None),  # R_386_32
+        2: (4, True, None),  # R_386_PC32
+        4: (4, True, None),  # R_386_PLT32
+        20: (2, False, "bitfield"),  # R_386_16
+        21: (2, True, "signed"),  # R_386_PC16
+        22: (1, False, "bitfield"),  # R_386_8
+        23: (1, True, "signed"),  # R_386_PC8
+        },
+    EM_X86_64: {
+        1: (8, False, None),  # R_X86_64_64
+        2: (4, True, "signed"),  # R_X86_64_PC32
+        4: (4, True, "signed"),  # R_X86_64_PLT32
+        10: (4, False, "unsigned"),  # R_X86_64_32
+        11: (4, False, "signed"),  # R_X86_64_32S
+        12: (2, False, "bitfield"),  # R_X86_64_16
+        13: (2, True, "signed"),  # R_X86_64_PC16
+        14: (1, False, "bitfield"),  # R_X86_64_8
+        15: (1, True, "signed"),  # R_X86_64_PC8
+        24: (8, True, None),  # R_X86_64_PC64
+        },
+    }
+
+# Struct formats for relocated fields by size.
+RELOCATION_FORMATS = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+# Write images directly as opposed to using the linker.
+g_direct_link = True
+
+########################################
+# Functions ############################
+########################################
+
+def apply_relocation(data, offset, size, value, overflow):
+    """Write relocated value into image data. Returns False if value does not fit into the field."""
+    bits = size * 8
+    if ("signed" == overflow) and (not (-(1 << (bits - 1)) <= value < (1 << (bits - 1)))):
+        return False
+    if ("unsigned" == overflow) and (not (0 <= value < (1 << bits))):
+        return False
+    if ("bitfield" == overflow) and (not (-(1 << (bits - 1)) <= value < (1 << bits))):
+        return False
+    struct.pack_into("<" + RELOCATION_FORMATS[size], data, offset, value & ((1 << bits) - 1))
+    return True
+
+def generate_elf_image(src, quiet=False):
+    """Generate binary image from an assembled object, as the linker would output it in binary format.
+
+    Only objects with all content in one section and relocations against symbols defined in that section can be
+    written. Returns None if the object cannot be written."""
+    with ElfFile(src) as elf:
+        types = RELOCATION_TYPES.get(elf.get_machine())
+        if types is None:
+            return reject_elf_image(src, "machine %i not supported" % (elf.get_machine()), quiet)
+        sections = elf.get_sections()
+        allocated = [ii for (ii, section) in enumerate(sections) if (section["flags"] & SHF_ALLOC) and section["size"]]
+        if (1 != len(allocated)) or (SHT_NOBITS == sections[allocated[0]]["type"]):
+            return reject_elf_image(src, "content must be in exactly one section", quiet)
+        index = allocated[0]
+        base = int(PlatformVar("entry"))
+        if base % max(sections[index]["addralign"], 1):
+            return reject_elf_image(src, "section alignment %i not satisfied" % (sections[index]["addralign"]), quiet)
+        data = bytearray(elf.get_section_data(sections[index]))
+        symbols = {}
+        for ii in elf.get_symbols(SHT_SYMTAB):
+            symbols[ii["index"]] = ii
+        for ii in elf.get_relocations():
+            if ii["section"] != index:
+                if sections[ii["section"]]["flags"] & SHF_ALLOC:
+                    return reject_elf_image(src, "relocations for unexpected section %i" % (ii["section"]), quiet)
+                continue
+            if ii["type"] not in types:
+                return reject_elf_image(src, "relocation type %i not supported" % (ii["type"]), quiet)
+            (size, relative, overflow) = types[ii["type"]]
+            value = 0
+            if ii["symbol"]:
+                symbol = symbols[ii["symbol"]]
+                if symbol["shndx"] == index:
+                    value = base + symbol["value"]
+                elif symbol["shndx"] == SHN_ABS:
+                    value = symbol["value"]
+                else:
+                    return reject_elf_image(src, "symbol '%s' not defined in content" % (symbol["name"]), quiet)
+            addend = ii["addend"]
+            if addend is None:
+                addend = struct.unpack_from("<" + RELOCATION_FORMATS[size].lower(), data, ii["offset"])[0]
+            value += addend
+            if relative:
+                value -= base + ii["offset"]
+            if not apply_relocation(data, ii["offset"], size, value, overflow):
+                return reject_elf_image(src, "relocation at 0x%x overflows" % (ii["offset"]), quiet)
+    return bytes(data)
+
+def is_direct_link():
+    """Tell if images may be written directly."""
+    return g_direct_link
+
+def link_elf_image(linker, objcopy, src, unprocessed, dst, zero, quiet=False):
+    """Link an assembled object into a binary truncated to the file size of its first PT_LOAD.
+
+    Image is written directly if enabled and possible, otherwise the linker is used, outputting the untruncated
+    binary. If quiet, nothing is printed even in verbose mode."""
+    data = None
+    if g_direct_link and (not objcopy):
+        data = generate_elf_image(src, quiet)
+    if data is None:
+        linker.link_binary(objcopy, [src], unprocessed)
+        with open(unprocessed, "rb") as fd:
+            data = fd.read()
+    elif is_verbose() and (not quiet):
+        print("Wrote ELF image directly from '%s': %i bytes" % (src, len(data)))
+    with open(dst, "wb") as fd:
+        fd.write(truncate_elf_image(data, zero, quiet))
+
+def reject_elf_image(src, reason, quiet=False):
+    """Report why an image cannot be written directly, return None."""
+    if is_verbose() and (not quiet):
+        print("Not writing ELF image directly from '%s': %s" % (src, reason))
+    return None
+
+def set_direct_link(op):
+    """Set whether images may be written directly."""
+    global g_direct_link
+    g_direct_link = op
+
+def truncate_elf_image(data, zero, quiet=False):
+    """Truncate image to file size of its first PT_LOAD, or fill the rest of the image except last byte with 0."""
+    with ElfFile(data) as elf:
+        phdr = elf.find_program_header(PT_LOAD, PF_R | PF_W | PF_X)
+    if not phdr:
+        raise RuntimeError("could not read first PT_LOAD from image")
+    size = len(data)
+    truncate_size = phdr["filesz"]
+    if size == truncate_size:
+        if is_verbose() and (not quiet):
+            print("Executable size equals PT_LOAD size (%u bytes), no operation necessary." % (size))
+        return data
+    if not zero:
+        if is_verbose() and (not quiet):
+            print("Truncating file size to PT_LOAD size: %u bytes" % (truncate_size))
+        return data[:truncate_size]
+    if is_verbose() and (not quiet):
+        print("Filling file with 0 after PT_LOAD size: %u bytes" % (truncate_size))
+    return data[:truncate_size] + b"\0" * max(size - 1 - truncate_size, 0)
@@ -1,3 +1,14 @@
+import os
+import struct
+
+from dnload.common import is_verbose
+from dnload.common import run_command
+from dnload.elf_file import ElfFile
+from dnload.elf_file import PF_R
+from dnload.elf_file import PF_W
+from dnload.elf_file import PF_X
+from dnload.elf_file import PT_LOAD
+
 ########################################
 # Globals ##############################
 ########################################
@@ -48,18 +59,23 @@ class Elfling:
 
     def compress(self, src, dst):
         """Compress given file, starting from entry point and ending at file end."""
-        info = readelf_get_info(src)
+        with ElfFile(src) as elf:
+            phdr = elf.find_program_header(PT_LOAD, PF_R | PF_W | PF_X)
+            if not phdr:
+                raise RuntimeError("could not read first PT_LOAD from executable '%s'" % (src))
+            entry = elf.get_entry() - phdr["vaddr"]
+            load_size = phdr["filesz"]
         starting_size = os.path.getsize(src)
-        if starting_size != info["size"]:
+        if starting_size != load_size:
             raise RuntimeError("size of file '%s' differs from header claim: %i != %i" %
-                               (src, starting_size, info["size"]))
+                               (src, starting_size, load_size))
         rfd = open(src, "rb")
         wfd = open(dst, "wb")
         data = rfd.read(starting_size)
-        wfd.write(data[info["entry"]:])
+        wfd.write(data[entry:])
         rfd.close()
         wfd.close()
-        self.__uncompressed_size = len(data) - info["entry"]
+        self.__uncompressed_size = len(data) - entry
         if is_verbose():
             print("Wrote compressable program block '%s': %i bytes" % (dst, self.__uncompressed_size))
         self.__contexts = []
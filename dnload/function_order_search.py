@@ -0,0 +1,114 @@
+import shutil
+import tempfile
+
+from dnload.common import is_verbose
+from dnload.section_order_search import generate_move_orders
+from dnload.section_order_search import SectionOrderSearch
+
+########################################
+# Globals ##############################
+########################################
+
+# Maximum number of local search rounds when refining the call graph order.
+FUNCTION_ORDER_LOCAL_ROUNDS = 4
+
+########################################
+# Functions ############################
+########################################
+
+def contract_function_order(op, slots):
+    """Get order of functions from an order of all reorderable sections."""
+    return [slots.index(op[ii]) for ii in slots]
+
+def expand_function_order(op, slots, count):
+    """Get order of all reorderable sections from an order of functions. Functions are placed into the positions
+    occupied by functions, other sections stay in place."""
+    ret = list(range(count))
+    for (slot, function) in zip(slots, op):
+        ret[slot] = slots[function]
+    return ret
+
+def generate_call_graph(functions):
+    """Generate call graph of functions, dictionary from (caller, callee) index pairs to number of calls.
+
+    Direct calls and jumps to other functions are counted, tail calls are calls all the same."""
+    indices = {}
+    for (ii, function) in enumerate(functions):
+        indices[function.get_function_name()] = ii
+    ret = {}
+    for (ii, function) in enumerate(functions):
+        for jj in function.gather_calls():
+            callee = indices.get(jj)
+            if (callee is not None) and (callee != ii):
+                ret[(ii, callee)] = ret.get((ii, callee), 0) + 1
+    return ret
+
+def generate_call_graph_order(count, graph):
+    """Generate order of functions placing callers and callees next to each other.
+
+    Clusters of functions are merged in order of decreasing call count between them, orienting the merged clusters
+    to place the functions calling each other as close as possible. Clusters are placed in source order of their
+    first function."""
+    weights = {}
+    for ((caller, callee), calls) in graph.items():
+        edge = (min(caller, callee), max(caller, callee))
+        weights[edge] = weights.get(edge, 0) + calls
+    clusters = [[ii] for ii in range(count)]
+    for ((first, second), calls) in sorted(weights.items(), key=lambda x: (-x[1], x[0])):
+        lhs = [ii for ii in clusters if first in ii][0]
+        rhs = [ii for ii in clusters if second in ii][0]
+        if lhs is rhs:
+            continue
+        candidates = (lhs + rhs, lhs + rhs[::-1], lhs[::-1] + rhs, rhs + lhs)
+        merged = min(candidates, key=lambda x: abs(x.index(first) - x.index(second)))
+        clusters = [ii for ii in clusters if (ii is not lhs) and (ii is not rhs)] + [merged]
+    ret = []
+    for ii in sorted(clusters, key=min):
+        ret += ii
+    return ret
+
+def search_function_order(asm, header, assembler, linker, objcopy, zero, compression, refine=False):
+    """Reorder functions of an assembler file according to their call graph.
+
+    Code sections are split into functions and call graph order is kept only if it compresses smaller than source
+    order. If refining, the better order is improved by moving single functions. Best order is applied to the
+    assembler file and returned as listing of function names."""
+    asm.split_functions()
+    sections = asm.get_reorderable_sections()
+    slots = [ii for (ii, section) in enumerate(sections) if section.get_function_name()]
+    if 2 > len(slots):
+        if is_verbose():
+            print("Not reordering functions: %i function(s) found" % (len(slots)))
+        return None
+    names = [sections[ii].get_function_name() for ii in slots]
+    graph = generate_call_graph([sections[ii] for ii in slots])
+    order = generate_call_graph_order(len(slots), graph)
+    if is_verbose():
+        print("Call graph: %i functions, %i edges, order: %s" % (len(names), len(graph),
+                                                                 ", ".join([names[ii] for ii in order])))
+    directory = tempfile.mkdtemp(prefix="dnload_function_order_")
+    try:
+        search = SectionOrderSearch(header, [ii.generate_file_output() for ii in sections], asm.generate_fixed_output(),
+                                    assembler, linker, objcopy, zero, compression, directory)
+        (initial_size, call_graph_size) = search.score([list(range(len(sections))),
+                                                        expand_function_order(order, slots, len(sections))])
+        if initial_size is None:
+            raise RuntimeError("could not build current function order")
+        if is_verbose():
+            print("Call graph function order: %s bytes" % (str(call_graph_size)))
+        for ii in range(FUNCTION_ORDER_LOCAL_ROUNDS if refine else 0):
+            best_size = search.get_best_size()
+            current = contract_function_order(search.get_best_order(), slots)
+            search.score([expand_function_order(jj, slots, len(sections)) for jj in generate_move_orders(current)])
+            if search.get_best_size() >= best_size:
+                break
+            if is_verbose():
+                print("Function order local search round %i: %i bytes" % (ii + 1, search.get_best_size()))
+    finally:
+        shutil.rmtree(directory, True)
+    asm.reorder_sections([sections[ii] for ii in search.get_best_order()])
+    ret = [names[ii] for ii in contract_function_order(search.get_best_order(), slots)]
+    print("Function order: %i -> %i bytes compressed, %i bytes saved (%s)" % (initial_size, search.get_best_size(),
+                                                                              initial_size - search.get_best_size(),
+                                                                              ", ".join(ret)))
+    return ret
@@ -4,7 +4,6 @@ import re
 from dnload.common import is_listing
 from dnload.common import is_verbose
 from dnload.common import listify
-from dnload.glsl_block_assignment import is_glsl_block_assignment
 from dnload.glsl_block_control import is_glsl_block_control
 from dnload.glsl_block_declaration import is_glsl_block_declaration
 from dnload.glsl_block_function import is_glsl_block_function
@@ -19,7 +18,10 @@ from dnload.glsl_block_source import glsl_read_source
 from dnload.glsl_block_source import is_glsl_block_source
 from dnload.glsl_block_uniform import is_glsl_block_uniform
 from dnload.glsl_name import is_glsl_name
+from dnload.glsl_name import reset_lock_history
 from dnload.glsl_name_strip import is_glsl_name_strip
+from dnload.glsl_name_strip_index import GlslNameStripIndex
+from dnload.glsl_scope_index import get_scope_index
 from dnload.glsl_source_chain import GlslSourceChain
 
 ########################################
@@ -59,6 +61,15 @@ class Glsl:
 
     def crunch(self, mode="full", freqs=None, max_inlines=-1, max_renames=-1, max_simplifys=-1):
         """Crunch the source code to smaller state."""
+        # Lock history is only needed while crunching, do not keep names of earlier runs alive.
+        reset_lock_history()
+        try:
+            self.crunchSources(mode, freqs, max_inlines, max_renames, max_simplifys)
+        finally:
+            reset_lock_history()
+
+    def crunchSources(self, mode, freqs, max_inlines, max_renames, max_simplifys):
+        """Crunch all sources, implementation of crunch."""
         combines = None
         inlines = None
         renames = None
@@ -70,12 +81,15 @@ class Glsl:
             # Perform inlining passes.
             inlines = 0
             while True:
-                merged = self.inlinePass((max_inlines < 0) or (inlines < max_inlines))
+                if 0 <= max_inlines:
+                    merged = self.inlinePass(max_inlines - inlines)
+                else:
+                    merged = self.inlinePass(-1)
                 # If no inlines succeeded, the result value will be a listing of merged variable names.
-                if merged:
+                if is_listing(merged):
                     break
                 # Do another inlining round.
-                inlines += 1
+                inlines += merged
             # Check that no name is unreferenced.
             if is_verbose():
                 for ii in merged:
@@ -216,10 +230,8 @@ class Glsl:
                     # Uniforms clash within the source chain.
                     elif is_glsl_block_uniform(op):
                         chain = self.findCommonChain(ii, parent)
-                        if chain:
-                            for jj in flatten(ii):
-                                if is_glsl_block_uniform(jj) and jj.hasLockedDeclaredName(name):
-                                    return True
+                        if chain and get_scope_index(ii).hasLockedUniform(name):
+                            return True
         # Above checks only work if uniforms are only declared in source scope.
         elif is_glsl_block_uniform(op):
             raise RuntimeError("found uniform block in non-source scope")
@@ -238,8 +250,13 @@ class Glsl:
         block.removeFromParent()
         return ret
 
-    def inlinePass(self, allow_inline):
-        """Run inline pass. Return list of merged names if no inlining could be done."""
+    def inlinePass(self, max_inlines):
+        """Run inline pass. Return list of merged names if no inlining could be done, otherwise number of inlines.
+
+        With unlimited inlines, every candidate not sharing names with other candidates is inlined together with the
+        first inlinable candidate. Inlining them does not change the order or conflicts of other candidates, so the
+        result is the same as when inlining one candidate per pass. Name strips are updated in place instead of
+        being recollected whenever possible."""
         collected = []
         for ii in self.__sources:
             # First pass - collect from generic sources only
@@ -261,7 +278,8 @@ class Glsl:
             if ii.getType():
                 collected += ii.collect()
         # Merge multiple matching inout names.
-        ret = sorted(self.mergeCollectedNames(collected), reverse=True)
+        merged = self.mergeCollectedNames(collected)
+        ret = sorted(merged, reverse=True)
         # Collect all member accesses for members and set them to the blocks.
         for ii in ret:
             block = ii.getBlock()
@@ -273,28 +291,78 @@ class Glsl:
             # Fist name strip associated with an inout struct gets the accesses.
             ii[0].getBlock().setMemberAccesses(lst)
         # If inlining is not allowed, just return.
-        if not allow_inline:
+        if 0 == max_inlines:
             return ret
-        # Perform inlining if possible.
-        for ii in ret:
-            # Merged instances not ok for inlining.
-            if ii.getBlockCount() > 1:
-                continue
-            block = ii.getBlock()
-            # Must be declaration to be inlined anywhere.
-            if not is_glsl_block_declaration(block):
-                continue
-            # Must be an inline name to be inlined.
-            if not is_inline_name(ii.getName()):
-                continue
-            names = ii.getNameList()
-            # If no inline conflict, perform inline and return nothing to signify another pass can be done.
-            if not self.hasInlineConflict(block, names):
-                self.inline(block, names)
-                return None
+        index = GlslNameStripIndex(merged)
+        inlines = 0
+        while True:
+            candidates = list(filter(is_inline_candidate, index.getSortedStrips()))
+            # Find first candidate that can be inlined.
+            selected = None
+            for ii in candidates:
+                if not self.hasInlineConflict(ii.getBlock(), ii.getNameList()):
+                    selected = ii
+                    break
+            if not selected:
+                break
+            # Limited number of inlines are always done one at a time.
+            if 0 <= max_inlines:
+                self.inline(selected.getBlock(), selected.getNameList())
+                return 1
+            independent = collect_independent_inline_candidates(candidates)
+            if selected in independent:
+                # Inline all independent candidates that have no conflicts. Other candidates stay unaffected.
+                for ii in candidates:
+                    if (ii is selected) or ((ii in independent) and (not self.hasInlineConflict(ii.getBlock(), ii.getNameList()))):
+                        self.inline(ii.getBlock(), ii.getNameList())
+                        index.removeStrip(ii)
+                        inlines += 1
+            else:
+                inlines += 1
+                # Recollect names if the index could not be updated.
+                if not self.inlineIndexed(index, selected):
+                    return inlines
+        # Names must be recollected if inlining was done.
+        if inlines:
+            return inlines
         # Return merged list of name strips.
         return ret
 
+    def inlineIndexed(self, index, strip):
+        """Inline name strip and update name strip index accordingly. Return False if index could not be updated."""
+        block = strip.getBlock()
+        names = strip.getNameList()
+        parent = find_parent_scope(block)
+        statement_names = list(filter(is_glsl_name, block.getStatement().getTokens()))
+        # Names in the statement must unambiguously belong to one name strip, or to none.
+        updatable = not is_glsl_block_source(parent)
+        for ii in statement_names:
+            strips = index.findString(ii.getName())
+            if strips and ((1 < len(strips)) or (index.find(ii) is not strips[0])):
+                updatable = False
+        if not updatable:
+            self.inline(block, names)
+            return False
+        # Find blocks the statement is copied into and names they already have.
+        users = []
+        for ii in get_scope_index(parent).getUsers(names):
+            if (ii != block) and (ii.getParent() != block):
+                users += [(ii, set(map(id, ii.getUsedNames())))]
+        self.inline(block, names)
+        index.removeStrip(strip)
+        for ii in statement_names:
+            if index.find(ii):
+                index.removeName(ii)
+        # Copies of statement names belong to the same name strips as the originals.
+        for (user, previous) in users:
+            for ii in user.getUsedNames():
+                if id(ii) in previous:
+                    continue
+                strips = index.findString(ii.getName())
+                if strips:
+                    index.addName(strips[0], ii)
+        return True
+
     def inventName(self, block, counted):
         """Invent a new name when existing names have run out."""
         for ii in single_character_alphabet():
@@ -519,6 +587,34 @@ def collect_compatible_inout_structs(lst):
                ret += [[ii]]
     return ret
 
+def collect_independent_inline_candidates(candidates):
+    """Collect inline candidates that do not use or get used by any other candidate."""
+    declared = {}
+    for ii in candidates:
+        name = ii.getName().getName()
+        declared[name] = declared.get(name, 0) + 1
+    ret = []
+    used = set()
+    statement_names = []
+    for ii in candidates:
+        names = get_inline_statement_names(ii.getBlock())
+        statement_names += [names]
+        if names is not None:
+            used = used.union(names)
+    for ii in range(len(candidates)):
+        vv = candidates[ii]
+        names = statement_names[ii]
+        # Statement must not use other candidates, declared name must be unique and not used by other candidates.
+        if names is None:
+            continue
+        name = vv.getName().getName()
+        if (1 < declared[name]) or (name in used):
+            continue
+        if any(map(lambda x: x in declared, names)):
+            continue
+        ret += [vv]
+    return ret
+
 def collect_member_uses(block, uses):
     """Collect member uses from inout struct block."""
     for ii in block.getMembers():
@@ -580,6 +676,19 @@ def flatten(block):
         ret += flatten(ii)
     return ret
 
+def get_inline_statement_names(block):
+    """Get set of name strings used in the statement of a declaration block or None if not available."""
+    if 1 != len(block.getChildren()):
+        return None
+    statement = block.getStatement()
+    if not statement:
+        return None
+    ret = set()
+    for ii in statement.getTokens():
+        if is_glsl_name(ii):
+            ret.add(ii.getName())
+    return ret
+
 def has_inline_conflict(parent, block, names, comparison=None):
     """Tell if given block has inline conflict."""
     # Iterate over statement names if comparison not present.
@@ -588,42 +697,20 @@ def has_inline_conflict(parent, block, names, comparison=None):
             if is_glsl_name(ii) and has_inline_conflict(parent, block, names, ii):
                 return True
         return False
-    # Search for alterations of name.
-    found = False
-    uses = len(names)
-    for ii in flatten(parent):
-        if block == ii:
-            found = True
-        # If name is found used by this particular block, decrement uses. Can stop iteration at 0 uses.
-        for jj in names:
-            if ii.hasUsedNameExact(jj):
-                uses -= 1
-        if 0 >= uses:
-            return False
-        # Assignment into a name used by the statement makes inlining impossible.
-        if found and is_glsl_block_assignment(ii) and ii.getName() == comparison:
-            return True
-    return False
+    # Assignment into a name used by the statement before all uses makes inlining impossible.
+    return get_scope_index(parent).hasInlineConflict(block, names, comparison)
 
 def has_name_conflict(parent, block, name):
     """Tell if given block contains a conflict for given name."""
-    found = False
-    for ii in flatten(parent):
-        # Declared names take the name out of the scope permanently.
-        if ii.hasLockedDeclaredName(name):
-            return True
-        # Other blocks reserve names from their inception onward.
-        if block == ii:
-            found = True
-        if found and ii.hasLockedUsedName(name):
-            return True
-    return False
+    # Declared names take the name out of the scope permanently, other blocks reserve names from their inception onward.
+    return get_scope_index(parent).hasNameConflict(block, name)
 
 def inline_instances(parent, block, names):
     """Inline all instances of block in given parent scope."""
     ret = 0
     tokens = block.getStatement().getTokens()
-    for ii in flatten(parent):
+    # Replacing names invalidates the scope index, find all users first.
+    for ii in get_scope_index(parent).getUsers(names):
         if (ii == block) or (ii.getParent() == block):
             continue
         for jj in names:
@@ -639,6 +726,14 @@ def is_glsl_block_precision_relevant(op):
     """Tell if block is something to which precision directive matters."""
     return (is_glsl_block_declaration(op) or is_glsl_block_function(op) or is_glsl_block_member(op) or is_glsl_block_inout_typed(op) or is_glsl_block_uniform(op))
 
+def is_inline_candidate(op):
+    """Tell if given name strip can be considered for inlining."""
+    # Merged instances not ok for inlining.
+    if op.getBlockCount() > 1:
+        return False
+    # Must be declaration to be inlined anywhere and must be an inline name.
+    return is_glsl_block_declaration(op.getBlock()) and is_inline_name(op.getName())
+
 def is_inline_name(op):
     """Tell if given name is viable for inlining."""
     if re.match(r'^i_.*$', op.getName(), re.I):
@@ -24,6 +24,7 @@ from dnload.glsl_paren import interpret_paren
 from dnload.glsl_paren import is_glsl_paren
 from dnload.glsl_terminator import interpret_terminator
 from dnload.glsl_terminator import is_glsl_terminator
+from dnload.glsl_token_cursor import glsl_token_cursor
 from dnload.glsl_type import interpret_type
 from dnload.glsl_type import is_glsl_type
 
@@ -41,6 +42,7 @@ class GlslBlock:
         self.__names_declared = set()
         self.__names_used = []
         self.__parent = None
+        self.__scope_index = None
 
     def addAccesses(self, op):
         """Adds access elements in the block to the block's access list."""
@@ -67,6 +69,7 @@ class GlslBlock:
             else:
                 self._children += [ii]
             ii.setParent(self)
+        self.invalidateScopeIndex()
 
     def addNamesDeclared(self, op):
         """Add given names as names declared by this block."""
@@ -79,6 +82,7 @@ class GlslBlock:
         if op in self.__names_declared:
             raise RuntimeError("declaring name '%s' twice" % (op))
         self.__names_declared.add(op)
+        self.invalidateScopeIndex()
 
     def addNamesUsed(self, op):
         """Add given names as names used by this block."""
@@ -89,6 +93,7 @@ class GlslBlock:
         if not is_glsl_name(op):
             return
         self.__names_used += [op]
+        self.invalidateScopeIndex()
 
     def clearAccesses(self):
         """Clear accesses."""
@@ -97,6 +102,7 @@ class GlslBlock:
     def clearNamesUsed(self):
         """Clear used names."""
         self.__names_used = []
+        self.invalidateScopeIndex()
 
     def collapse(self, other, mode):
         """Default collapse implementation. Default implementation just returns False."""
@@ -127,6 +133,7 @@ class GlslBlock:
             ww = self._children[ii + 1]
             if vv.collapse(ww, mode):
                 self._children.pop(ii + 1)
+                self.invalidateScopeIndex()
                 return True
         return False
 
@@ -191,6 +198,7 @@ class GlslBlock:
                 self._children[ii:ii] = array
                 for jj in array:
                     jj.setParent(self)
+                self.invalidateScopeIndex()
                 return True
         return False
 
@@ -206,6 +214,10 @@ class GlslBlock:
         """Accessor."""
         return self.__parent
 
+    def getScopeIndex(self):
+        """Accessor."""
+        return self.__scope_index
+
     def getSourceFile(self):
         """Gets the topmost parent block, i.e. source file block."""
         ret = self
@@ -252,11 +264,19 @@ class GlslBlock:
                 return True
         return False
 
+    def invalidateScopeIndex(self):
+        """Invalidate scope indices of this and all blocks containing this."""
+        block = self
+        while block:
+            block.__scope_index = None
+            block = block.getParent()
+
     def removeChild(self, op):
         """Remove a child block."""
         for ii in range(len(self._children)):
             if self._children[ii] == op:
                 self._children.pop(ii)
+                self.invalidateScopeIndex()
                 return
         raise RuntimeError("could not find child to remove")
 
@@ -267,6 +287,7 @@ class GlslBlock:
         self._children[index].setParent(None)
         self._children[index] = child
         child.setParent(self)
+        self.invalidateScopeIndex()
 
     def removeFromParent(self):
         """Remove this from its parent."""
@@ -295,6 +316,10 @@ class GlslBlock:
         """Default implementation of simplify just recurses into children."""
         return 0
 
+    def setScopeIndex(self, op):
+        """Set scope index of this block."""
+        self.__scope_index = op
+
     def setParent(self, op):
         """Set parent of this block."""
         if op and (not op.hasChild(self)):
@@ -324,15 +349,13 @@ def extract_scope(tokens, opener):
     """Extract scope from token list. Needs scope opener to already be extracted."""
     if not is_glsl_paren(opener):
         raise RuntimeError("no opener passed to scope extraction")
+    tokens = glsl_token_cursor(tokens)
     paren_count = 1
-    ret = []
-    for ii in range(len(tokens)):
-        elem = tokens[ii]
+    for (ii, elem) in enumerate(tokens):
         if is_glsl_paren(elem):
             paren_count = opener.update(elem, paren_count)
             if 0 >= paren_count:
-                return (ret, tokens[ii + 1:])
-        ret += [elem]
+                return (tokens[:ii], tokens[ii + 1:])
     # Did not find closing scope element.
     return (None, tokens)
 
@@ -350,14 +373,14 @@ def extract_tokens(tokens, required):
     # For straight-out incompatible request, get out immediately.
     if len(required) > len(tokens):
         return failure_array
-    # Iterate over requests.
-    content = tokens[:]
-    required = list(required)
+    # Iterate over requests. Cursor is only advanced, tokens are never copied.
+    content = glsl_token_cursor(tokens)
     ret = []
-    success = True
-    while content and required:
-        curr = content.pop(0)
-        req = required.pop(0)
+    for req in required:
+        if not content:
+            break
+        curr = content[0]
+        content = content.advance(1)
         # Token request.
         if "?" == req[:1]:
             desc = req[1:]
@@ -508,18 +531,11 @@ def tokenize_interpret(tokens):
     return ret
 
 def tokenize_split(source):
-    if not source:
-        return []
+    """Split source into preliminary tokens on whitespace and punctuation."""
     ret = []
-    array = source.split()
-    if 1 < len(array):
-        for ii in array:
-            ret += tokenize_split(ii)
-        return ret
-    array = re.split(r'([\(\)\[\]\{\}\+\-\*\/%\|&\^!\.,;:<>\=])', source, 1)
-    if 3 > len(array):
-        return [source]
-    return list(filter(lambda x: x, array[:2])) + tokenize_split(array[2])
+    for ii in source.split():
+        ret += filter(lambda x: x, re.split(r'([\(\)\[\]\{\}\+\-\*\/%\|&\^!\.,;:<>\=])', ii))
+    return ret
 
 def validate_token(token, validation):
     """Validate that token matches given requirement."""
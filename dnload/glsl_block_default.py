@@ -10,7 +10,7 @@ class GlslBlockDefault(GlslBlock):
     def __init__(self, content):
         """Constructor."""
         GlslBlock.__init__(self)
-        self.__content = content
+        self.__content = list(content)
 
     def format(self, force):
         """Return formatted output."""
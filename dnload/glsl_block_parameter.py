@@ -1,4 +1,3 @@
-from dnload.common import is_listing
 from dnload.glsl_block import GlslBlock
 from dnload.glsl_block import extract_tokens
 from dnload.glsl_block_assignment import glsl_parse_assignment
@@ -83,7 +82,7 @@ def glsl_split_parameter_list(source):
 def glsl_parse_parameter_list(source):
     """Parse list of parameters."""
     # Empty parameter list is ok.
-    if is_listing(source) and (0 >= len(source)):
+    if (source is not None) and (0 >= len(source)):
         return []
     ret = []
     parameters = glsl_split_parameter_list(source)
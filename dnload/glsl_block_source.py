@@ -1,6 +1,10 @@
-import re
+import io
 import os
+import pickle
+import re
 
+from dnload.cache import generate_key
+from dnload.cache import get_cache
 from dnload.common import generate_temporary_filename
 from dnload.common import is_verbose
 from dnload.common import variablize
@@ -9,6 +13,8 @@ from dnload.glsl_block_preprocessor import glsl_parse_preprocessor
 from dnload.glsl_block_inout import is_glsl_block_inout_typed
 from dnload.glsl_block_uniform import is_glsl_block_uniform
 from dnload.glsl_parse import glsl_parse
+from dnload.glsl_parse import glsl_parser_fingerprint
+from dnload.glsl_preprocessor import is_glsl_preprocessor
 from dnload.glsl_source_precision import GlslSourcePrecision
 from dnload.template import Template
 
@@ -57,6 +63,25 @@ static const char* [[SOURCE_NAME]]_[[TYPE_NAME]]_[[VARIABLE_NAME]] DNLOAD_RENAME
 g_template_glsl_rename_print = Template("""
 static const char* [[SOURCE_NAME]]_[[TYPE_NAME]]_[[VARIABLE_NAME]] DNLOAD_RENAME_UNUSED = \"[[RENAME]]\";""")
 
+# Pickle protocol for cached parse trees, part of the cache key.
+GLSL_PARSE_TREE_PROTOCOL = 4
+
+########################################
+# GlslTreeUnpickler ####################
+########################################
+
+class GlslTreeUnpickler(pickle.Unpickler):
+    """Unpickler for cached parse trees, only creating GLSL parse tree classes.
+
+    Cache directory is trusted to contain entries written by dnload. Restricting the classes prevents a corrupt or
+    foreign entry from calling anything other than GLSL class constructors."""
+
+    def find_class(self, module, name):
+        """Resolve class, refusing anything that is not a GLSL class."""
+        if (not re.match(r'dnload\.glsl(_\w+)?$', module)) or (not name.startswith("Glsl")):
+            raise pickle.UnpicklingError("class '%s.%s' not allowed in GLSL parse tree" % (module, name))
+        return pickle.Unpickler.find_class(self, module, name)
+
 ########################################
 # GlslBlockSource ######################
 ########################################
@@ -141,6 +166,10 @@ class GlslBlockSource(GlslBlock):
         """Accessor."""
         return self.__chain
 
+    def getContent(self):
+        """Accessor."""
+        return self.__content
+
     def getFilename(self):
         """Accessor."""
         return self.__filename
@@ -178,8 +207,33 @@ class GlslBlockSource(GlslBlock):
         return chain_name.lower() in ("all", "common", "default")
 
     def parse(self):
-        """Parse code into blocks and statements."""
-        array = glsl_parse(self.__content)
+        """Parse code into blocks and statements. Parse trees are cached by preprocessed content.
+
+        Trees are pickled as opposed to having a serialization format of their own. Cache key includes the pickle
+        protocol and a fingerprint of the GLSL modules, so entries are never read by a parser that did not write
+        them."""
+        cache = get_cache()
+        array = None
+        if cache:
+            key = generate_key(["glsl-parse", str(GLSL_PARSE_TREE_PROTOCOL), glsl_parser_fingerprint(), self.__content])
+            entry = cache.get(key)
+            if entry:
+                try:
+                    array = GlslTreeUnpickler(io.BytesIO(cache.get_blob(entry, "tree"))).load()
+                    if is_verbose():
+                        print("Using cached GLSL parse tree: '%s'" % (self.__filename))
+                except (pickle.UnpicklingError, EOFError) as ee:
+                    if is_verbose():
+                        print("WARNING: discarding cached GLSL parse tree of '%s': %s" % (self.__filename, str(ee)))
+        if array is None:
+            array = glsl_parse(self.__content)
+            # Parse tree is serialized before it's attached to this block.
+            if cache:
+                try:
+                    cache.put(key, {"tree": pickle.dumps(array, GLSL_PARSE_TREE_PROTOCOL)})
+                except RecursionError:
+                    if is_verbose():
+                        print("WARNING: GLSL parse tree of '%s' too deep to cache" % (self.__filename))
         # Hierarchy.
         self.addChildren(array)
 
@@ -192,13 +246,17 @@ class GlslBlockSource(GlslBlock):
                 self.addChildren(block)
             else:
                 content += [ii]
+        # In-process preprocessor works on the content directly.
+        if is_glsl_preprocessor(preprocessor):
+            intermediate = preprocessor.preprocessSource(("\n".join(content)).strip(), self.__filename)
         # Removed known preprocessor directives, write result into intermediate file.
-        fname = generate_temporary_filename(self.__filename + ".preprocessed")
-        fd = open(fname, "w")
-        fd.write(("\n".join(content)).strip())
-        fd.close()
-        # Preprocess and reassemble content.
-        intermediate = preprocessor.preprocess(fname)
+        else:
+            fname = generate_temporary_filename(self.__filename + ".preprocessed")
+            fd = open(fname, "w")
+            fd.write(("\n".join(content)).strip())
+            fd.close()
+            intermediate = preprocessor.preprocess(fname)
+        # Reassemble content.
         content = []
         for ii in intermediate.splitlines():
             if not ii.strip().startswith("#"):
@@ -223,11 +281,14 @@ class GlslBlockSource(GlslBlock):
 
     def write(self):
         """Write compressed output."""
-        fd = open(self.__output_name, "w")
+        # Write through a temporary file so concurrent builds never see a partial header.
+        temporary_name = "%s.%i.tmp" % (self.__output_name, os.getpid())
+        fd = open(temporary_name, "w")
         if not fd:
             raise RuntimeError("could not write GLSL header '%s'" % (self.__output_name))
         fd.write(self.generateHeaderOutput())
         fd.close()
+        os.replace(temporary_name, self.__output_name)
         if is_verbose():
             print("Wrote GLSL header: '%s' => '%s'" % (self.getVariableName(), self.__output_name))
 
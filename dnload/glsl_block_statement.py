@@ -110,8 +110,7 @@ def glsl_parse_statement(source, explicit=True):
     bracket_count = 0
     paren_count = 0
     lst = []
-    for ii in range(len(source)):
-        elem = source[ii]
+    for (ii, elem) in enumerate(source):
         # Count all scope-y things.
         if is_glsl_paren(elem):
             bracket_count = elem.updateBracket(bracket_count)
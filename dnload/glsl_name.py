@@ -66,6 +66,7 @@ class GlslName:
         if not isinstance(op, str):
             raise RuntimeError("rename must be string, '%s' given" % (str(op)))
         self.__rename = op
+        g_lock_history.append(self)
 
     def resolveName(self):
         """Get resolved name, this is the locked name or original name if not locked."""
@@ -197,6 +198,9 @@ g_vec4 = (
         "textureGrad",
         )
 
+# Names locked by renaming since last reset, in locking order.
+g_lock_history = []
+
 ########################################
 # Functions ############################
 ########################################
@@ -209,6 +213,10 @@ def get_list_primitives():
     """Get list of primitive words."""
     return g_primitives
 
+def get_lock_history():
+    """Get list of names locked since last reset, in locking order."""
+    return g_lock_history
+
 def interpret_name(source):
     """Try to interpret name identifier."""
     # All reserved strings other than names here should have been interpreted before.
@@ -220,3 +228,8 @@ def interpret_name(source):
 def is_glsl_name(op):
     """Tell if token is type identifier."""
     return isinstance(op, GlslName)
+
+def reset_lock_history():
+    """Start a new lock history, releasing names locked so far."""
+    global g_lock_history
+    g_lock_history = []
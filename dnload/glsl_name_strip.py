@@ -71,6 +71,14 @@ class GlslNameStrip:
         for ii in self.__names:
             ii.lock(op)
 
+    def removeName(self, op):
+        """Remove exact name object from the list."""
+        for ii in range(len(self.__names)):
+            if self.__names[ii] is op:
+                self.__names.pop(ii)
+                return
+        raise RuntimeError("name %s not found in %s" % (str(op), str(self)))
+
     def updateNameTypes(self):
         """Update all name types and check for errors."""
         typeid = self.getName().getType()
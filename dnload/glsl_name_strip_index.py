@@ -0,0 +1,50 @@
+########################################
+# GlslNameStripIndex ###################
+########################################
+
+class GlslNameStripIndex:
+    """Index of name strips by exact name objects and name strings, kept up to date without recollecting."""
+
+    def __init__(self, lst):
+        """Constructor."""
+        self.__strips = []
+        self.__names = {}
+        self.__strings = {}
+        for ii in lst:
+            self.addStrip(ii)
+
+    def addName(self, strip, name):
+        """Add a name into a name strip within the index."""
+        strip.addName(name)
+        self.__names[id(name)] = strip
+
+    def addStrip(self, op):
+        """Add a name strip into the index."""
+        self.__strips += [op]
+        for ii in op.getNameList():
+            self.__names[id(ii)] = op
+        self.__strings.setdefault(op.getName().getName(), []).append(op)
+
+    def find(self, name):
+        """Find name strip containing given exact name object."""
+        return self.__names.get(id(name))
+
+    def findString(self, op):
+        """Find all name strips with given name string."""
+        return self.__strings.get(op, [])
+
+    def getSortedStrips(self):
+        """Get name strips sorted like freshly collected name strips."""
+        return sorted(self.__strips, reverse=True)
+
+    def removeName(self, name):
+        """Remove exact name object from the name strip containing it."""
+        strip = self.__names.pop(id(name))
+        strip.removeName(name)
+
+    def removeStrip(self, op):
+        """Remove a name strip from the index."""
+        self.__strips.remove(op)
+        for ii in op.getNameList():
+            self.__names.pop(id(ii), None)
+        self.__strings[op.getName().getName()].remove(op)
@@ -1,3 +1,8 @@
+import glob
+import os
+
+from dnload.cache import file_digest
+from dnload.cache import generate_key
 from dnload.glsl_block import tokenize
 from dnload.glsl_block_assignment import glsl_parse_assignment
 from dnload.glsl_block_function import glsl_parse_function
@@ -8,6 +13,26 @@ from dnload.glsl_block_pervertex import glsl_parse_pervertex
 from dnload.glsl_block_precision import glsl_parse_precision
 from dnload.glsl_block_struct import glsl_parse_struct
 from dnload.glsl_block_uniform import glsl_parse_uniform
+from dnload.glsl_token_cursor import glsl_token_cursor
+
+########################################
+# Globals ##############################
+########################################
+
+# Default parses for global scope first, then parses normally for local scope.
+g_parsers = (
+        glsl_parse_precision,
+        glsl_parse_inout,
+        glsl_parse_struct,
+        glsl_parse_pervertex,
+        glsl_parse_uniform,
+        glsl_parse_function,
+        glsl_parse_declaration,
+        glsl_parse_assignment,
+        )
+
+# Fingerprint of parser sources, cached parse trees are only valid for the same parser.
+g_parser_fingerprint = None
 
 ########################################
 # Functions ############################
@@ -20,34 +45,25 @@ def glsl_parse(source):
 
 def glsl_parse_tokenized(source):
     """Parse tokenized source."""
-    # End of input.
-    if not source:
-        return []
-    # Try default parses for global scope.
-    (block, remaining) = glsl_parse_precision(source)
-    if block:
-        return [block] + glsl_parse_tokenized(remaining)
-    (block, remaining) = glsl_parse_inout(source)
-    if block:
-        return [block] + glsl_parse_tokenized(remaining)
-    (block, remaining) = glsl_parse_struct(source)
-    if block:
-        return [block] + glsl_parse_tokenized(remaining)
-    (block, remaining) = glsl_parse_pervertex(source)
-    if block:
-        return [block] + glsl_parse_tokenized(remaining)
-    (block, remaining) = glsl_parse_uniform(source)
-    if block:
-        return [block] + glsl_parse_tokenized(remaining)
-    (block, remaining) = glsl_parse_function(source)
-    if block:
-        return [block] + glsl_parse_tokenized(remaining)
-    # Try parses normally for local scope.
-    (block, remaining) = glsl_parse_declaration(source)
-    if block:
-        return [block] + glsl_parse_tokenized(remaining)
-    (block, remaining) = glsl_parse_assignment(source)
-    if block:
-        return [block] + glsl_parse_tokenized(remaining)
-    # Fallback, should never happen.
-    return glsl_parse_default(source)
+    source = glsl_token_cursor(source)
+    ret = []
+    # Loop until end of input.
+    while source:
+        for ii in g_parsers:
+            (block, remaining) = ii(source)
+            if block:
+                ret += [block]
+                source = remaining
+                break
+        # Fallback, should never happen.
+        else:
+            return ret + glsl_parse_default(source)
+    return ret
+
+def glsl_parser_fingerprint():
+    """Get fingerprint identifying the GLSL parser and block implementation."""
+    global g_parser_fingerprint
+    if not g_parser_fingerprint:
+        fnames = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "glsl*.py")))
+        g_parser_fingerprint = generate_key(["glsl-parser"] + [file_digest(ii) for ii in fnames])
+    return g_parser_fingerprint
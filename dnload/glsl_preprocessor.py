@@ -0,0 +1,457 @@
+import os
+import re
+
+from dnload.common import is_verbose
+from dnload.common import listify
+
+########################################
+# GlslPreprocessor #####################
+########################################
+
+class GlslPreprocessor:
+    """In-process preprocessor for GLSL sources.
+
+    Handles comments, line continuations, object-like and function-like macros with token pasting, conditionals
+    and includes. Unlike an external preprocessor, works directly on strings."""
+
+    def __init__(self, definitions=None, include_directories=None):
+        """Constructor. Definitions and include directories are copied, later changes by the caller do not apply."""
+        self.__definitions = list(listify(definitions)) if definitions else []
+        self.__include_directories = list(listify(include_directories)) if include_directories else []
+        self.__includes = {}
+        self.__include_paths = {}
+
+    def define(self, macros, op):
+        """Add a macro from the contents of a define directive."""
+        match = re.match(r'^([A-Za-z_]\w*)(\(([^\)]*)\))?(.*)$', op.strip(), re.S)
+        if not match:
+            raise RuntimeError("invalid macro definition '%s'" % (op))
+        params = None
+        if match.group(2):
+            params = [ii.strip() for ii in match.group(3).split(",")]
+            if params == [""]:
+                params = []
+        macros[match.group(1)] = (params, tokenize_preprocessor(match.group(4).strip()))
+
+    def evaluate(self, macros, op):
+        """Evaluate condition of an if or elif directive."""
+        tokens = tokenize_preprocessor(op)
+        # Operator 'defined' is resolved before macro expansion.
+        processed = []
+        ii = 0
+        while ii < len(tokens):
+            vv = tokens[ii]
+            if "defined" == vv:
+                remaining = [jj for jj in tokens[ii + 1:] if not jj.isspace()]
+                if remaining and ("(" == remaining[0]) and (3 <= len(remaining)) and (")" == remaining[2]):
+                    name = remaining[1]
+                    skip = 3
+                elif remaining:
+                    name = remaining[0]
+                    skip = 1
+                else:
+                    raise RuntimeError("operator 'defined' without a macro name in '%s'" % (op))
+                processed += ["1" if name in macros else "0"]
+                # Skip over name and possible parens, whitespace included.
+                while skip:
+                    ii += 1
+                    if not tokens[ii].isspace():
+                        skip -= 1
+                ii += 1
+                continue
+            processed += [vv]
+            ii += 1
+        expanded = self.expand(macros, [(ii, frozenset()) for ii in processed])
+        # Identifiers remaining after macro expansion evaluate to 0.
+        values = []
+        for (text, hideset) in expanded:
+            if text.isspace():
+                continue
+            values += ["0" if re.match(r'^[A-Za-z_]\w*$', text) else text]
+        if not values:
+            raise RuntimeError("empty condition in '%s'" % (op))
+        return 0 != evaluate_expression(values)
+
+    def expand(self, macros, tokens):
+        """Expand macros in a list of (token, hideset) pairs."""
+        ret = []
+        stack = tokens[::-1]
+        while stack:
+            (text, hideset) = stack.pop()
+            macro = macros.get(text)
+            if (not macro) or (text in hideset):
+                ret += [(text, hideset)]
+                continue
+            (params, body) = macro
+            # Object-like macro, rescan replacement along with the rest of input.
+            if params is None:
+                stack += [(ii, hideset | frozenset((text,))) for ii in reversed(body)]
+                continue
+            # Function-like macro without arguments is not expanded.
+            arguments = collect_macro_arguments(stack)
+            if arguments is None:
+                ret += [(text, hideset)]
+                continue
+            (args, rparen_hideset) = arguments
+            if (not params) and (1 == len(args)) and (not [ii for ii in args[0] if not ii[0].isspace()]):
+                args = []
+            if len(args) != len(params):
+                raise RuntimeError("macro '%s' expects %i arguments, got %i" % (text, len(params), len(args)))
+            replacement = self.substitute(macros, params, body, args)
+            hideset = (hideset & rparen_hideset) | frozenset((text,))
+            stack += [(ii, jj | hideset) for (ii, jj) in reversed(replacement)]
+        return ret
+
+    def findInclude(self, directory, op, quoted):
+        """Find include file, searching directory of the including file first for quoted includes."""
+        key = (directory, op, quoted)
+        if key in self.__include_paths:
+            return self.__include_paths[key]
+        ret = None
+        search = self.__include_directories
+        if quoted:
+            search = [directory] + search
+        for ii in search:
+            fname = os.path.normpath(os.path.join(ii, op))
+            if os.path.isfile(fname):
+                ret = fname
+                break
+        self.__include_paths[key] = ret
+        return ret
+
+    def preprocess(self, op):
+        """Preprocess a file, return output."""
+        with open(op, "r") as fd:
+            return self.preprocessSource(fd.read(), op)
+
+    def preprocessSource(self, source, filename):
+        """Preprocess source string read from given file, return output."""
+        macros = {}
+        for ii in self.__definitions:
+            (name, separator, value) = ii.partition("=")
+            self.define(macros, "%s %s" % (name, value if separator else "1"))
+        ret = []
+        self.process(macros, strip_comments(source), filename, ret, 0)
+        return "\n".join(ret)
+
+    def process(self, macros, source, filename, output, depth):
+        """Process comment-stripped source, appending output lines."""
+        conditionals = []
+        active = True
+        text = []
+        for (line_number, line) in enumerate(source.split("\n"), 1):
+            match = re.match(r'^\s*#\s*(\w*)(.*)$', line, re.S)
+            if not match:
+                if active:
+                    text += [line]
+                continue
+            # Directives end text runs, function-like macro invocations may span lines within a run.
+            if text:
+                output += [join_tokens(self.expand(macros, [(ii, frozenset()) for ii in tokenize_preprocessor("\n".join(text))]))]
+                text = []
+            directive = match.group(1)
+            content = match.group(2).strip()
+            if directive in ("if", "ifdef", "ifndef"):
+                condition = False
+                if active:
+                    if "ifdef" == directive:
+                        condition = get_macro_name(directive, content, filename, line_number) in macros
+                    elif "ifndef" == directive:
+                        condition = get_macro_name(directive, content, filename, line_number) not in macros
+                    else:
+                        condition = self.evaluate(macros, content)
+                # Conditional frame: parent active, some group taken, #else seen.
+                conditionals += [[active, condition, False]]
+                active = condition
+                continue
+            if directive in ("elif", "else", "endif"):
+                if not conditionals:
+                    raise RuntimeError("#%s without #if in '%s'" % (directive, filename))
+                (parent_active, taken, seen_else) = conditionals[-1]
+                if "endif" == directive:
+                    conditionals.pop()
+                    active = parent_active
+                    continue
+                if seen_else:
+                    raise RuntimeError("#%s after #else in '%s' line %i" % (directive, filename, line_number))
+                if "else" == directive:
+                    active = parent_active and (not taken)
+                    conditionals[-1][1] = True
+                    conditionals[-1][2] = True
+                else:
+                    active = parent_active and (not taken) and self.evaluate(macros, content)
+                    conditionals[-1][1] = taken or active
+                continue
+            # Other directives only matter in active groups.
+            if not active:
+                continue
+            if "define" == directive:
+                self.define(macros, content)
+            elif "undef" == directive:
+                macros.pop(get_macro_name(directive, content, filename, line_number), None)
+            elif "include" == directive:
+                include = re.match(r'^(\"([^\"]+)\"|<([^>]+)>)', content)
+                if not include:
+                    raise RuntimeError("invalid #include in '%s': %s" % (filename, content))
+                if depth >= 200:
+                    raise RuntimeError("#include nested too deeply in '%s'" % (filename))
+                quoted = bool(include.group(2))
+                name = include.group(2) if quoted else include.group(3)
+                fname = self.findInclude(os.path.dirname(filename), name, quoted)
+                if not fname:
+                    raise RuntimeError("could not find include '%s' from '%s'" % (name, filename))
+                self.process(macros, self.readInclude(fname), fname, output, depth + 1)
+            elif "error" == directive:
+                raise RuntimeError("#error in '%s': %s" % (filename, content))
+            elif directive in ("", "extension", "line", "pragma", "version"):
+                if is_verbose() and directive:
+                    print("WARNING: ignoring #%s in '%s'" % (directive, filename))
+            else:
+                raise RuntimeError("unknown preprocessor directive '#%s' in '%s'" % (directive, filename))
+        if conditionals:
+            raise RuntimeError("unterminated #if in '%s'" % (filename))
+        if text:
+            output += [join_tokens(self.expand(macros, [(ii, frozenset()) for ii in tokenize_preprocessor("\n".join(text))]))]
+
+    def readInclude(self, op):
+        """Read an include file, contents are memoized."""
+        if op not in self.__includes:
+            with open(op, "r") as fd:
+                self.__includes[op] = strip_comments(fd.read())
+        return self.__includes[op]
+
+    def substitute(self, macros, params, body, args):
+        """Substitute arguments into function-like macro body."""
+        ret = []
+        for ii in range(len(body)):
+            vv = body[ii]
+            if vv not in params:
+                ret += [(vv, frozenset())]
+                continue
+            arg = args[params.index(vv)]
+            # Operands of token pasting are not expanded.
+            if ("##" == find_non_space(body, ii, -1)) or ("##" == find_non_space(body, ii, 1)):
+                ret += arg
+            else:
+                ret += self.expand(macros, arg)
+        return paste_tokens(ret)
+
+########################################
+# Globals ##############################
+########################################
+
+g_binary_operators = {
+        "||": 1,
+        "&&": 2,
+        "|": 3,
+        "^": 4,
+        "&": 5,
+        "==": 6,
+        "!=": 6,
+        "<": 7,
+        ">": 7,
+        "<=": 7,
+        ">=": 7,
+        "<<": 8,
+        ">>": 8,
+        "+": 9,
+        "-": 9,
+        "*": 10,
+        "/": 10,
+        "%": 10,
+        }
+
+g_token_regex = re.compile(r'([A-Za-z_]\w*|\.?\d(?:[eEpP][+-]|[\w\.])*|##|<<|>>|<=|>=|==|!=|&&|\|\||\s+|.)', re.S)
+
+########################################
+# Functions ############################
+########################################
+
+def apply_binary_operator(op, lhs, rhs):
+    """Apply binary operator in preprocessor expression."""
+    if op in ("/", "%"):
+        if 0 == rhs:
+            raise RuntimeError("division by zero in preprocessor expression")
+        quotient = abs(lhs) // abs(rhs)
+        if (lhs < 0) != (rhs < 0):
+            quotient = -quotient
+        if "/" == op:
+            return quotient
+        return lhs - quotient * rhs
+    if "||" == op:
+        return int(bool(lhs) or bool(rhs))
+    if "&&" == op:
+        return int(bool(lhs) and bool(rhs))
+    if "|" == op:
+        return lhs | rhs
+    if "^" == op:
+        return lhs ^ rhs
+    if "&" == op:
+        return lhs & rhs
+    if "==" == op:
+        return int(lhs == rhs)
+    if "!=" == op:
+        return int(lhs != rhs)
+    if "<" == op:
+        return int(lhs < rhs)
+    if ">" == op:
+        return int(lhs > rhs)
+    if "<=" == op:
+        return int(lhs <= rhs)
+    if ">=" == op:
+        return int(lhs >= rhs)
+    if "<<" == op:
+        return lhs << rhs
+    if ">>" == op:
+        return lhs >> rhs
+    if "+" == op:
+        return lhs + rhs
+    if "-" == op:
+        return lhs - rhs
+    return lhs * rhs
+
+def collect_macro_arguments(stack):
+    """Collect arguments of function-like macro invocation from reversed token stack.
+
+    Returns None if the next token is not an opening paren, otherwise arguments and hideset of closing paren."""
+    ii = len(stack) - 1
+    while (ii >= 0) and stack[ii][0].isspace():
+        ii -= 1
+    if (ii < 0) or ("(" != stack[ii][0]):
+        return None
+    del stack[ii:]
+    args = [[]]
+    depth = 0
+    while stack:
+        (text, hideset) = stack.pop()
+        if (")" == text) and (0 == depth):
+            return (args, hideset)
+        if ("," == text) and (0 == depth):
+            args += [[]]
+            continue
+        if "(" == text:
+            depth += 1
+        elif ")" == text:
+            depth -= 1
+        args[-1] += [(text, hideset)]
+    raise RuntimeError("unterminated macro invocation")
+
+def evaluate_binary(tokens, position, precedence):
+    """Evaluate binary operators with at least given precedence."""
+    (ret, position) = evaluate_unary(tokens, position)
+    while position < len(tokens):
+        op = tokens[position]
+        op_precedence = g_binary_operators.get(op)
+        if (op_precedence is None) or (op_precedence < precedence):
+            break
+        (rhs, position) = evaluate_binary(tokens, position + 1, op_precedence + 1)
+        ret = apply_binary_operator(op, ret, rhs)
+    return (ret, position)
+
+def evaluate_expression(tokens):
+    """Evaluate preprocessor expression given as a list of tokens."""
+    (ret, position) = evaluate_ternary(tokens, 0)
+    if position != len(tokens):
+        raise RuntimeError("unexpected '%s' in preprocessor expression '%s'" % (tokens[position], " ".join(tokens)))
+    return ret
+
+def evaluate_ternary(tokens, position):
+    """Evaluate ternary operator."""
+    (ret, position) = evaluate_binary(tokens, position, 1)
+    if (position < len(tokens)) and ("?" == tokens[position]):
+        (lhs, position) = evaluate_ternary(tokens, position + 1)
+        if (position >= len(tokens)) or (":" != tokens[position]):
+            raise RuntimeError("expected ':' in preprocessor expression '%s'" % (" ".join(tokens)))
+        (rhs, position) = evaluate_ternary(tokens, position + 1)
+        return (lhs if ret else rhs, position)
+    return (ret, position)
+
+def evaluate_unary(tokens, position):
+    """Evaluate unary operators, parens and numbers."""
+    if position >= len(tokens):
+        raise RuntimeError("unexpected end of preprocessor expression '%s'" % (" ".join(tokens)))
+    op = tokens[position]
+    if "(" == op:
+        (ret, position) = evaluate_ternary(tokens, position + 1)
+        if (position >= len(tokens)) or (")" != tokens[position]):
+            raise RuntimeError("expected ')' in preprocessor expression '%s'" % (" ".join(tokens)))
+        return (ret, position + 1)
+    if op in ("!", "~", "-", "+"):
+        (ret, position) = evaluate_unary(tokens, position + 1)
+        if "!" == op:
+            return (int(not ret), position)
+        if "~" == op:
+            return (~ret, position)
+        if "-" == op:
+            return (-ret, position)
+        return (ret, position)
+    number = re.sub(r'[uUlL]+$', "", op)
+    if re.match(r'^0[0-7]+$', number):
+        return (int(number, 8), position + 1)
+    try:
+        return (int(number, 0), position + 1)
+    except ValueError:
+        raise RuntimeError("invalid token '%s' in preprocessor expression '%s'" % (op, " ".join(tokens)))
+
+def find_non_space(tokens, index, direction):
+    """Find next token that is not whitespace in given direction, return None if not found."""
+    index += direction
+    while (index >= 0) and (index < len(tokens)):
+        if not tokens[index].isspace():
+            return tokens[index]
+        index += direction
+    return None
+
+def get_macro_name(directive, content, filename, line_number):
+    """Get macro name operand of a directive."""
+    operands = content.split()
+    if not operands:
+        raise RuntimeError("no macro name given in #%s in '%s' line %i" % (directive, filename, line_number))
+    return operands[0]
+
+def is_glsl_preprocessor(op):
+    """Tell if given object is an in-process GLSL preprocessor."""
+    return isinstance(op, GlslPreprocessor)
+
+def join_tokens(tokens):
+    """Join (token, hideset) pairs into text. Tokens resulting from macro expansion are separated by spaces."""
+    ret = []
+    previous = None
+    for (text, hideset) in tokens:
+        if previous and (not text.isspace()) and (not previous[0].isspace()) and (hideset or previous[1]):
+            ret += [" "]
+        ret += [text]
+        previous = (text, hideset)
+    return "".join(ret)
+
+def paste_tokens(tokens):
+    """Perform token pasting on a list of (token, hideset) pairs."""
+    ret = []
+    ii = 0
+    while ii < len(tokens):
+        (text, hideset) = tokens[ii]
+        if "##" != text:
+            ret += [(text, hideset)]
+            ii += 1
+            continue
+        # Remove whitespace before the operator and paste with the next token that is not whitespace.
+        while ret and ret[-1][0].isspace():
+            ret.pop()
+        ii += 1
+        while (ii < len(tokens)) and tokens[ii][0].isspace():
+            ii += 1
+        if (not ret) or (ii >= len(tokens)):
+            raise RuntimeError("'##' at either end of macro replacement")
+        (lhs, lhs_hideset) = ret.pop()
+        ret += [(lhs + tokens[ii][0], lhs_hideset | tokens[ii][1])]
+        ii += 1
+    return ret
+
+def strip_comments(source):
+    """Join continued lines and replace comments with whitespace, keeping line count of block comments."""
+    source = source.replace("\\\n", "")
+    return re.sub(r'//[^\n]*|/\*.*?\*/', lambda x: "\n" * x.group(0).count("\n") or " ", source, flags=re.S)
+
+def tokenize_preprocessor(source):
+    """Split source into preprocessing tokens, whitespace included."""
+    return g_token_regex.findall(source)
@@ -0,0 +1,150 @@
+from dnload.glsl_block_assignment import is_glsl_block_assignment
+from dnload.glsl_block_uniform import is_glsl_block_uniform
+from dnload.glsl_name import get_lock_history
+
+########################################
+# GlslScopeIndex #######################
+########################################
+
+class GlslScopeIndex:
+    """Index of names declared and used within one scope, in the order the blocks of the scope appear.
+
+    The index is dropped by the block owning it whenever the contents of the scope change. Names locked by renaming
+    are picked up incrementally from the lock history. If the lock history has been reset, unlocked names are checked
+    individually instead."""
+
+    def __init__(self, scope):
+        """Constructor."""
+        self.__blocks = []
+        self.__positions = {}
+        self.__declared_locked = set()
+        self.__uniforms_locked = set()
+        self.__used_locked = {}
+        self.__unlocked = {}
+        self.__uses = {}
+        self.__assignment_names = []
+        self.__assignments = None
+        self.__lock_history = get_lock_history()
+        self.__lock_count = len(self.__lock_history)
+        self.addBlocks(scope)
+
+    def addBlocks(self, block):
+        """Recursively add children of given block into the index in flattened order."""
+        for ii in block.getChildren():
+            position = len(self.__blocks)
+            self.__blocks += [ii]
+            self.__positions.setdefault(id(ii), position)
+            uniform = is_glsl_block_uniform(ii)
+            for jj in ii.getDeclaredNames():
+                self.addName(jj, position, True, uniform)
+            for jj in ii.getUsedNames():
+                self.addName(jj, position, False, False)
+                uses = self.__uses.setdefault(id(jj), [])
+                if (not uses) or (uses[-1] != position):
+                    uses += [position]
+            if is_glsl_block_assignment(ii):
+                self.__assignment_names += [(position, ii.getName())]
+            self.addBlocks(ii)
+
+    def addLockedName(self, name, position, declared, uniform):
+        """Add a locked name into the index."""
+        resolved = name.resolveName()
+        if declared:
+            self.__declared_locked.add(resolved)
+            if uniform:
+                self.__uniforms_locked.add(resolved)
+        else:
+            self.__used_locked[resolved] = max(position, self.__used_locked.get(resolved, -1))
+
+    def addName(self, name, position, declared, uniform):
+        """Add a name into the index, unlocked names are only added once they are locked."""
+        if name.isLocked():
+            self.addLockedName(name, position, declared, uniform)
+        else:
+            self.__unlocked.setdefault(id(name), []).append((name, position, declared, uniform))
+
+    def getAssignments(self, op):
+        """Get positions of assignments into given resolved name."""
+        if self.__assignments is None:
+            self.__assignments = {}
+            for (position, name) in self.__assignment_names:
+                self.__assignments.setdefault(name.resolveName(), []).append(position)
+        return self.__assignments.get(op, [])
+
+    def getUsers(self, names):
+        """Get blocks using any of given exact name objects, in flattened order."""
+        positions = set()
+        for ii in names:
+            positions.update(self.__uses.get(id(ii), []))
+        return [self.__blocks[ii] for ii in sorted(positions)]
+
+    def hasInlineConflict(self, block, names, comparison):
+        """Tell if given name is assigned into after block and before all given names have been used."""
+        position = self.__positions.get(id(block))
+        if (position is None) or (not names):
+            return False
+        self.update()
+        uses = []
+        for ii in names:
+            uses += self.__uses.get(id(ii), [])
+        # Inlining is safe after the position where the last use is found.
+        last_use = None
+        if len(uses) >= len(names):
+            last_use = sorted(uses)[len(names) - 1]
+        for ii in self.getAssignments(comparison.resolveName()):
+            if (last_use is not None) and (ii >= last_use):
+                break
+            if ii >= position:
+                return True
+        return False
+
+    def hasLockedUniform(self, op):
+        """Tell if a uniform declaring given locked name exists in the scope."""
+        self.update()
+        return op in self.__uniforms_locked
+
+    def hasNameConflict(self, block, op):
+        """Tell if given locked name is declared anywhere in the scope or used at or after given block."""
+        self.update()
+        if op in self.__declared_locked:
+            return True
+        position = self.__positions.get(id(block))
+        if position is None:
+            return False
+        return self.__used_locked.get(op, -1) >= position
+
+    def update(self):
+        """Update index with names locked since last update."""
+        history = get_lock_history()
+        if history is not self.__lock_history:
+            self.__lock_history = history
+            self.__lock_count = 0
+            for ii in [jj[0][0] for jj in self.__unlocked.values() if jj[0][0].isLocked()]:
+                self.updateLocked(ii)
+        if self.__lock_count >= len(history):
+            return
+        for ii in history[self.__lock_count:]:
+            self.updateLocked(ii)
+        self.__lock_count = len(history)
+
+    def updateLocked(self, op):
+        """Move entries of given name that has been locked from unlocked names into locked names."""
+        entries = self.__unlocked.pop(id(op), None)
+        if not entries:
+            return
+        for (name, position, declared, uniform) in entries:
+            self.addLockedName(name, position, declared, uniform)
+        # Assignments are keyed by resolved name.
+        self.__assignments = None
+
+########################################
+# Functions ############################
+########################################
+
+def get_scope_index(block):
+    """Get scope index for given block, creating it if necessary."""
+    ret = block.getScopeIndex()
+    if not ret:
+        ret = GlslScopeIndex(block)
+        block.setScopeIndex(ret)
+    return ret
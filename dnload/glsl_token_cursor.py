@@ -0,0 +1,71 @@
+########################################
+# GlslTokenCursor ######################
+########################################
+
+class GlslTokenCursor:
+    """Read-only view into a shared token list.
+
+    Slicing a cursor creates another view into the same list without copying tokens. Cursors are never modified,
+    so a cursor doubles as a backtracking mark: a parser that fails just returns the cursor it was given."""
+
+    def __init__(self, tokens, start=0, end=None):
+        """Constructor."""
+        self.__tokens = tokens
+        self.__start = start
+        self.__end = len(tokens) if end is None else end
+
+    def advance(self, count):
+        """Get cursor positioned given number of tokens forward."""
+        return GlslTokenCursor(self.__tokens, min(self.__start + count, self.__end), self.__end)
+
+    def toList(self):
+        """Get tokens in the view as a new list."""
+        return self.__tokens[self.__start:self.__end]
+
+    def __add__(self, other):
+        """Concatenation operator, produces a list."""
+        return self.toList() + list(other)
+
+    def __getitem__(self, key):
+        """Index or slice operator. Slices are views into the same token list."""
+        length = self.__end - self.__start
+        if isinstance(key, slice):
+            (start, end, step) = key.indices(length)
+            if 1 != step:
+                return self.toList()[key]
+            return GlslTokenCursor(self.__tokens, self.__start + start, self.__start + max(start, end))
+        if key < 0:
+            key += length
+        if (key < 0) or (key >= length):
+            raise IndexError("token cursor index out of range")
+        return self.__tokens[self.__start + key]
+
+    def __iter__(self):
+        """Iterate over tokens in the view."""
+        return map(self.__tokens.__getitem__, range(self.__start, self.__end))
+
+    def __len__(self):
+        """Number of tokens in the view."""
+        return self.__end - self.__start
+
+    def __radd__(self, other):
+        """Reflected concatenation operator, produces a list."""
+        return list(other) + self.toList()
+
+    def __str__(self):
+        """String representation."""
+        return "GlslTokenCursor(%i, %i)" % (self.__start, self.__end)
+
+########################################
+# Functions ############################
+########################################
+
+def glsl_token_cursor(op):
+    """Get a token cursor for given token list or cursor."""
+    if is_glsl_token_cursor(op):
+        return op
+    return GlslTokenCursor(op)
+
+def is_glsl_token_cursor(op):
+    """Tell if given object is a token cursor."""
+    return isinstance(op, GlslTokenCursor)
@@ -8,15 +8,27 @@ from dnload.symbol import Symbol
 class LibraryDefinition:
     """Represents one library containing symbols."""
 
-    def __init__(self, name, symbols=[]):
+    def __init__(self, name, symbols=[], headers=[]):
         """Constructor."""
         self.__name = name
+        self.__headers = []
         self.__symbols = []
+        self.__symbol_names = {}
+        self.add_headers(headers)
         self.add_symbols(symbols)
 
+    def add_headers(self, lst):
+        """Add headers declaring symbols."""
+        for ii in lst:
+            if ii not in self.__headers:
+                self.__headers += [ii]
+
     def add_symbol(self, sym):
         """Add single symbol."""
         self.__symbols += [sym]
+        # First symbol with a name is the one found.
+        if sym.get_name() not in self.__symbol_names:
+            self.__symbol_names[sym.get_name()] = sym
 
     def add_symbols(self, lst):
         """Add a symbol listing."""
@@ -25,20 +37,111 @@ class LibraryDefinition:
 
     def find_symbol(self, op):
         """Find a symbol by name."""
-        for ii in self.__symbols:
-            if ii.get_name() == op:
-                return ii
-        return None
+        return self.__symbol_names.get(op)
+
+    def get_headers(self):
+        """Accessor."""
+        return self.__headers
 
     def get_name(self):
         """Accessor."""
         return str(self.__name)
 
+########################################
+# LibraryDefinitionRegistry ############
+########################################
+
+class LibraryDefinitionRegistry:
+    """Library definitions indexed by symbol name.
+
+    Library definitions are created from their tables only when a symbol is first looked up from them. Symbols not
+    in any table may be looked up from a generated definition database."""
+
+    def __init__(self, tables):
+        """Constructor."""
+        self.__tables = list(tables)
+        self.__definitions = [None] * len(tables)
+        self.__definition_database = None
+        self.__symbol_index = None
+
+    def add_library_definition(self, op):
+        """Add a library definition not present in tables."""
+        self.__tables += [(op.get_name(), ())]
+        self.__definitions += [op]
+
+    def find_library_definition(self, op):
+        """Find library definition with name, return None if not found."""
+        # Library names may depend on platform, so they are resolved on every call.
+        for (idx, ii) in enumerate(self.__tables):
+            if str(ii[0]) == op:
+                return self.get_library_definition(idx)
+        return None
+
+    def find_symbol(self, op):
+        """Find a symbol by name, return None if not found."""
+        idx = self.get_symbol_index().get(op)
+        if idx is not None:
+            return self.get_library_definition(idx).find_symbol(op)
+        return self.find_symbol_generated(op)
+
+    def find_symbol_generated(self, op):
+        """Find a symbol from generated definitions, return None if not found."""
+        if not self.__definition_database:
+            return None
+        found = self.__definition_database.find(op)
+        if not found:
+            return None
+        (library, headers, definition) = found
+        lib = self.find_library_definition(library)
+        if not lib:
+            lib = LibraryDefinition(library)
+            self.add_library_definition(lib)
+        ret = lib.find_symbol(op)
+        if not ret:
+            lib.add_headers(headers)
+            lib.add_symbols([definition])
+            ret = lib.find_symbol(op)
+        return ret
+
+    def get_library_definition(self, op):
+        """Get library definition at given index, creating it on first use."""
+        ret = self.__definitions[op]
+        if not ret:
+            (name, symbols) = self.__tables[op]
+            ret = LibraryDefinition(name, symbols)
+            self.__definitions[op] = ret
+        return ret
+
+    def get_symbol_index(self):
+        """Get mapping from symbol names to library indices, building it on first use."""
+        if self.__symbol_index is None:
+            self.__symbol_index = {}
+            # Symbols defined in earlier libraries take precedence.
+            for (idx, ii) in enumerate(self.__tables):
+                for jj in ii[1]:
+                    name = jj[1][0] if isinstance(jj[1], (list, tuple)) else jj[1]
+                    if name not in self.__symbol_index:
+                        self.__symbol_index[name] = idx
+        return self.__symbol_index
+
+    def set_definition_database(self, op):
+        """Set generated definition database to fall back to."""
+        self.__definition_database = op
+
+    def __iter__(self):
+        """Iterate over all library definitions."""
+        for ii in range(len(self.__tables)):
+            yield self.get_library_definition(ii)
+
+    def __len__(self):
+        """Number of libraries."""
+        return len(self.__tables)
+
 ########################################
 # Globals ##############################
 ########################################
 
-g_library_definition_c = LibraryDefinition("c", (
+g_library_table_c = ("c", (
     ("int", "fclose", "FILE*"),
     ("FILE*", "fopen", "const char*", "const char*"),
     ("void", "free", "void*"),
@@ -58,7 +161,7 @@ g_library_definition_c = LibraryDefinition("c", (
     ("void", "srandom", "unsigned int"),
     ))
 
-g_library_definition_bcm_host = LibraryDefinition("bcm_host", (
+g_library_table_bcm_host = ("bcm_host", (
     ("void", "bcm_host_deinit"),
     ("void", "bcm_host_init"),
     ("DISPMANX_DISPLAY_HANDLE_T", "vc_dispmanx_display_open", "uint32_t"),
@@ -68,7 +171,7 @@ g_library_definition_bcm_host = LibraryDefinition("bcm_host", (
     ("int32_t", "graphics_get_display_size", "const uint16_t", "uint32_t*", "uint32_t*"),
     ))
 
-g_library_definition_egl = LibraryDefinition("EGL", (
+g_library_table_egl = ("EGL", (
     ("EGLBoolean", "eglChooseConfig", "EGLDisplay", "EGLint const*", "EGLConfig*", "EGLint", "EGLint*"),
     ("EGLContext", "eglCreateContext", "EGLDisplay", "EGLConfig", "EGLContext", "EGLint const*"),
     ("EGLSurface", "eglCreateWindowSurface", "EGLDisplay", "EGLConfig", "EGLNativeWindowType", "EGLint const*"),
@@ -80,7 +183,7 @@ g_library_definition_egl = LibraryDefinition("EGL", (
     ("EGLBoolean", "eglTerminate", "EGLDisplay"),
     ))
 
-g_library_definition_fftw = LibraryDefinition("fftw3", (
+g_library_table_fftw = ("fftw3", (
     ("void", "fftw_cleanup"),
     ("void", "fftw_destroy_plan", "fftw_plan"),
     ("void", "fftw_execute", "const fftw_plan"),
@@ -90,7 +193,7 @@ g_library_definition_fftw = LibraryDefinition("fftw3", (
     ("fftw_plan", "fftw_plan_r2r_1d", "int", "double*", "double*", "fftw_r2r_kind", "unsigned"),
     ))
 
-g_library_definition_freetype = LibraryDefinition("freetype", (
+g_library_table_freetype = ("freetype", (
     ("FT_UInt", "FT_Get_Char_Index", "FT_Face", "FT_ULong"),
     ("FT_Error", "FT_Get_Kerning", "FT_Face", "FT_UInt", "FT_UInt", "FT_UInt", "FT_Vector*"),
     ("FT_Error", "FT_Init_FreeType", "FT_Library*"),
@@ -100,7 +203,7 @@ g_library_definition_freetype = LibraryDefinition("freetype", (
     ("FT_Error", "FT_Set_Pixel_Sizes", "FT_Face", "FT_UInt", "FT_UInt"),
     ))
 
-g_library_definition_gl = LibraryDefinition(PlatformVar("gl_library"), (
+g_library_table_gl = (PlatformVar("gl_library"), (
     ("void", "glActiveTexture", "GLenum"),
     ("void", "glAttachShader", "GLuint", "GLuint"),
     ("void", "glBindBuffer", "GLenum", "GLuint"),
@@ -230,11 +333,11 @@ g_library_definition_gl = LibraryDefinition(PlatformVar("gl_library"), (
     ("void", "glViewport", "GLint", "GLint", "GLsizei", "GLsizei"),
     ))
 
-g_library_definition_glu = LibraryDefinition("GLU", (
+g_library_table_glu = ("GLU", (
     ("GLint", "gluBuild3DMipmaps", "GLenum", "GLint", "GLsizei", "GLsizei", "GLsizei", "GLenum", "GLenum", "const void*"),
     ))
 
-g_library_definition_m = LibraryDefinition("m", (
+g_library_table_m = ("m", (
     ("double", "acos", "double"),
     ("float", "acosf", "float"),
     ("double", "asin", "double"),
@@ -265,7 +368,7 @@ g_library_definition_m = LibraryDefinition("m", (
     ("float", "tanhf", "float"),
     ))
 
-g_library_definition_ncurses = LibraryDefinition("ncurses", (
+g_library_table_ncurses = ("ncurses", (
     ("NCURSES_EXPORT(int)", "addch", "const chtype"),
     ("NCURSES_EXPORT(int)", "chgat", "int", "attr_t", "NCURSES_PAIRS_T", "const void*"),
     ("NCURSES_EXPORT(int)", "curs_set", "int"),
@@ -284,7 +387,7 @@ g_library_definition_ncurses = LibraryDefinition("ncurses", (
     ("NCURSES_EXPORT(int)", "wmove", "WINDOW*", "int", "int"),
     ))
 
-g_library_definition_ogg = LibraryDefinition("ogg", (
+g_library_table_ogg = ("ogg", (
     ("int", "ogg_page_serialno", "ogg_page*"),
     ("int", "ogg_stream_init", "ogg_stream_state*", "int"),
     ("int", "ogg_stream_pagein", "ogg_stream_state*", "ogg_page*"),
@@ -294,19 +397,19 @@ g_library_definition_ogg = LibraryDefinition("ogg", (
     ("int", "ogg_sync_pageout", "ogg_sync_state*", "ogg_page*"),
     ))
 
-g_library_definition_opus = LibraryDefinition("opus", (
+g_library_table_opus = ("opus", (
     ("OpusDecoder*", "opus_decoder_create", "opus_int32", "int", "int*"),
     ("int", "opus_decoder_init", "OpusDecoder*", "opus_int32", "int"),
     ("int", "opus_decode_float", "OpusDecoder*", "const unsigned char*", "opus_int32", "float*", "int", "int"),
     ))
 
-g_library_definition_opusfile = LibraryDefinition("opusfile", (
+g_library_table_opusfile = ("opusfile", (
     ("void", "op_free", "OggOpusFile*"),
     ("OggOpusFile*", "op_open_memory", "const unsigned char*", "size_t", "int*"),
     ("int", "op_read_float", "OggOpusFile*", "float*", "int", "int*"),
     ))
 
-g_library_definition_png = LibraryDefinition("png", (
+g_library_table_png = ("png", (
     ("png_infop", "png_create_info_struct", "png_const_structrp"),
     ("png_structp", "png_create_read_struct", "png_const_charp", "png_voidp", "png_error_ptr", "png_error_ptr"),
     ("png_uint_32", "png_get_IHDR", "png_const_structrp", "png_const_inforp", "png_uint_32*", "png_uint_32*", "int*", "int*", "int*", "int*", "int*"),
@@ -318,7 +421,7 @@ g_library_definition_png = LibraryDefinition("png", (
     ("void", "png_set_tRNS_to_alpha", "png_structrp"),
     ))
 
-g_library_definition_sdl = LibraryDefinition("SDL", (
+g_library_table_sdl = ("SDL", (
     ("SDL_cond*", "SDL_CreateCond"),
     ("SDL_mutex*", "SDL_CreateMutex"),
     ("SDL_Thread*", "SDL_CreateThread", "int (*)(void*)", "void*"),
@@ -346,7 +449,7 @@ g_library_definition_sdl = LibraryDefinition("SDL", (
     ("void", "SDL_WaitThread", "SDL_Thread*", "int*"),
     ))
 
-g_library_definition_sdl2 = LibraryDefinition("SDL2", (
+g_library_table_sdl2 = ("SDL2", (
     ("SDL_Renderer*", "SDL_CreateRenderer", "SDL_Window*", "int", "Uint32"),
     ("SDL_Thread*", "SDL_CreateThread", "int (*)(void*)", "const char*", "void*"),
     ("SDL_Window*", "SDL_CreateWindow", "const char*", "int", "int", "int", "int", "Uint32"),
@@ -360,27 +463,29 @@ g_library_definition_sdl2 = LibraryDefinition("SDL2", (
     ("int", "SDL_UnlockMutex", "SDL_mutex*"),
     ))
 
-g_library_definition_sndfile = LibraryDefinition("sndfile", (
+g_library_table_sndfile = ("sndfile", (
     ("int", "sf_close", "SNDFILE*"),
     ("SNDFILE*", "sf_open", "const char*", "int", "SF_INFO*"),
     ("sf_count_t", "sf_writef_float", "SNDFILE*", "const float*", "sf_count_t"),
     ))
 
-g_library_definitions = (
-    g_library_definition_c,
-    g_library_definition_bcm_host,
-    g_library_definition_egl,
-    g_library_definition_fftw,
-    g_library_definition_freetype,
-    g_library_definition_gl,
-    g_library_definition_glu,
-    g_library_definition_m,
-    g_library_definition_ncurses,
-    g_library_definition_ogg,
-    g_library_definition_opusfile,
-    g_library_definition_opus,
-    g_library_definition_png,
-    g_library_definition_sdl,
-    g_library_definition_sdl2,
-    g_library_definition_sndfile,
+g_library_tables = (
+    g_library_table_c,
+    g_library_table_bcm_host,
+    g_library_table_egl,
+    g_library_table_fftw,
+    g_library_table_freetype,
+    g_library_table_gl,
+    g_library_table_glu,
+    g_library_table_m,
+    g_library_table_ncurses,
+    g_library_table_ogg,
+    g_library_table_opusfile,
+    g_library_table_opus,
+    g_library_table_png,
+    g_library_table_sdl,
+    g_library_table_sdl2,
+    g_library_table_sndfile,
     )
+
+g_library_definitions = LibraryDefinitionRegistry(g_library_tables)
@@ -0,0 +1,189 @@
+import json
+import os
+
+from dnload.cache import generate_key
+from dnload.cache import get_cache
+from dnload.common import is_verbose
+from dnload.common import listify
+from dnload.common import parallel_map
+from dnload.elf_file import ElfFile
+from dnload.elf_file import SHN_UNDEF
+from dnload.elf_file import SHT_GNU_HASH
+from dnload.symbol_hash import generate_symbol_hash_variants
+from dnload.symbol_hash import get_symbol_hash
+from dnload.symbol_hash import hash_names
+
+########################################
+# LibraryHashIndex #####################
+########################################
+
+class LibraryHashIndex:
+    """Hashes of all names in the dynamic symbol table of a shared object.
+
+    Only the first symbol with any given hash is stored, since that is what the import by hash loader would find."""
+
+    def __init__(self, filename, needed, lst):
+        """Constructor."""
+        self.__filename = filename
+        self.__needed = needed
+        self.__entries = []
+        self.__hashes = {}
+        for (hash_value, name, defined) in lst:
+            if hash_value not in self.__hashes:
+                self.__entries += [[hash_value, name, defined]]
+                self.__hashes[hash_value] = (name, defined)
+
+    def find(self, op):
+        """Find name and definition status of first symbol with given hash, return None if not found."""
+        return self.__hashes.get(op)
+
+    def get_entries(self):
+        """Get stored (hash, name, defined) entries in symbol table order."""
+        return self.__entries
+
+    def get_filename(self):
+        """Accessor."""
+        return self.__filename
+
+    def get_needed(self):
+        """Accessor."""
+        return self.__needed
+
+    def reduce(self, op):
+        """Get index of hashes reduced with given hash function."""
+        lst = [(op.reduce(ii[0]), ii[1], ii[2]) for ii in self.__entries]
+        return LibraryHashIndex(self.__filename, self.__needed, lst)
+
+    def __len__(self):
+        """Number of distinct hashes."""
+        return len(self.__hashes)
+
+########################################
+# Functions ############################
+########################################
+
+def collect_hash_indexes(libraries, linker, hash_function):
+    """Collect hash indexes of shared objects in the order the dynamic linker would load them in."""
+    directories = linker.get_library_directories()
+    queue = []
+    for ii in libraries:
+        queue += listify(linker.get_library_name(ii))
+    ret = []
+    seen = set()
+    # Dependencies are loaded breadth-first.
+    while queue:
+        name = queue.pop(0)
+        if name in seen:
+            continue
+        seen.add(name)
+        fname = find_library_file(name, directories)
+        if not fname:
+            if is_verbose():
+                print("Could not find shared object '%s' to verify hashes against." % (name))
+            continue
+        index = get_library_hash_index(fname, hash_function)
+        ret += [index]
+        queue += index.get_needed()
+    return ret
+
+def find_hash_collisions(names, indexes, hash_function):
+    """Find names the import by hash loader would resolve to a wrong address from shared objects in given order.
+
+    Returns a listing of (symbol name, shared object, name found instead) tuples."""
+    ret = []
+    hash_function = get_symbol_hash(hash_function)
+    for (name, hash_value) in zip(names, hash_names(names, hash_function)):
+        for ii in indexes:
+            found = ii.find(hash_function.compare(hash_value))
+            if not found:
+                continue
+            # Undefined symbols resolve to the base address of the object.
+            if (found[0] != name) or (not found[1]):
+                ret += [(name, ii.get_filename(), found[0])]
+            break
+    return ret
+
+def find_library_file(op, directories):
+    """Find shared object file from library directories, return None if not found."""
+    if op.startswith("/"):
+        return op if os.path.isfile(op) else None
+    for ii in directories:
+        fname = os.path.join(ii, op)
+        if os.path.isfile(fname):
+            return os.path.realpath(fname)
+    return None
+
+def find_symbol_hash_variants(names, libraries, linker, hash_function):
+    """Find reduced variants of a full hash function that load all given names correctly."""
+    indexes = collect_hash_indexes(libraries, linker, hash_function)
+    ret = []
+    for ii in generate_symbol_hash_variants(hash_function):
+        if not find_hash_collisions(names, [jj.reduce(ii) for jj in indexes], ii):
+            ret += [ii]
+    return ret
+
+def get_library_hash_index(op, hash_function):
+    """Get hash index for a shared object, reading it from the cache if the file has not changed."""
+    hash_function = get_symbol_hash(hash_function)
+    base = hash_function.get_base()
+    if base is not hash_function:
+        return get_library_hash_index(op, base).reduce(hash_function)
+    cache = get_cache()
+    if not cache:
+        return read_library_hash_index(op, hash_function)
+    st = os.stat(op)
+    key = generate_key(["library-hash-index", str(hash_function), os.path.realpath(op), st.st_dev, st.st_ino,
+                        st.st_mtime_ns])
+    entry = cache.get(key)
+    if entry:
+        data = json.loads(cache.get_blob(entry, "index").decode())
+        return LibraryHashIndex(op, data["needed"], data["hashes"])
+    ret = read_library_hash_index(op, hash_function)
+    data = {"needed": ret.get_needed(), "hashes": ret.get_entries()}
+    cache.put(key, {"index": json.dumps(data).encode()})
+    return ret
+
+def read_library_hash_index(op, hash_function):
+    """Read dynamic symbols of a shared object and hash them."""
+    hash_function = get_symbol_hash(hash_function)
+    gnu = ("gnu" == hash_function.get_name())
+    with ElfFile(op) as elf:
+        needed = elf.get_needed()
+        symbols = elf.get_dynamic_symbols()
+        if gnu and (not [ii for ii in elf.get_sections() if SHT_GNU_HASH == ii["type"]]):
+            raise RuntimeError("shared object '%s' has no GNU hash table" % (op))
+    # The symbol table loader also scans the null symbol, which has an empty name. GNU hash tables only contain
+    # defined symbols.
+    names = []
+    defined = []
+    if not gnu:
+        names += [""]
+        defined += [False]
+    for ii in symbols:
+        if gnu and (SHN_UNDEF == ii["shndx"]):
+            continue
+        names += [ii["name"]]
+        defined += [SHN_UNDEF != ii["shndx"]]
+    hashes = [hash_function.compare(ii) for ii in hash_names(names, hash_function)]
+    if is_verbose():
+        print("Hashed %i dynamic symbols of '%s'." % (len(symbols), op))
+    return LibraryHashIndex(op, needed, zip(hashes, names, defined))
+
+def search_symbol_hash(names, libraries, linker, hash_functions):
+    """Search the hash function with fewest bits that loads all given names correctly.
+
+    Full hash functions are searched in parallel. Ties are resolved in favor of truncation over folding and then in
+    favor of hash functions given earlier."""
+    count = len(hash_functions)
+    found = parallel_map(find_symbol_hash_variants, [names] * count, [libraries] * count, [linker] * count, hash_functions)
+    ret = None
+    best = None
+    for (ii, variants) in enumerate(found):
+        for jj in variants:
+            cost = (jj.get_bits(), jj.is_fold(), ii)
+            if (best is None) or (cost < best):
+                ret = jj
+                best = cost
+    if not ret:
+        raise RuntimeError("no hash function found to load symbols by hash without collisions")
+    return ret
@@ -1,6 +1,9 @@
 import os
 import re
 
+from dnload.cache import file_digest
+from dnload.cache import run_command_cached
+from dnload.cache import tool_digest
 from dnload.common import file_is_ascii_text
 from dnload.common import is_listing
 from dnload.common import is_verbose
@@ -40,6 +43,16 @@ class Linker:
         """Check if command basename starts with given string."""
         return self.__command_basename.startswith(op)
 
+    def generate_binary_key_parts(self, objcopy):
+        """Generate listing of strings identifying binaries linked with given objcopy for cache keys."""
+        ret = [tool_digest(self.__command), str(PlatformVar("entry"))] + self.__linker_flags_extra
+        if self.__linker_script:
+            script = self.__linker_script[1]
+            ret += ["script:%s" % (file_digest(script) if os.path.isfile(script) else script)]
+        if objcopy:
+            ret += ["objcopy:%s" % (tool_digest(objcopy))]
+        return ret
+
     def generate_linker_flags(self):
         """Generate linker command for given mode."""
         self.__linker_flags = []
@@ -75,6 +88,10 @@ class Linker:
             ret += [prefix + ii]
         return ret
 
+    def get_library_directories(self):
+        """Accessor."""
+        return self.__library_directories
+
     def get_library_directory_list(self):
         """Set link directory listing."""
         ret = []
@@ -121,7 +138,7 @@ class Linker:
 
     def generate_linker_script(self, dst, modify_start=False):
         """Get linker script from linker, improve it, write improved linker script to given file."""
-        (so, se) = run_command([self.__command, "--verbose"] + self.__linker_flags_extra)
+        (so, se) = run_command_cached([self.__command, "--verbose"] + self.__linker_flags_extra)
         if 0 < len(se) and is_verbose():
             print(se)
         # Linker script is the block of code between lines of multiple '=':s.
@@ -190,12 +207,12 @@ class Linker:
             cmd += ["--oformat=binary"]
         cmd += ["-o", ld_target]
         # Run linker command.
-        (so, se) = run_command(cmd)
+        (so, se) = run_command_cached(cmd, listify(src) + self.__linker_script[1:], [ld_target])
         if 0 < len(se) and is_verbose():
             print(se)
         # Only run objcopy commad if it was required.
         if objcopy:
-            (so_add, se) = run_command(objcopy_cmd)
+            (so_add, se) = run_command_cached(objcopy_cmd, [dst_bin], [dst])
             if 0 < len(se) and is_verbose():
                 print(se)
             so += so_add
@@ -0,0 +1,299 @@
+import concurrent.futures
+import itertools
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from dnload.common import get_job_count
+from dnload.common import is_verbose
+from dnload.common import locate
+
+########################################
+# Globals ##############################
+########################################
+
+SEARCH_PATH_OPTIONS = ("cache_dir", "include_directory", "library_directory", "output_file", "search_path", "temporary_directory")
+SEARCH_EXECUTABLE_OPTIONS = ("assembler", "compiler", "linker", "objcopy", "preprocessor", "strip_binary")
+
+# Options passed on to variant builds, by how they are written on the command line.
+SEARCH_FLAG_OPTIONS = ("elfling", "linux", "m32", "nice_exit", "nice_filedump", "no_cache", "no_dead_code", "no_direct_link", "no_peephole", "preprocess_only", "search_section_order", "verbatim", "verbose")
+SEARCH_LIST_OPTIONS = ("define", "include_directory", "library", "library_directory", "library_header", "rpath", "search_path")
+SEARCH_MULTIPLE_OPTIONS = ("output_file",)
+SEARCH_VALUE_OPTIONS = ("abstraction_layer", "assembler", "cache_dir", "call_prefix", "compiler", "definition_ld", "filedrop_mode", "function_order", "gles", "glsl_inlines", "glsl_mode", "glsl_preprocessor", "glsl_renames", "glsl_simplifys", "hash_function", "interp", "jobs", "linker", "march", "merge_headers", "method", "objcopy", "operating_system", "preprocessor", "rand", "strip_binary", "symbol_order", "symtab_mode", "target", "temporary_directory", "unpack_header")
+
+# Options not passed on to variant builds.
+SEARCH_IGNORED_OPTIONS = ("help", "search", "search_run", "search_symbol_order", "source", "version")
+
+# Option strings differing from the option name.
+SEARCH_OPTION_STRINGS = {"m32": "--32"}
+
+# Time in seconds a variant binary may run before it is considered working and terminated.
+SEARCH_RUN_TIMEOUT = 2.0
+
+# Dnload binaries exit through a debugger trap unless built otherwise.
+SIGTRAP = 5
+
+########################################
+# SearchVariant ########################
+########################################
+
+class SearchVariant:
+    """One combination of build options to try."""
+
+    def __init__(self, options):
+        """Constructor."""
+        self.__options = options
+        self.__directory = None
+        self.__error = None
+        self.__output = None
+        self.__size = None
+        self.__time = None
+
+    def generate_command_line(self, parser, args, target, output_basename):
+        """Generate command line to build this variant."""
+        # Variants are already built concurrently, each one runs its own stages in one job.
+        overrides = {"jobs": 1, "output_file": [output_basename], "search_path": [], "target": target, "temporary_directory": "."}
+        overrides.update(self.__options)
+        return generate_command_line(parser, args, overrides)
+
+    def check(self):
+        """Run built binary, keep it only if it ran to completion or was still running at timeout."""
+        # Self-extracting binaries have no interpreter line, they are executed by the shell.
+        proc = subprocess.Popen(["/bin/sh", self.__output], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=self.__directory)
+        try:
+            returncode = proc.wait(timeout=SEARCH_RUN_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            return self
+        if not is_clean_exit(returncode):
+            self.__error = "binary exited with %i" % (returncode)
+            self.__output = None
+            self.__size = None
+        if is_verbose():
+            print("Search variant %s: %s" % (self.get_option_string(), "ran" if self.__size else self.__error))
+        return self
+
+    def get_compile_group(self):
+        """Get options that affect the compiled assembler source."""
+        return (self.__options.get("hash_function"), self.__options.get("symtab_mode"))
+
+    def get_directory(self):
+        """Accessor."""
+        return self.__directory
+
+    def get_error(self):
+        """Accessor."""
+        return self.__error
+
+    def get_option_string(self):
+        """Get a human-readable representation of the options of this variant."""
+        ret = []
+        for ii in sorted(self.__options.keys()):
+            ret += ["--%s=%s" % (ii.replace("_", "-"), self.__options[ii])]
+        return " ".join(ret)
+
+    def get_options(self):
+        """Accessor."""
+        return self.__options
+
+    def get_output(self):
+        """Accessor."""
+        return self.__output
+
+    def get_size(self):
+        """Accessor."""
+        return self.__size
+
+    def get_time(self):
+        """Accessor."""
+        return self.__time
+
+    def run(self, parser, args, source_directories, target, output_basename, work_directory):
+        """Build this variant in an isolated directory."""
+        self.__directory = tempfile.mkdtemp(prefix="search_", dir=work_directory)
+        # Sources are copied so the generated header and GLSL headers next to them are private to this variant.
+        for ii in source_directories:
+            for jj in os.listdir(ii):
+                fname = os.path.join(ii, jj)
+                if os.path.isfile(fname):
+                    shutil.copy2(fname, self.__directory)
+        with open(os.path.join(self.__directory, target), "w") as fd:
+            fd.write("\n")
+        cmd = self.generate_command_line(parser, args, target, output_basename)
+        # Run as a module so the variant works no matter how dnload was started.
+        package_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join([package_path] + list(filter(None, [env.get("PYTHONPATH")])))
+        start_time = time.time()
+        proc = subprocess.Popen([sys.executable, "-m", "dnload"] + cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=self.__directory, env=env)
+        (proc_stdout, proc_stderr) = proc.communicate()
+        self.__time = time.time() - start_time
+        output = os.path.join(self.__directory, output_basename)
+        if (0 == proc.returncode) and os.path.isfile(output):
+            self.__output = output
+            self.__size = os.path.getsize(output)
+        else:
+            lines = (proc_stderr.decode() + proc_stdout.decode()).strip().split("\n")
+            self.__error = lines[-1] if lines else "exit code %i" % (proc.returncode)
+        if is_verbose():
+            print("Search variant %s: %s" % (self.get_option_string(), str(self.__size) if self.__size else self.__error))
+        return self
+
+    def __lt__(lhs, rhs):
+        """Comparison operator, working variants first, smallest first."""
+        if lhs.__size is None:
+            if rhs.__size is None:
+                return lhs.get_option_string() < rhs.get_option_string()
+            return False
+        if rhs.__size is None:
+            return True
+        return (lhs.__size, lhs.__time) < (rhs.__size, rhs.__time)
+
+########################################
+# Functions ############################
+########################################
+
+def generate_command_line(parser, args, overrides):
+    """Generate command line equivalent to parsed arguments, with given overrides."""
+    known = SEARCH_FLAG_OPTIONS + SEARCH_LIST_OPTIONS + SEARCH_MULTIPLE_OPTIONS + SEARCH_VALUE_OPTIONS + SEARCH_IGNORED_OPTIONS
+    for ii in sorted(vars(args).keys()):
+        if ii not in known:
+            raise RuntimeError("option '%s' not known to option search" % (ii))
+    ret = []
+    for ii in sorted(SEARCH_FLAG_OPTIONS + SEARCH_LIST_OPTIONS + SEARCH_MULTIPLE_OPTIONS + SEARCH_VALUE_OPTIONS):
+        value = overrides.get(ii, getattr(args, ii))
+        opt = SEARCH_OPTION_STRINGS.get(ii, "--" + ii.replace("_", "-"))
+        if ii in SEARCH_FLAG_OPTIONS:
+            if value:
+                ret += [opt]
+        elif ii in SEARCH_LIST_OPTIONS:
+            for jj in value:
+                ret += [opt, str(jj)]
+        elif ii in SEARCH_MULTIPLE_OPTIONS:
+            if value:
+                ret += [opt] + [str(jj) for jj in value]
+        elif (value is not None) and (value != parser.get_default(ii)):
+            ret += [opt, str(value)]
+    # Separate positional arguments so they can never be mistaken for option values.
+    return ret + ["--"] + overrides.get("source", args.source)
+
+def generate_search_variants(parser, args):
+    """Generate all valid combinations of size-affecting options left for autodetection."""
+    dimensions = []
+    if args.method in ("hash", "maximum"):
+        if "auto" == args.hash_function:
+            dimensions += [("hash_function", ("crc32", "sdbm"))]
+        if "auto" == args.symtab_mode:
+            dimensions += [("symtab_mode", ("safe", "unsafe"))]
+    if ("maximum" == args.method) and ("auto" == args.merge_headers):
+        dimensions += [("merge_headers", ("yes", "no"))]
+    if "auto" == args.filedrop_mode:
+        if args.m32:
+            dimensions += [("filedrop_mode", ("header", "native", "cross"))]
+        else:
+            dimensions += [("filedrop_mode", ("header", "native"))]
+    if args.unpack_header == parser.get_default("unpack_header"):
+        dimensions += [("unpack_header", ("lzma", "xz"))]
+    ret = []
+    names = [ii[0] for ii in dimensions]
+    for ii in itertools.product(*[jj[1] for jj in dimensions]):
+        ret += [SearchVariant(dict(zip(names, ii)))]
+    return ret
+
+def is_clean_exit(op):
+    """Tell if return code of a binary, possibly run through the shell, means it ran to completion."""
+    return op in (0, -SIGTRAP, 128 + SIGTRAP)
+
+def prepare_search(args):
+    """Prepare parsed arguments for building variants in other directories.
+
+    Returns tuple of (source directories, output file, target header name, target header file)."""
+    source_files = [ii for ii in args.source if re.match(r'.*\.(c|cpp)$', ii, re.I)]
+    if len(source_files) != 1:
+        raise RuntimeError("option search requires exactly one C/C++ source file, got %s" % (str(args.source)))
+    if 1 < len(args.output_file):
+        raise RuntimeError("more than one output file specified: %s" % (str(args.output_file)))
+    # Paths must remain valid when variants are built in other directories.
+    for ii in SEARCH_PATH_OPTIONS:
+        value = getattr(args, ii)
+        if isinstance(value, list):
+            setattr(args, ii, [os.path.abspath(jj) for jj in value])
+        elif value:
+            setattr(args, ii, os.path.abspath(value))
+    for ii in SEARCH_EXECUTABLE_OPTIONS:
+        value = getattr(args, ii)
+        if value and (os.sep in value):
+            setattr(args, ii, os.path.abspath(value))
+    source_directories = []
+    sources = []
+    for ii in args.source:
+        if ii in source_files:
+            source_directory = os.path.dirname(os.path.abspath(ii))
+            if source_directory not in source_directories:
+                source_directories += [source_directory]
+            sources += [os.path.basename(ii)]
+        else:
+            sources += [os.path.abspath(ii)]
+    args.source = sources
+    # Headers next to the sources are reachable through the original directories.
+    args.include_directory = source_directories + args.include_directory
+    # Determine final output file and header.
+    if args.output_file:
+        output_file = args.output_file[0]
+    else:
+        output_file = os.path.splitext(source_files[0])[0]
+    target_path, target = os.path.split(os.path.normpath(args.target))
+    if target_path:
+        target_file = os.path.abspath(args.target)
+    else:
+        target_file = locate(args.search_path or source_directories, target)
+    return (source_directories, output_file, target, target_file)
+
+def search_build_options(parser, args, work_directory):
+    """Build all option combinations concurrently, keep the smallest working output."""
+    (source_directories, output_file, target, target_file) = prepare_search(args)
+    # Run variants. Variants that produce the same compiled source are started only after the first one of the same
+    # group has finished, so they can reuse its cached intermediate files.
+    variants = generate_search_variants(parser, args)
+    print("Searching %i option combinations..." % (len(variants)))
+    groups = {}
+    for ii in variants:
+        groups.setdefault(ii.get_compile_group(), []).append(ii)
+    first_wave = [ii[0] for ii in groups.values()]
+    second_wave = [ii for ii in variants if ii not in first_wave]
+    output_basename = os.path.basename(output_file)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=get_job_count()) as executor:
+        for wave in (first_wave, second_wave):
+            futures = [executor.submit(ii.run, parser, args, source_directories, target, output_basename, work_directory) for ii in wave]
+            for ii in futures:
+                ii.result()
+    # Binaries unpack into the same temporary file, so they must be run one at a time.
+    if args.search_run:
+        for ii in variants:
+            if ii.get_output():
+                ii.check()
+    # Print ranked table.
+    ranked = sorted(variants)
+    print("%4s %10s %8s  %s" % ("rank", "size", "time", "options"))
+    for ii in range(len(ranked)):
+        vv = ranked[ii]
+        if vv.get_size() is None:
+            print("%4s %10s %7.1fs  %s (%s)" % ("-", "failed", vv.get_time(), vv.get_option_string(), vv.get_error()))
+        else:
+            print("%4i %10i %7.1fs  %s" % (ii + 1, vv.get_size(), vv.get_time(), vv.get_option_string()))
+    best = ranked[0]
+    if best.get_size() is None:
+        raise RuntimeError("no option combination produced a working output")
+    shutil.copy2(best.get_output(), output_file)
+    if target_file:
+        shutil.copy2(os.path.join(best.get_directory(), target), target_file)
+    print("Wrote '%s': %i bytes (%s)" % (output_file, best.get_size(), best.get_option_string()))
+    for ii in variants:
+        if ii.get_directory():
+            shutil.rmtree(ii.get_directory(), True)
+    return 0
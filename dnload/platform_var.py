@@ -123,6 +123,10 @@ g_platform_variables = {
 # Functions ############################
 ########################################
 
+def get_platform():
+    """Get current platform as string of operating system name and architecture."""
+    return "%s-%s" % (g_osname, g_osarch)
+
 def get_platform_combinations(osname, osarch):
     """Get listing of all possible platform combinations matching current platform."""
     # Gather operating system name path.
@@ -1,3 +1,4 @@
+from dnload.cache import run_command_cached
 from dnload.common import is_verbose
 from dnload.common import run_command
 from dnload.compiler import Compiler
@@ -18,7 +19,9 @@ class Preprocessor(Compiler):
         args = [self.get_command(), op] + self._compiler_flags_extra + self._definitions + self._include_directories
         if self.is_msvc():
             args += ["/E"]
-        (so, se) = run_command(args)
+            (so, se) = run_command(args)
+        else:
+            (so, se) = run_command_cached(args, [op], [], True, True)
         if 0 < len(se) and is_verbose():
             print(se)
         return so
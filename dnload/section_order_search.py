@@ -0,0 +1,208 @@
+import itertools
+import os
+import shutil
+import tempfile
+
+from dnload.cache import generate_key
+from dnload.cache import get_cache
+from dnload.common import is_verbose
+from dnload.common import parallel_map
+from dnload.compression import compress_candidate
+from dnload.compression import generate_reference_options
+from dnload.elf_image import is_direct_link
+from dnload.elf_image import link_elf_image
+from dnload.platform_var import get_platform
+
+########################################
+# Globals ##############################
+########################################
+
+# Kinds of sections kept together when generating initial orders, other sections form one more kind.
+SECTION_ORDER_KINDS = ("rodata", "data", "text")
+
+# Maximum number of local search rounds.
+SECTION_ORDER_LOCAL_ROUNDS = 4
+
+# Local search only moves sections to adjacent positions if there are more sections than this.
+SECTION_ORDER_MOVE_LIMIT = 12
+
+########################################
+# SectionOrderSearch ###################
+########################################
+
+class SectionOrderSearch:
+    """Search state for section orders, scored by compressed size of the linked binary.
+
+    Candidates are assembled, linked and compressed concurrently in worker processes. Assembled objects and scores are
+    reused from the cache for sources that have not changed."""
+
+    def __init__(self, header, outputs, tail, assembler, linker, objcopy, zero, compression, directory):
+        """Constructor."""
+        self.__header = header
+        self.__outputs = outputs
+        self.__tail = tail
+        self.__assembler = assembler
+        self.__linker = linker
+        self.__objcopy = objcopy
+        self.__zero = zero
+        self.__compression = compression
+        self.__directory = directory
+        self.__best_order = None
+        self.__best_size = None
+        self.__scores = {}
+        # Scores depend on everything used to build the candidates, not just the source.
+        self.__key_parts = ["section-order-score", get_platform(), str(compression), str(zero),
+                            str(is_direct_link() and (not objcopy))]
+        self.__key_parts += assembler.generate_key_parts() + linker.generate_binary_key_parts(objcopy)
+
+    def generate_source(self, op):
+        """Generate assembler source for given order."""
+        return self.__header + "".join([self.__outputs[ii] for ii in op]) + self.__tail
+
+    def get_best_order(self):
+        """Accessor."""
+        return self.__best_order
+
+    def get_best_size(self):
+        """Accessor."""
+        return self.__best_size
+
+    def get_scored(self):
+        """Get number of distinct orders scored."""
+        return len(self.__scores)
+
+    def score(self, lst):
+        """Score orders, building the ones not scored before concurrently. Returns listing of sizes."""
+        cache = get_cache()
+        missing = []
+        sources = []
+        keys = []
+        for ii in lst:
+            order = tuple(ii)
+            if (order in self.__scores) or (order in missing):
+                continue
+            source = self.generate_source(order)
+            key = generate_key(self.__key_parts + [source])
+            if cache:
+                entry = cache.get(key)
+                if entry:
+                    self.__scores[order] = int(cache.get_blob(entry, "size").decode())
+                    continue
+            missing += [order]
+            sources += [source]
+            keys += [key]
+        count = len(missing)
+        first = len(self.__scores)
+        sizes = parallel_map(score_section_order, sources, [self.__assembler] * count, [self.__linker] * count,
+                             [self.__objcopy] * count, [self.__zero] * count, [self.__compression] * count,
+                             [self.__directory] * count, range(first, first + count))
+        for (order, key, size) in zip(missing, keys, sizes):
+            self.__scores[order] = size
+            # Failed builds are not cached, the failure may be transient.
+            if cache and (size is not None):
+                cache.put(key, {"size": str(size).encode()})
+        ret = []
+        for ii in lst:
+            size = self.__scores[tuple(ii)]
+            if (size is not None) and ((self.__best_size is None) or (size < self.__best_size)):
+                self.__best_order = list(ii)
+                self.__best_size = size
+            ret += [size]
+        return ret
+
+########################################
+# Functions ############################
+########################################
+
+def generate_kind_orders(names):
+    """Generate orders keeping sections of same kind together in original order, one for each permutation of kinds."""
+    kinds = []
+    for ii in names:
+        if get_section_kind(ii) not in kinds:
+            kinds += [get_section_kind(ii)]
+    ret = []
+    for ii in itertools.permutations(kinds):
+        order = []
+        for kind in ii:
+            order += [jj for jj in range(len(names)) if kind == get_section_kind(names[jj])]
+        ret += [order]
+    return ret
+
+def generate_move_orders(op):
+    """Generate orders where one section has been moved to another position.
+
+    With many sections, only moves to adjacent positions are generated."""
+    ret = []
+    count = len(op)
+    for ii in range(count):
+        targets = range(count)
+        if SECTION_ORDER_MOVE_LIMIT < count:
+            targets = [jj for jj in (ii - 1, ii + 1) if 0 <= jj < count]
+        for jj in targets:
+            if ii == jj:
+                continue
+            order = op[:ii] + op[ii + 1:]
+            order.insert(jj, op[ii])
+            if order not in ret:
+                ret += [order]
+    return ret
+
+def get_section_kind(op):
+    """Get kind of section with given name, None for kinds not kept together."""
+    if op in SECTION_ORDER_KINDS:
+        return op
+    return None
+
+def score_section_order(source, assembler, linker, objcopy, zero, compression, directory, index):
+    """Assemble, link and compress one candidate source, return compressed size or None on failure."""
+    output_s = os.path.join(directory, "candidate_%i.S" % (index))
+    output_o = os.path.join(directory, "candidate_%i.o" % (index))
+    output_unprocessed = os.path.join(directory, "candidate_%i.unprocessed" % (index))
+    output_stripped = os.path.join(directory, "candidate_%i.stripped" % (index))
+    with open(output_s, "w") as fd:
+        fd.write(source)
+    try:
+        assembler.assemble(output_s, output_o)
+        link_elf_image(linker, objcopy, output_o, output_unprocessed, output_stripped, zero, True)
+    except RuntimeError as err:
+        if is_verbose():
+            print("Section order candidate %i failed: %s" % (index, str(err).strip().split("\n")[0]))
+        return None
+    with open(output_stripped, "rb") as fd:
+        compressed = compress_candidate(fd.read(), compression, generate_reference_options(compression))
+    if compressed is None:
+        return None
+    return len(compressed)
+
+def search_section_order(asm, header, assembler, linker, objcopy, zero, compression):
+    """Search order of reorderable sections of an assembler file that produces the smallest compressed output.
+
+    Search starts from orders that keep sections of same kind together and refines the best order by moving single
+    sections. Best order is applied to the assembler file and returned."""
+    sections = asm.get_reorderable_sections()
+    if 2 > len(sections):
+        return None
+    names = [ii.get_name() for ii in sections]
+    directory = tempfile.mkdtemp(prefix="dnload_section_order_")
+    try:
+        search = SectionOrderSearch(header, [ii.generate_file_output() for ii in sections], asm.generate_fixed_output(),
+                                    assembler, linker, objcopy, zero, compression, directory)
+        initial_size = search.score([list(range(len(sections)))])[0]
+        if initial_size is None:
+            raise RuntimeError("could not build current section order")
+        search.score(generate_kind_orders(names))
+        for ii in range(SECTION_ORDER_LOCAL_ROUNDS):
+            best_size = search.get_best_size()
+            search.score(generate_move_orders(search.get_best_order()))
+            if search.get_best_size() >= best_size:
+                break
+            if is_verbose():
+                print("Section order local search round %i: %i bytes" % (ii + 1, search.get_best_size()))
+    finally:
+        shutil.rmtree(directory, True)
+    ret = search.get_best_order()
+    asm.reorder_sections([sections[ii] for ii in ret])
+    print("Scored %i section orders: %i -> %i bytes compressed (%s)" % (search.get_scored(), initial_size,
+                                                                        search.get_best_size(),
+                                                                        ", ".join([names[ii] for ii in ret])))
+    return ret
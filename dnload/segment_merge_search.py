@@ -0,0 +1,142 @@
+import copy
+import json
+
+from dnload.cache import generate_key
+from dnload.cache import get_cache
+from dnload.common import is_verbose
+from dnload.platform_var import get_platform
+
+########################################
+# SegmentMergeSearch ###################
+########################################
+
+class SegmentMergeSearch:
+    """Search state for segment orders and overlaps, scored by total size of the merged segments.
+
+    A plan is a listing of (segment index, overlap in bytes with the previous segment) tuples. Search is exhaustive with
+    branches pruned when the segments already completed are not smaller than the best plan found."""
+
+    def __init__(self, segments, fixed):
+        """Constructor."""
+        self.__segments = segments
+        self.__fixed = fixed
+        self.__best_plan = None
+        self.__best_size = None
+        self.__searched = 0
+
+    def get_best_plan(self):
+        """Accessor."""
+        return self.__best_plan
+
+    def get_best_size(self):
+        """Accessor."""
+        return self.__best_size
+
+    def get_candidates(self, plan):
+        """Get indices of segments that may follow given partial plan."""
+        if len(plan) < self.__fixed:
+            return [len(plan)]
+        used = [ii[0] for ii in plan]
+        return [ii for ii in range(self.__fixed, len(self.__segments)) if ii not in used]
+
+    def get_searched(self):
+        """Get number of complete plans evaluated."""
+        return self.__searched
+
+    def search(self, plan=None, size=None):
+        """Search for the plan producing the smallest merged size, starting from given plan if any. Returns the best
+        plan, plans only as small as the starting plan are not accepted."""
+        self.__best_plan = plan
+        self.__best_size = size
+        first = self.get_candidates([])[0]
+        self.search_from([(first, 0)], 0, copy.deepcopy(self.__segments[first]))
+        return self.__best_plan
+
+    def search_from(self, plan, completed_size, last):
+        """Continue search from a partial plan, given size of completed segments and last segment still mergable."""
+        if (self.__best_size is not None) and (completed_size >= self.__best_size):
+            return
+        candidates = self.get_candidates(plan)
+        if not candidates:
+            self.__searched += 1
+            size = completed_size + last.size()
+            if (self.__best_size is None) or (size < self.__best_size):
+                self.__best_plan = plan
+                self.__best_size = size
+            return
+        for ii in candidates:
+            for jj in [0] + last.get_merge_lengths(self.__segments[ii]):
+                (merged, current) = copy.deepcopy((last, self.__segments[ii]))
+                if jj:
+                    merged.merge_at(current, jj)
+                if current.empty():
+                    self.search_from(plan + [(ii, jj)], completed_size, merged)
+                else:
+                    self.search_from(plan + [(ii, jj)], completed_size + merged.size(), current)
+
+########################################
+# Functions ############################
+########################################
+
+def apply_segment_plan(segments, plan):
+    """Merge segments in-place according to a plan, return listing of remaining segments in order."""
+    ret = [segments[plan[0][0]]]
+    last = ret[0]
+    for (idx, length) in plan[1:]:
+        current = segments[idx]
+        if length and (not last.merge(current, length)):
+            raise RuntimeError("cannot merge segments '%s' and '%s' at %i bytes" % (last.get_name(), current.get_name(),
+                                                                                    length))
+        if not current.empty():
+            ret += [current]
+            last = current
+    return ret
+
+def generate_greedy_plan(segments):
+    """Generate plan merging segments in order at the highest possible overlap. Returns tuple of plan and size."""
+    work = copy.deepcopy(segments)
+    plan = [(0, 0)]
+    remaining = [work[0]]
+    for ii in range(1, len(work)):
+        lengths = remaining[-1].get_merge_lengths(work[ii])
+        length = max(lengths) if lengths else 0
+        if length:
+            remaining[-1].merge_at(work[ii], length)
+        plan += [(ii, length)]
+        if not work[ii].empty():
+            remaining += [work[ii]]
+    return (plan, sum([ii.size() for ii in remaining]))
+
+def generate_plan_string(segments, plan):
+    """Generate human-readable representation of a plan."""
+    ret = []
+    for (idx, length) in plan:
+        ret += ["%s@%i" % (segments[idx].get_name(), length) if length else segments[idx].get_name()]
+    return ", ".join(ret)
+
+def search_segment_merge(segments, fixed, assembler):
+    """Search order and overlaps of segments that produce the smallest merged size, merge segments accordingly.
+
+    Given number of first segments stay in place, others may be reordered. Plans are cached per platform and segment
+    source so search only runs once for each configuration. Returns listing of remaining segments in order."""
+    if not segments:
+        return segments
+    cache = get_cache()
+    parts = ["segment-merge-plan", get_platform(), str(fixed)]
+    key = generate_key(parts + [ii.generate_source(assembler) for ii in segments])
+    plan = None
+    if cache:
+        entry = cache.get(key)
+        if entry:
+            plan = [tuple(ii) for ii in json.loads(cache.get_blob(entry, "plan").decode())]
+    if not plan:
+        (greedy_plan, greedy_size) = generate_greedy_plan(segments)
+        search = SegmentMergeSearch(segments, fixed)
+        plan = search.search(greedy_plan, greedy_size)
+        if is_verbose():
+            print("Searched %i segment merge plans: %i -> %i bytes (%s)" % (search.get_searched(), greedy_size,
+                                                                            search.get_best_size(),
+                                                                            generate_plan_string(segments, plan)))
+        if cache:
+            cache.put(key, {"plan": json.dumps(plan).encode()})
+    return apply_segment_plan(segments, plan)
@@ -1,5 +1,8 @@
 from dnload.common import is_verbose
 from dnload.platform_var import PlatformVar
+from dnload.symbol_hash import get_symbol_hash
+from dnload.symbol_hash import hash_name
+from dnload.symbol_hash import is_symbol_hash
 from dnload.template import Template
 
 ########################################
@@ -69,11 +72,9 @@ class Symbol:
 
     def get_hash(self, hash_function):
         """Get the hash of symbol name."""
-        if hash_function == "crc32":
-            return hash_crc32(self.__name)
-        elif hash_function == "sdbm":
-            return hash_sdbm(self.__name)
-        raise RuntimeError("cannot hash function name '%s': unknown hash function '%s'" % (self.__name, hash_function))
+        if (not is_symbol_hash(hash_function)) and (hash_function not in ("crc32", "gnu", "sdbm")):
+            raise RuntimeError("cannot hash function name '%s': unknown hash function '%s'" % (self.__name, hash_function))
+        return "0x%x" % (hash_name(self.__name, hash_function))
 
     def get_library(self):
         """Access library reference."""
@@ -150,7 +151,7 @@ static uint32_t dnload_hash(const uint8_t *op)
         uint32_t cc = *op++;
         if(!cc)
         {
-            return ret;
+            return [[HASH_RESULT]];
         }
         ret = __builtin_ia32_crc32qi(ret, cc);
     }
@@ -168,9 +169,126 @@ static uint32_t dnload_hash(const uint8_t *op)
         uint32_t cc = *op++;
         if(!cc)
         {
-            return ret;
+            return [[HASH_RESULT]];
+        }
+        ret = ret * [[SDBM_MULTIPLIER]] + cc;
+    }
+}""")
+
+g_template_find_symbol_gnu_hash = Template("""/// Find a symbol in any of the link maps.
+///
+/// Symbols are looked up from the GNU hash table of each object, no names are hashed at runtime. Should a symbol with
+/// given hash not be present, this function will happily continue until we crash.
+///
+/// \\param hash GNU hash of the function name string.
+/// \\return Symbol found.
+static void* dnload_find_symbol(uint32_t hash)
+{
+    const struct link_map* lmap = elf_get_link_map();
+#if defined(__linux__) && (8 == DNLOAD_POINTER_SIZE)
+    // On 64-bit Linux, the second entry is not usable.
+    lmap = lmap->l_next;
+#endif
+    for(;;)
+    {
+        // First entry is this object itself, safe to advance first.
+        lmap = lmap->l_next;
+        {
+            const dnload_elf_dyn_t *dynamic = elf_get_dynamic_element_by_tag(lmap->l_ld, DT_GNU_HASH);
+            const uint32_t *gnu_hash = (const uint32_t*)elf_transform_dynamic_address(lmap, (const void*)(dynamic->d_un.d_ptr));
+            // Header is followed by bloom filter words, buckets and hash chains.
+            const uint32_t *buckets = gnu_hash + 4 + gnu_hash[2] * (DNLOAD_POINTER_SIZE / 4);
+            uint32_t ii = buckets[hash % gnu_hash[0]];
+            // Empty bucket means the symbol is not in this object.
+            if(ii)
+            {
+                const uint32_t *chain = buckets + gnu_hash[0] - gnu_hash[1];
+                dynamic = elf_get_dynamic_element_by_tag(lmap->l_ld, DT_SYMTAB);
+                for(;;)
+                {
+                    uint32_t cc = chain[ii];
+                    // Lowest bit of a chain hash marks the end of the chain.
+                    if((cc ^ hash) <= 1)
+                    {
+                        const dnload_elf_sym_t *sym = (const dnload_elf_sym_t*)elf_transform_dynamic_address(lmap, (const void*)(dynamic->d_un.d_ptr)) + ii;
+                        void* ret_addr = (void*)((const uint8_t*)sym->st_value + (size_t)lmap->l_addr);
+#if defined(__linux__) && (defined(__aarch64__) || defined(__i386__) || defined(__x86_64__))
+                        // On Linux and various architectures, need to check for IFUNC.
+                        if((sym->st_info & 15) == STT_GNU_IFUNC)
+                        {
+                            ret_addr = ((void*(*)())ret_addr)();
+                        }
+#endif
+                        return ret_addr;
+                    }
+                    if(cc & 1)
+                    {
+                        break;
+                    }
+                    ++ii;
+                }
+            }
+        }
+    }
+}""")
+
+g_template_find_symbol_symtab = Template("""/// Find a symbol in any of the link maps.
+///
+/// Should a symbol with name matching the given hash not be present, this function will happily continue until
+/// we crash. Size-minimal code has no room for error checking.
+///
+/// \\param hash Hash of the function name string.
+/// \\return Symbol found.
+static void* dnload_find_symbol(uint32_t hash)
+{
+    const struct link_map* lmap = elf_get_link_map();
+#if defined(__linux__) && (8 == DNLOAD_POINTER_SIZE)
+    // On 64-bit Linux, the second entry is not usable.
+    lmap = lmap->l_next;
+#endif
+    for(;;)
+    {
+        // First entry is this object itself, safe to advance first.
+        lmap = lmap->l_next;
+        {
+#if defined(DNLOAD_SAFE_SYMTAB_HANDLING)
+            const dnload_elf_sym_t* symtab = (const dnload_elf_sym_t*)elf_get_library_dynamic_section(lmap, DT_SYMTAB);
+            const char* strtab = (char*)elf_get_library_dynamic_section(lmap, DT_STRTAB);
+            const dnload_elf_sym_t* symtab_end = (const dnload_elf_sym_t*)strtab;
+            // If the section immediately following SYMTAB is not STRTAB, it may be something else.
+            {
+                const dnload_elf_sym_t *potential_end = (const dnload_elf_sym_t*)elf_get_library_dynamic_section(lmap, DT_VERSYM);
+                if(potential_end < symtab_end)
+                {
+                    symtab_end = potential_end;
+                }
+            }
+#else
+            // Assume DT_SYMTAB dynamic entry immediately follows DT_STRTAB dynamic entry.
+            // Assume DT_STRTAB memory block immediately follows DT_SYMTAB dynamic entry.
+            const dnload_elf_dyn_t *dynamic = elf_get_dynamic_element_by_tag(lmap->l_ld, DT_STRTAB);
+            const char* strtab = (const char*)elf_transform_dynamic_address(lmap, (const void*)(dynamic->d_un.d_ptr));
+            const dnload_elf_sym_t *symtab_end = (const dnload_elf_sym_t*)strtab;
+            ++dynamic;
+            const dnload_elf_sym_t *symtab = (const dnload_elf_sym_t*)elf_transform_dynamic_address(lmap, (const void*)(dynamic->d_un.d_ptr));
+#endif
+            for(const dnload_elf_sym_t *sym = symtab; (sym < symtab_end); ++sym)
+            {
+                const char *name = strtab + sym->st_name;
+                if(dnload_hash((const uint8_t*)name) == hash)
+                {
+                    void* ret_addr = (void*)((const uint8_t*)sym->st_value + (size_t)lmap->l_addr);
+#if defined(__linux__) && (defined(__aarch64__) || defined(__i386__) || defined(__x86_64__))
+                    // On Linux and various architectures, need to check for IFUNC.
+                    if((sym->st_info & 15) == STT_GNU_IFUNC)
+                    {
+                        ret_addr = ((void*(*)())ret_addr)();
+                    }
+#endif
+                    return ret_addr;
+                }
+            }
         }
-        ret = ret * 65599 + cc;
     }
 }""")
 
@@ -295,65 +413,7 @@ static const void* elf_get_library_dynamic_section(const struct link_map *lmap,
     return elf_transform_dynamic_address(lmap, ptr);
 }
 #endif
-/// Find a symbol in any of the link maps.
-///
-/// Should a symbol with name matching the given hash not be present, this function will happily continue until
-/// we crash. Size-minimal code has no room for error checking.
-///
-/// \\param hash Hash of the function name string.
-/// \\return Symbol found.
-static void* dnload_find_symbol(uint32_t hash)
-{
-    const struct link_map* lmap = elf_get_link_map();
-#if defined(__linux__) && (8 == DNLOAD_POINTER_SIZE)
-    // On 64-bit Linux, the second entry is not usable.
-    lmap = lmap->l_next;
-#endif
-    for(;;)
-    {
-        // First entry is this object itself, safe to advance first.
-        lmap = lmap->l_next;
-        {
-#if defined(DNLOAD_SAFE_SYMTAB_HANDLING)
-            const dnload_elf_sym_t* symtab = (const dnload_elf_sym_t*)elf_get_library_dynamic_section(lmap, DT_SYMTAB);
-            const char* strtab = (char*)elf_get_library_dynamic_section(lmap, DT_STRTAB);
-            const dnload_elf_sym_t* symtab_end = (const dnload_elf_sym_t*)strtab;
-            // If the section immediately following SYMTAB is not STRTAB, it may be something else.
-            {
-                const dnload_elf_sym_t *potential_end = (const dnload_elf_sym_t*)elf_get_library_dynamic_section(lmap, DT_VERSYM);
-                if(potential_end < symtab_end)
-                {
-                    symtab_end = potential_end;
-                }
-            }
-#else
-            // Assume DT_SYMTAB dynamic entry immediately follows DT_STRTAB dynamic entry.
-            // Assume DT_STRTAB memory block immediately follows DT_SYMTAB dynamic entry.
-            const dnload_elf_dyn_t *dynamic = elf_get_dynamic_element_by_tag(lmap->l_ld, DT_STRTAB);
-            const char* strtab = (const char*)elf_transform_dynamic_address(lmap, (const void*)(dynamic->d_un.d_ptr));
-            const dnload_elf_sym_t *symtab_end = (const dnload_elf_sym_t*)strtab;
-            ++dynamic;
-            const dnload_elf_sym_t *symtab = (const dnload_elf_sym_t*)elf_transform_dynamic_address(lmap, (const void*)(dynamic->d_un.d_ptr));
-#endif
-            for(const dnload_elf_sym_t *sym = symtab; (sym < symtab_end); ++sym)
-            {
-                const char *name = strtab + sym->st_name;
-                if(dnload_hash((const uint8_t*)name) == hash)
-                {
-                    void* ret_addr = (void*)((const uint8_t*)sym->st_value + (size_t)lmap->l_addr);
-#if defined(__linux__) && (defined(__aarch64__) || defined(__i386__) || defined(__x86_64__))
-                    // On Linux and various architectures, need to check for IFUNC.
-                    if((sym->st_info & 15) == STT_GNU_IFUNC)
-                    {
-                        ret_addr = ((void*(*)())ret_addr)();
-                    }
-#endif
-                    return ret_addr;
-                }
-            }
-        }
-    }
-}
+[[FIND_SYMBOL]]
 /// Perform init.
 ///
 /// Import by hash - style.
@@ -412,12 +472,20 @@ def generate_loader_hash(symbols, hash_function):
             "BASE_ADDRESS_IA32": str(PlatformVar("entry", "", "ia32")),
             "SYMBOL_COUNT": str(len(symbols)),
             }
-    if hash_function == "crc32":
-        subst["HASH_FUNCTION"] = g_template_hash_function_crc32.format()
-    elif hash_function == "sdbm":
-        subst["HASH_FUNCTION"] = g_template_hash_function_sdbm.format()
-    else:
+    if (not is_symbol_hash(hash_function)) and (hash_function not in ("crc32", "gnu", "sdbm")):
         raise RuntimeError("unknown hash function: '%s'" % (hash_function))
+    hash_function = get_symbol_hash(hash_function)
+    subst_hash = {"HASH_RESULT": hash_function.generate_result()}
+    subst["FIND_SYMBOL"] = g_template_find_symbol_symtab.format()
+    if hash_function.get_name() == "crc32":
+        subst["HASH_FUNCTION"] = g_template_hash_function_crc32.format(subst_hash)
+    elif hash_function.get_name() == "gnu":
+        # Hashes are only compared against hash tables of shared objects.
+        subst["HASH_FUNCTION"] = ""
+        subst["FIND_SYMBOL"] = g_template_find_symbol_gnu_hash.format()
+    else:
+        subst_hash["SDBM_MULTIPLIER"] = str(hash_function.get_multiplier())
+        subst["HASH_FUNCTION"] = g_template_hash_function_sdbm.format(subst_hash)
     return g_template_loader_hash.format(subst)
 
 def generate_symbol_definitions_direct(symbols, prefix):
@@ -448,57 +516,3 @@ def generate_symbol_table(mode, symbols, hash_function):
         subst["SYMBOL_TABLE_INITIALIZATION"] = " =\n{\n%s\n}" % ("\n".join(hashes))
     subst["SYMBOL_TABLE_DEFINITION"] = "\n".join(definitions)
     return g_template_symbol_table.format(subst)
-
-def str_xor(lhs, rhs):
-    """Calculate xor for binary strings."""
-    if len(lhs) != len(rhs):
-        raise RuntimeError("XOR strings '%s' and '%s' are not of same length")
-    ret = ""
-    for ii, jj in zip(lhs, rhs):
-        if ii == jj:
-            ret += "0"
-        else:
-            ret += "1"
-    return ret
-
-def str_mod2_rem(lhs, rhs):
-    """Calculate remainder modulo 2 for binary strings."""
-    if len(lhs) < len(rhs):
-        raise RuntimeError("MOD2 strings '%s' and '%s' are not of same length")
-    while True:
-        diff = len(lhs) - len(rhs)
-        if lhs[0] != "0":
-            lhs = str_xor(lhs, rhs + ("0" * diff))[1:]
-        else:
-            lhs = lhs[1:]
-        if diff <= 0:
-            break
-    return lhs
-
-def hash_crc32(name):
-    """Calculate CRC32 hash over a string."""
-    #CRC32 instruction for 8-bit source operand and 32-bit destination operand:
-    #TEMP1[7-0] ← BIT_REFLECT8(SRC[7-0])
-    #TEMP2[31-0]←BIT_REFLECT32 (DEST[31-0])
-    #TEMP3[39-0]←TEMP1[7-0] « 32
-    #TEMP4[39-0]←TEMP2[31-0] « 8
-    #TEMP5[39-0]←TEMP3[39-0] XOR TEMP4[39-0]
-    #TEMP6[31-0]←TEMP5[39-0] MOD2 11EDC6F41H
-    #DEST[31-0]←BIT_REFLECT (TEMP6[31-0])
-    ret = 0
-    for ii in name:
-        tmp1 = format(ord(ii), 'b')
-        tmp2 = format(ret, 'b')
-        tmp3 = (("0" * (8 - len(tmp1))) + tmp1)[::-1] + ("0" * 32)
-        tmp4 = (("0" * (32 - len(tmp2))) + tmp2)[::-1] + ("0" * 8)
-        tmp5 = str_xor(tmp3, tmp4)
-        tmp6 = str_mod2_rem(tmp5, format(0x11EDC6F41, 'b'))
-        ret = int((tmp6[-32:])[::-1], 2)
-    return "0x%x" % (ret)
-
-def hash_sdbm(name):
-    """Calculate SDBM hash over a string."""
-    ret = 0
-    for ii in name:
-        ret = (ret * 65599 + ord(ii)) & 0xFFFFFFFF
-    return "0x%x" % (ret)
@@ -0,0 +1,242 @@
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+########################################
+# Globals ##############################
+########################################
+
+# Reflected CRC32C (Castagnoli) polynomial, as used by the SSE4.2 crc32 instruction.
+CRC32C_POLYNOMIAL = 0x82F63B78
+
+# Initial value and multiplier of the hash function used in DT_GNU_HASH sections.
+GNU_HASH_INITIAL = 5381
+GNU_HASH_MULTIPLIER = 33
+
+# Batches at least this large are hashed with NumPy if it's available.
+HASH_NUMPY_THRESHOLD = 256
+
+SDBM_MULTIPLIER = 65599
+
+# Number of SDBM multipliers tried when searching for a hash function.
+SDBM_MULTIPLIER_SEARCH_COUNT = 32
+
+# Seed for generating alternative SDBM multipliers, fixed so searches are reproducible.
+SDBM_MULTIPLIER_SEED = 65599
+
+g_crc32c_table = None
+
+########################################
+# SymbolHash ###########################
+########################################
+
+class SymbolHash:
+    """Hash function used to import symbols by hash.
+
+    The GNU hash function is the one used in DT_GNU_HASH sections, so symbols can be looked up from the hash tables
+    of shared objects without hashing any names at runtime. Other hash functions may be seeded with a different
+    multiplier and reduced to less than 32 bits either by truncation or by folding the high bits over the low bits."""
+
+    def __init__(self, name, multiplier=SDBM_MULTIPLIER, bits=32, fold=False):
+        """Constructor."""
+        if name not in ("crc32", "gnu", "sdbm"):
+            raise RuntimeError("unknown hash function '%s'" % (name))
+        self.__name = name
+        self.__multiplier = None
+        if "sdbm" == name:
+            self.__multiplier = multiplier
+        self.__bits = bits
+        self.__fold = fold and (32 > bits)
+
+    def compare(self, op):
+        """Get the part of a hash value the loader compares, lowest bit of GNU hash chains is an end marker."""
+        if "gnu" == self.__name:
+            return op & 0xFFFFFFFE
+        return op
+
+    def generate_result(self):
+        """Generate C expression for the reduced hash value from full hash value 'ret'."""
+        if 32 <= self.__bits:
+            return "ret"
+        if self.__fold:
+            return "(ret ^ (ret >> %i)) & 0x%x" % (self.__bits, self.get_mask())
+        return "ret & 0x%x" % (self.get_mask())
+
+    def get_base(self):
+        """Get the full 32-bit hash function this hash function reduces."""
+        if 32 <= self.__bits:
+            return self
+        return SymbolHash(self.__name, self.__multiplier)
+
+    def get_bits(self):
+        """Accessor."""
+        return self.__bits
+
+    def get_mask(self):
+        """Get mask for hash values."""
+        return (1 << self.__bits) - 1
+
+    def get_multiplier(self):
+        """Accessor."""
+        return self.__multiplier
+
+    def get_name(self):
+        """Accessor."""
+        return self.__name
+
+    def hash(self, op):
+        """Calculate hash of a name."""
+        if "crc32" == self.__name:
+            return self.reduce(hash_crc32(op))
+        elif "gnu" == self.__name:
+            return hash_gnu(op)
+        return self.reduce(hash_sdbm(op, self.__multiplier))
+
+    def is_fold(self):
+        """Tell if high bits are folded over the low bits when reducing."""
+        return self.__fold
+
+    def reduce(self, op):
+        """Reduce full hash value into the number of bits used."""
+        if 32 <= self.__bits:
+            return op
+        if self.__fold:
+            op ^= op >> self.__bits
+        return op & self.get_mask()
+
+    def __str__(self):
+        """String representation."""
+        ret = []
+        if (self.__multiplier is not None) and (SDBM_MULTIPLIER != self.__multiplier):
+            ret += ["multiplier=%i" % (self.__multiplier)]
+        if 32 > self.__bits:
+            ret += ["bits=%i" % (self.__bits)]
+        if self.__fold:
+            ret += ["fold"]
+        if not ret:
+            return self.__name
+        return "%s(%s)" % (self.__name, ", ".join(ret))
+
+########################################
+# Functions ############################
+########################################
+
+def generate_crc32c_table():
+    """Generate 256-entry lookup table for byte-wise CRC32C."""
+    ret = []
+    for ii in range(256):
+        crc = ii
+        for jj in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ CRC32C_POLYNOMIAL
+            else:
+                crc >>= 1
+        ret += [crc]
+    return ret
+
+def generate_sdbm_multipliers(count):
+    """Generate given number of SDBM multipliers, starting with the default one."""
+    ret = [SDBM_MULTIPLIER]
+    rng = random.Random(SDBM_MULTIPLIER_SEED)
+    while len(ret) < count:
+        # Odd multipliers keep the low bits of the hash dependent on all characters.
+        multiplier = rng.randrange(3, 0x10000) | 1
+        if multiplier not in ret:
+            ret += [multiplier]
+    return ret
+
+def generate_symbol_hash_variants(op):
+    """Generate reduced variants of a full hash function, fewest bits first."""
+    # GNU hashes must match the hash tables of shared objects.
+    if "gnu" == op.get_name():
+        return [op]
+    ret = []
+    for ii in (16, 24):
+        ret += [SymbolHash(op.get_name(), op.get_multiplier(), ii), SymbolHash(op.get_name(), op.get_multiplier(), ii, True)]
+    return ret + [op]
+
+def get_crc32c_table():
+    """Get CRC32C lookup table, generating it on first use."""
+    global g_crc32c_table
+    if not g_crc32c_table:
+        g_crc32c_table = generate_crc32c_table()
+    return g_crc32c_table
+
+def get_symbol_hash(op):
+    """Get hash function for given hash function name or hash function."""
+    if is_symbol_hash(op):
+        return op
+    return SymbolHash(op)
+
+def hash_crc32(op):
+    """Calculate CRC32C hash over a name without initial or final inversion, like chained crc32 instructions."""
+    table = get_crc32c_table()
+    ret = 0
+    for ii in to_bytes(op):
+        ret = table[(ret ^ ii) & 0xFF] ^ (ret >> 8)
+    return ret
+
+def hash_gnu(op):
+    """Calculate GNU hash over a name."""
+    ret = GNU_HASH_INITIAL
+    for ii in to_bytes(op):
+        ret = (ret * GNU_HASH_MULTIPLIER + ii) & 0xFFFFFFFF
+    return ret
+
+def hash_name(op, hash_function):
+    """Calculate hash of a name with given hash function."""
+    return get_symbol_hash(hash_function).hash(op)
+
+def hash_names(lst, hash_function):
+    """Calculate hashes of all names in a listing, return listing of hashes in the same order."""
+    hash_function = get_symbol_hash(hash_function)
+    if numpy and (HASH_NUMPY_THRESHOLD <= len(lst)):
+        ret = hash_names_numpy([to_bytes(ii) for ii in lst], hash_function)
+        return [hash_function.reduce(ii) for ii in ret]
+    return [hash_function.hash(ii) for ii in lst]
+
+def hash_names_numpy(lst, hash_function):
+    """Calculate full hashes of all names in a listing of byte strings, processing one character column at a time."""
+    if not lst:
+        return []
+    lengths = numpy.array([len(ii) for ii in lst], dtype=numpy.int64)
+    width = int(lengths.max())
+    if 0 >= width:
+        return [hash_function.get_base().hash(b"")] * len(lst)
+    padded = b"".join([ii.ljust(width, b"\0") for ii in lst])
+    matrix = numpy.frombuffer(padded, dtype=numpy.uint8).reshape(len(lst), width).astype(numpy.uint64)
+    table = numpy.array(get_crc32c_table(), dtype=numpy.uint64)
+    ret = numpy.zeros(len(lst), dtype=numpy.uint64)
+    multiplier = hash_function.get_multiplier()
+    if "gnu" == hash_function.get_name():
+        ret += GNU_HASH_INITIAL
+        multiplier = GNU_HASH_MULTIPLIER
+    for ii in range(width):
+        column = matrix[:, ii]
+        if "crc32" == hash_function.get_name():
+            updated = table[(ret ^ column) & 0xFF] ^ (ret >> 8)
+        else:
+            updated = (ret * multiplier + column) & 0xFFFFFFFF
+        # Names that have already ended keep their hash.
+        ret = numpy.where(lengths > ii, updated, ret)
+    return [int(ii) for ii in ret]
+
+def hash_sdbm(op, multiplier=SDBM_MULTIPLIER):
+    """Calculate SDBM hash over a name."""
+    ret = 0
+    for ii in to_bytes(op):
+        ret = (ret * multiplier + ii) & 0xFFFFFFFF
+    return ret
+
+def is_symbol_hash(op):
+    """Tell if given object is a hash function."""
+    return isinstance(op, SymbolHash)
+
+def to_bytes(op):
+    """Convert name to bytes if it's not already."""
+    if isinstance(op, bytes):
+        return op
+    return op.encode("latin-1")
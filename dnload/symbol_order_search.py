@@ -0,0 +1,222 @@
+import concurrent.futures
+import os
+import re
+import shutil
+
+from dnload.cache import generate_key
+from dnload.cache import get_cache
+from dnload.common import get_job_count
+from dnload.common import is_verbose
+from dnload.option_search import prepare_search
+from dnload.option_search import SearchVariant
+
+########################################
+# Globals ##############################
+########################################
+
+# Number of symbols with most similar prototypes tried at each step of greedy construction.
+SYMBOL_ORDER_GREEDY_CANDIDATES = 3
+
+# Maximum number of local search rounds.
+SYMBOL_ORDER_LOCAL_ROUNDS = 8
+
+########################################
+# SymbolOrderSearch ####################
+########################################
+
+class SymbolOrderSearch:
+    """Search state for symbol orderings, scored by size of the compressed output."""
+
+    def __init__(self, parser, args, source_directories, target, output_basename, work_directory):
+        """Constructor."""
+        self.__parser = parser
+        self.__args = args
+        self.__source_directories = source_directories
+        self.__target = target
+        self.__output_basename = output_basename
+        self.__work_directory = work_directory
+        self.__best_order = None
+        self.__best_size = None
+        self.__built = 0
+        self.__scores = {}
+        self.__source_key = generate_source_key(source_directories, target)
+
+    def generate_key(self, op):
+        """Generate cache key for score of an ordering."""
+        variant = generate_symbol_order_variant(op)
+        return generate_key(["symbol-order-score", self.__source_key] + variant.generate_command_line(self.__parser, self.__args, self.__target, self.__output_basename))
+
+    def get_best_order(self):
+        """Accessor."""
+        return self.__best_order
+
+    def get_best_size(self):
+        """Accessor."""
+        return self.__best_size
+
+    def get_built(self):
+        """Accessor."""
+        return self.__built
+
+    def get_scored(self):
+        """Get number of distinct orderings scored."""
+        return len(self.__scores)
+
+    def score(self, lst):
+        """Score orderings, building the ones not scored before concurrently. Returns listing of sizes."""
+        cache = get_cache()
+        missing = []
+        for ii in lst:
+            order = tuple(ii)
+            if (order in self.__scores) or (order in missing):
+                continue
+            if cache:
+                entry = cache.get(self.generate_key(order))
+                if entry:
+                    self.__scores[order] = int(cache.get_blob(entry, "size").decode())
+                    continue
+            missing += [order]
+        variants = [generate_symbol_order_variant(ii) for ii in missing]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=get_job_count()) as executor:
+            futures = [executor.submit(ii.run, self.__parser, self.__args, self.__source_directories, self.__target, self.__output_basename, self.__work_directory) for ii in variants]
+            for ii in futures:
+                ii.result()
+        self.__built += len(variants)
+        for (order, variant) in zip(missing, variants):
+            size = variant.get_size()
+            self.__scores[order] = size
+            # Failed builds are not cached, the failure may be transient.
+            if cache and (size is not None):
+                cache.put(self.generate_key(order), {"size": str(size).encode()})
+            if variant.get_directory():
+                shutil.rmtree(variant.get_directory(), True)
+        ret = []
+        for ii in lst:
+            size = self.__scores[tuple(ii)]
+            if (size is not None) and ((self.__best_size is None) or (size < self.__best_size)):
+                self.__best_order = list(ii)
+                self.__best_size = size
+            ret += [size]
+        return ret
+
+########################################
+# Functions ############################
+########################################
+
+def generate_source_key(source_directories, target):
+    """Generate key over contents of all files in source directories, except the generated header."""
+    parts = []
+    for ii in source_directories:
+        for jj in sorted(os.listdir(ii)):
+            fname = os.path.join(ii, jj)
+            if (jj == target) or (not os.path.isfile(fname)):
+                continue
+            with open(fname, "rb") as fd:
+                parts += [jj, fd.read()]
+    return generate_key(parts)
+
+def generate_symbol_order_variant(op):
+    """Generate variant scoring given symbol order.
+
+    Section order search would run inside every build, it is done once on the best symbol order instead."""
+    return SearchVariant({"search_section_order": False, "symbol_order": ",".join(op)})
+
+def generate_symbol_order_seeds(names, prototypes):
+    """Generate initial orderings: default, by name, by prototype and reversed."""
+    ret = []
+    for ii in (list(names), sorted(names), sorted(names, key=lambda x: (prototypes[x], x)), list(reversed(names))):
+        if ii not in ret:
+            ret += [ii]
+    return ret
+
+def get_similar_symbols(last, remaining, prototypes, count):
+    """Get given number of remaining symbols with prototypes most similar to prototype of last placed symbol."""
+    if last is None:
+        return remaining[:count]
+    prototype = prototypes[last]
+
+    def similarity(op):
+        other = prototypes[op]
+        common = 0
+        while (common < min(len(prototype), len(other))) and (prototype[common] == other[common]):
+            common += 1
+        return (other != prototype, -common)
+    return sorted(remaining, key=similarity)[:count]
+
+def read_symbol_table(op):
+    """Read names and prototypes of symbol table entries from a generated header, in order."""
+    names = []
+    prototypes = {}
+    with open(op, "r") as fd:
+        for ii in fd.readlines():
+            match = re.match(r'^\s*(.*?)\s*\((?:DNLOAD_APIENTRY\s*)?\*df_(\w+)\)\((.*)\);\s*$', ii)
+            if match and (match.group(2) not in prototypes):
+                names += [match.group(2)]
+                prototypes[match.group(2)] = "%s(%s)" % (match.group(1), match.group(3))
+    return (names, prototypes)
+
+def search_symbol_order(parser, args, work_directory):
+    """Search order of symbols and libraries that produces the smallest output.
+
+    Orderings are built by separate dnload processes. Search starts from a few seed orderings, builds an ordering
+    greedily placing symbols with similar prototypes next to each other and finishes with local search over swaps of
+    adjacent symbols."""
+    (source_directories, output_file, target, target_file) = prepare_search(args)
+    output_basename = os.path.basename(output_file)
+    # Build default ordering first to find the symbols.
+    default = SearchVariant({"search_section_order": False}).run(parser, args, source_directories, target, output_basename, work_directory)
+    if default.get_size() is None:
+        shutil.rmtree(default.get_directory(), True)
+        raise RuntimeError("could not build default symbol order: %s" % (default.get_error()))
+    (names, prototypes) = read_symbol_table(os.path.join(default.get_directory(), target))
+    shutil.rmtree(default.get_directory(), True)
+    initial_size = default.get_size()
+    if 2 > len(names):
+        raise RuntimeError("symbol order search requires at least two symbols in symbol table, got %i" % (len(names)))
+    search = SymbolOrderSearch(parser, args, source_directories, target, output_basename, work_directory)
+    print("Searching order of %i symbols..." % (len(names)))
+    search.score(generate_symbol_order_seeds(names, prototypes))
+    if not search.get_best_order():
+        raise RuntimeError("could not build any seed symbol order")
+    # Greedy construction, next symbol is selected among the ones most similar to the previous.
+    order = []
+    remaining = list(search.get_best_order())
+    while 1 < len(remaining):
+        last = order[-1] if order else None
+        candidates = get_similar_symbols(last, remaining, prototypes, SYMBOL_ORDER_GREEDY_CANDIDATES)
+        orders = [order + [ii] + [jj for jj in remaining if jj != ii] for ii in candidates]
+        sizes = search.score(orders)
+        selected = candidates[0]
+        selected_size = None
+        for (ii, size) in zip(candidates, sizes):
+            if (size is not None) and ((selected_size is None) or (size < selected_size)):
+                selected = ii
+                selected_size = size
+        order += [selected]
+        remaining.remove(selected)
+    if is_verbose():
+        print("Greedy symbol order: %s bytes" % (str(search.get_best_size())))
+    # Local search over adjacent swaps.
+    for ii in range(SYMBOL_ORDER_LOCAL_ROUNDS):
+        best_size = search.get_best_size()
+        current = search.get_best_order()
+        orders = []
+        for jj in range(len(current) - 1):
+            orders += [current[:jj] + [current[jj + 1], current[jj]] + current[jj + 2:]]
+        search.score(orders)
+        if search.get_best_size() >= best_size:
+            break
+        if is_verbose():
+            print("Local search round %i: %i bytes" % (ii + 1, search.get_best_size()))
+    # Rebuild best ordering for output with section order search if requested, intermediate files are cached.
+    best = SearchVariant({"symbol_order": ",".join(search.get_best_order())}).run(parser, args, source_directories, target, output_basename, work_directory)
+    if best.get_size() is None:
+        shutil.rmtree(best.get_directory(), True)
+        raise RuntimeError("could not build best symbol order: %s" % (best.get_error()))
+    shutil.copy2(best.get_output(), output_file)
+    if target_file:
+        shutil.copy2(os.path.join(best.get_directory(), target), target_file)
+    shutil.rmtree(best.get_directory(), True)
+    print("Scored %i symbol orders, built %i: %i -> %i bytes" % (search.get_scored(), search.get_built(), initial_size, best.get_size()))
+    print("Wrote '%s': %i bytes (--symbol-order=%s)" % (output_file, best.get_size(), ",".join(search.get_best_order())))
+    return 0
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+(pathname, basename) = os.path.split(__file__)
+if pathname and (pathname != "."):
+    sys.path.append(pathname + "/..")
+
+from dnload.assembler_file import AssemblerFile
+from dnload.common import set_verbose
+from dnload.custom_help_formatter import CustomHelpFormatter
+
+########################################
+# Globals ##############################
+########################################
+
+# Test cases as tuples of name, assembler source and names expected to be removed when reaching from _start.
+CASES = (
+    ("amd64", """    .text
+    .globl unused
+    .type unused, @function
+unused:
+    movl g_unused(%rip), %eax
+    ret
+    .size unused, .-unused
+    .globl _start
+    .type _start, @function
+_start:
+    movl g_used(%rip), %eax
+    ret
+    .size _start, .-_start
+    .data
+    .align 4
+    .type g_unused, @object
+    .size g_unused, 4
+g_unused:
+    .long 3
+    .type g_used, @object
+    .size g_used, 4
+g_used:
+    .long 1
+""", ("g_unused", "unused")),
+    # Data reached through a section anchor, as emitted by gcc on ARM and aarch64.
+    ("arm_anchor", """    .text
+    .align 2
+    .global _start
+    .type _start, %function
+_start:
+    ldr r3, .L3
+    ldr r2, [r3]
+    ldr r3, [r3, #4]
+    add r0, r2, r3
+    bx lr
+.L4:
+    .align 2
+.L3:
+    .word .LANCHOR0
+    .size _start, .-_start
+    .align 2
+    .global unused
+    .type unused, %function
+unused:
+    ldr r3, .L7
+    ldr r0, [r3]
+    bx lr
+.L8:
+    .align 2
+.L7:
+    .word g_unused
+    .size unused, .-unused
+    .data
+    .align 2
+    .type g_unused, %object
+    .size g_unused, 4
+g_unused:
+    .word 3
+    .align 2
+    .set .LANCHOR0,. + 0
+    .type g_a, %object
+    .size g_a, 4
+g_a:
+    .word 1
+    .type g_b, %object
+    .size g_b, 4
+g_b:
+    .word 2
+""", (".L7", ".L8", "g_unused", "unused")),
+    # Data reached through an alias.
+    ("alias", """    .text
+    .globl _start
+    .type _start, @function
+_start:
+    movl g_alias(%rip), %eax
+    ret
+    .size _start, .-_start
+    .data
+    .type g_unused, @object
+    .size g_unused, 4
+g_unused:
+    .long 3
+    .set g_alias, g_used
+    .type g_used, @object
+    .size g_used, 4
+g_used:
+    .long 1
+""", ("g_unused",)),
+)
+
+########################################
+# Functions ############################
+########################################
+
+def verify_case(name, source, expected, directory):
+    """Remove unreachable content from one case, return True if removed names match and none are still referenced."""
+    src = os.path.join(directory, name + ".s")
+    with open(src, "w") as fd:
+        fd.write(source)
+    asm = AssemblerFile(src)
+    asm.sort_sections(None)
+    removed = asm.remove_unreachable(("_start",))
+    dangling = set(removed) & set(re.findall(r'[A-Za-z_\.][\w\.\$]*', asm.generate_file_output(None)))
+    print("%s: removed %s" % (name, ", ".join(sorted(removed)) if removed else "nothing"))
+    if sorted(removed) != sorted(expected):
+        print("ERROR: expected to remove %s" % (", ".join(sorted(expected))))
+        return False
+    if dangling:
+        print("ERROR: removed names still referenced: %s" % (", ".join(sorted(dangling))))
+        return False
+    return True
+
+########################################
+# Main #################################
+########################################
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(usage="Unreachable code and data removal verification.", formatter_class=CustomHelpFormatter, add_help=False)
+    parser.add_argument("-h", "--help", action="store_true", help="Print this help string and exit.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print more info about what is being done.")
+
+    args = parser.parse_args()
+
+    if args.help:
+        print(parser.format_help().strip())
+        return 0
+
+    # Verbosity.
+    if args.verbose:
+        set_verbose(True)
+
+    failures = 0
+    temporary_directory = tempfile.mkdtemp(prefix="dead_code_")
+    try:
+        for (name, source, expected) in CASES:
+            if not verify_case(name, source, expected, temporary_directory):
+                failures += 1
+    finally:
+        shutil.rmtree(temporary_directory, True)
+
+    return 1 if failures else 0
+
+########################################
+# Entry point ##########################
+########################################
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+(pathname, basename) = os.path.split(__file__)
+if pathname and (pathname != "."):
+    sys.path.append(pathname + "/..")
+
+from dnload.common import executable_check
+from dnload.common import executable_search
+from dnload.common import is_verbose
+from dnload.common import set_temporary_directory
+from dnload.common import set_verbose
+from dnload.custom_help_formatter import CustomHelpFormatter
+from dnload.glsl_block import tokenize
+from dnload.glsl_block_source import GlslBlockSource
+from dnload.glsl_parse import glsl_parse_tokenized
+from dnload.preprocessor import Preprocessor
+
+########################################
+# Functions ############################
+########################################
+
+def measure(func, arg, iterations):
+    """Run function given number of times, return result and best time in seconds."""
+    ret = None
+    best = None
+    for ii in range(iterations):
+        start_time = time.time()
+        ret = func(arg)
+        elapsed = time.time() - start_time
+        if (best is None) or (elapsed < best):
+            best = elapsed
+    return (ret, best)
+
+########################################
+# Main #################################
+########################################
+
+def main():
+    """Main function."""
+    default_preprocessor_list = ["cpp", "clang-cpp"]
+    preprocessor = None
+
+    parser = argparse.ArgumentParser(usage="GLSL tokenizer and parser benchmark.", formatter_class=CustomHelpFormatter, add_help=False)
+    parser.add_argument("-h", "--help", action="store_true", help="Print this help string and exit.")
+    parser.add_argument("-n", "--iterations", default=10, type=int, help="Number of iterations, best time is reported.\n(default: %(default)s)")
+    parser.add_argument("--preprocessor", default=None, help="Try to use given preprocessor executable as opposed to autodetect.")
+    parser.add_argument("-r", "--repeat", default=1, type=int, help="Repeat source content given number of times to benchmark large shaders.\n(default: %(default)s)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print more info about what is being done.")
+    parser.add_argument("source", default=[], nargs="*", help="Source file(s) to process.\n(default: shaders in src/)")
+
+    args = parser.parse_args()
+
+    preprocessor = args.preprocessor
+
+    if args.help:
+        print(parser.format_help().strip())
+        return 0
+
+    # Verbosity.
+    if args.verbose:
+        set_verbose(True)
+
+    # Source files to process.
+    source_files = args.source
+    if not source_files:
+        source_files = sorted(glob.glob(os.path.join(pathname or ".", "..", "src", "*.glsl")))
+    if not source_files:
+        raise RuntimeError("no source files to process")
+
+    # Find preprocessor.
+    if preprocessor:
+        if not executable_check(preprocessor):
+            raise RuntimeError("could not use supplied preprocessor '%s'" % (preprocessor))
+    else:
+        preprocessor = executable_search(default_preprocessor_list, "preprocessor")
+    if not preprocessor:
+        raise RuntimeError("suitable preprocessor not found")
+    preprocessor = Preprocessor(preprocessor)
+
+    temporary_directory = tempfile.mkdtemp(prefix="glsl_parse_")
+    set_temporary_directory(temporary_directory)
+    try:
+        print("%-32s %8s %12s %12s" % ("source", "tokens", "tokenize", "parse"))
+        for ii in source_files:
+            source = GlslBlockSource("DNLOAD_USE_LD", ii)
+            source.read(preprocessor)
+            content = "\n".join([source.getContent()] * args.repeat)
+            (tokens, tokenize_time) = measure(tokenize, content, args.iterations)
+            (blocks, parse_time) = measure(glsl_parse_tokenized, tokens, args.iterations)
+            if is_verbose():
+                print("Parsed '%s' into %i top-level blocks" % (ii, len(blocks)))
+            print("%-32s %8i %10.2fms %10.2fms" % (os.path.basename(ii), len(tokens), tokenize_time * 1000.0, parse_time * 1000.0))
+    finally:
+        shutil.rmtree(temporary_directory, True)
+
+    return 0
+
+########################################
+# Entry point ##########################
+########################################
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+(pathname, basename) = os.path.split(__file__)
+if pathname and (pathname != "."):
+    sys.path.append(pathname + "/..")
+
+from dnload.common import executable_check
+from dnload.common import executable_search
+from dnload.common import is_verbose
+from dnload.common import run_command
+from dnload.common import set_verbose
+from dnload.custom_help_formatter import CustomHelpFormatter
+
+########################################
+# Globals ##############################
+########################################
+
+DEFAULT_SYMBOLS = ("acosf", "asinf", "atan2f", "atanf", "cosf", "exp2f", "expf", "fclose", "fmodf", "fopen", "free",
+                   "fwrite", "log2f", "logf", "lrintf", "malloc", "memset", "powf", "printf", "putc", "putchar", "puts",
+                   "qsort", "realloc", "roundf", "sincosf", "sinf", "sleep", "srandom", "tanf", "tanhf")
+
+g_template_source = """#include "dnload.h"
+#include <stdio.h>
+#include <time.h>
+
+/// Sink for loaded symbols.
+void* volatile g_sink;
+
+int main(int argc, char **argv)
+{
+    struct timespec start_time;
+    struct timespec end_time;
+    (void)argv;
+    clock_gettime(CLOCK_MONOTONIC, &start_time);
+    dnload();
+    clock_gettime(CLOCK_MONOTONIC, &end_time);
+    printf("%%li\\n", (long)(end_time.tv_sec - start_time.tv_sec) * 1000000000L + (end_time.tv_nsec - start_time.tv_nsec));
+    // Symbols are only referenced to include them in the symbol table.
+    if(0 > argc)
+    {
+%s
+    }
+    return 0;
+}
+"""
+
+########################################
+# Functions ############################
+########################################
+
+def build_benchmark(compiler, hash_function, symbols, directory, method="maximum"):
+    """Build benchmark program using given method and hash function, return program filename.
+
+    Hash function may be None to let dnload select it."""
+    name = "loader_%s_%s" % (method, hash_function or "auto")
+    source_file = os.path.join(directory, name + ".c")
+    header_file = os.path.join(directory, "dnload.h")
+    output_file = os.path.join(directory, name)
+    # Symbol name detection expects whitespace or parenthesis after the name.
+    references = []
+    for ii in symbols:
+        references += ["        g_sink = (void*)dnload_%s ;" % (ii)]
+    with open(source_file, "w") as fd:
+        fd.write(g_template_source % ("\n".join(references)))
+    with open(header_file, "w") as fd:
+        fd.write("\n")
+    dnload = os.path.join(pathname or ".", "..", "dnload.py")
+    command = [sys.executable, dnload, source_file, "-E", "-m", method]
+    if hash_function:
+        command += ["-H", hash_function]
+    # Dynamic loading needs libc even if no symbols are otherwise linked from it.
+    if "dlfcn" == method:
+        command += ["-l", "c"]
+    run_command(command)
+    # Programs are linked normally, libc is linked first like in dnload binaries.
+    command = [compiler, "-O2", "-no-pie", "-DDNLOAD_NO_FIXED_R_DEBUG_ADDRESS", "-I" + directory, source_file, "-o",
+               output_file, "-Wl,--no-as-needed", "-lc", "-lm", "-ldl"]
+    with open(header_file, "r") as fd:
+        if "__builtin_ia32_crc32" in fd.read():
+            command += ["-msse4.2"]
+    run_command(command)
+    if is_verbose():
+        print("Built '%s'." % (output_file))
+    return output_file
+
+def measure_benchmark(program, iterations):
+    """Run program given number of times, return sorted listing of loader times in nanoseconds."""
+    ret = []
+    for ii in range(iterations):
+        (so, se) = run_command([program])
+        ret += [int(so.strip())]
+    return sorted(ret)
+
+########################################
+# Main #################################
+########################################
+
+def main():
+    """Main function."""
+    default_compiler_list = ["cc", "gcc", "clang"]
+    compiler = None
+
+    parser = argparse.ArgumentParser(usage="Import by hash loader startup benchmark.", formatter_class=CustomHelpFormatter, add_help=False)
+    parser.add_argument("-c", "--compiler", default=None, help="Try to use given compiler executable as opposed to autodetect.")
+    parser.add_argument("-h", "--help", action="store_true", help="Print this help string and exit.")
+    parser.add_argument("-H", "--hash-function", default=["sdbm", "crc32", "gnu"], nargs="+", choices=("crc32", "gnu", "sdbm"), help="Hash functions to benchmark, 'gnu' uses the DT_GNU_HASH loader.\n(default: %(default)s)")
+    parser.add_argument("-n", "--iterations", default=50, type=int, help="Number of program runs per hash function.\n(default: %(default)s)")
+    parser.add_argument("-s", "--symbols", default=list(DEFAULT_SYMBOLS), nargs="+", help="Symbols to load.\n(default: libc and libm symbols)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print more info about what is being done.")
+
+    args = parser.parse_args()
+
+    compiler = args.compiler
+
+    if args.help:
+        print(parser.format_help().strip())
+        return 0
+
+    # Verbosity.
+    if args.verbose:
+        set_verbose(True)
+
+    # Find compiler.
+    if compiler:
+        if not executable_check(compiler):
+            raise RuntimeError("could not use supplied compiler '%s'" % (compiler))
+    else:
+        compiler = executable_search(default_compiler_list, "compiler")
+    if not compiler:
+        raise RuntimeError("suitable compiler not found")
+
+    temporary_directory = tempfile.mkdtemp(prefix="loader_startup_")
+    try:
+        print("%i symbols, %i iterations" % (len(args.symbols), args.iterations))
+        print("%-8s %12s %12s %12s" % ("hash", "min", "median", "max"))
+        for ii in args.hash_function:
+            program = build_benchmark(compiler, ii, args.symbols, temporary_directory)
+            times = measure_benchmark(program, args.iterations)
+            print("%-8s %10.1fus %10.1fus %10.1fus" % (ii, times[0] / 1000.0, times[len(times) // 2] / 1000.0, times[-1] / 1000.0))
+    finally:
+        shutil.rmtree(temporary_directory, True)
+
+    return 0
+
+########################################
+# Entry point ##########################
+########################################
+
+if __name__ == "__main__":
+    sys.exit(main())
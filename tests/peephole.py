@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+(pathname, basename) = os.path.split(__file__)
+if pathname and (pathname != "."):
+    sys.path.append(pathname + "/..")
+
+from dnload.assembler_file import AssemblerFile
+from dnload.common import executable_check
+from dnload.common import executable_search
+from dnload.common import run_command
+from dnload.common import set_verbose
+from dnload.custom_help_formatter import CustomHelpFormatter
+from dnload.elf_file import ElfFile
+
+########################################
+# Globals ##############################
+########################################
+
+# Compiler flags matching the ones dnload uses for size-optimized code.
+COMPILER_FLAGS = ("-Os", "-ffast-math", "-fno-asynchronous-unwind-tables", "-fno-exceptions", "-fomit-frame-pointer",
+                  "-fno-pic", "-S")
+
+########################################
+# Functions ############################
+########################################
+
+def assemble_size(assembler, src, directory, name, peephole):
+    """Crunch assembler source with or without peephole rewrites and assemble it.
+
+    Returns tuple of code size and dictionary of peephole statistics."""
+    asm = AssemblerFile(src)
+    asm.sort_sections(None)
+    stats = asm.crunch(peephole)
+    output_s = os.path.join(directory, name + ".S")
+    output_o = os.path.join(directory, name + ".o")
+    asm.write(output_s, None)
+    run_command([assembler, output_s, "-o", output_o])
+    with ElfFile(output_o) as elf:
+        size = sum([ii["size"] for ii in elf.get_sections() if ii["name"].startswith(".text")])
+    return (size, stats)
+
+def verify_source(compiler, assembler, source, directory):
+    """Verify peephole savings of one source file. Returns tuple of predicted and assembled savings."""
+    name = os.path.splitext(os.path.basename(source))[0]
+    src = os.path.join(directory, name + ".s")
+    run_command([compiler] + list(COMPILER_FLAGS) + [source, "-o", src])
+    (size_before, unused) = assemble_size(assembler, src, directory, name + "_before", False)
+    (size_after, stats) = assemble_size(assembler, src, directory, name + "_after", True)
+    predicted = sum([ii[1] for ii in stats.values()])
+    actual = size_before - size_after
+    print("%s: %i -> %i bytes, predicted %i, assembled %i" % (source, size_before, size_after, predicted, actual))
+    for ii in sorted(stats.keys()):
+        print("    %-20s %4i rewrites %4i bytes" % (ii, stats[ii][0], stats[ii][1]))
+    return (predicted, actual)
+
+########################################
+# Main #################################
+########################################
+
+def main():
+    """Main function."""
+    default_assembler_list = ["as"]
+    default_compiler_list = ["cc", "gcc", "clang"]
+
+    parser = argparse.ArgumentParser(usage="Peephole optimizer verification, assembles crunched code with and without peephole rewrites.", formatter_class=CustomHelpFormatter, add_help=False)
+    parser.add_argument("-A", "--assembler", default=None, help="Try to use given assembler executable as opposed to autodetect.")
+    parser.add_argument("-c", "--compiler", default=None, help="Try to use given compiler executable as opposed to autodetect.")
+    parser.add_argument("-h", "--help", action="store_true", help="Print this help string and exit.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print more info about what is being done.")
+    parser.add_argument("source", default=[], nargs="*", help="C or C++ source file(s) to verify.")
+
+    args = parser.parse_args()
+
+    if args.help or (not args.source):
+        print(parser.format_help().strip())
+        return 0
+
+    # Verbosity.
+    if args.verbose:
+        set_verbose(True)
+
+    assembler = args.assembler
+    if assembler:
+        if not executable_check(assembler):
+            raise RuntimeError("could not use supplied assembler '%s'" % (assembler))
+    else:
+        assembler = executable_search(default_assembler_list, "assembler")
+    compiler = args.compiler
+    if compiler:
+        if not executable_check(compiler):
+            raise RuntimeError("could not use supplied compiler '%s'" % (compiler))
+    else:
+        compiler = executable_search(default_compiler_list, "compiler")
+    if (not assembler) or (not compiler):
+        raise RuntimeError("suitable assembler or compiler not found")
+
+    failures = 0
+    temporary_directory = tempfile.mkdtemp(prefix="peephole_")
+    try:
+        for ii in args.source:
+            (predicted, actual) = verify_source(compiler, assembler, ii, temporary_directory)
+            # Shorter code may allow shorter jumps, but savings must never be smaller than predicted.
+            if actual < predicted:
+                print("ERROR: assembled savings smaller than predicted for '%s'" % (ii))
+                failures += 1
+    finally:
+        shutil.rmtree(temporary_directory, True)
+
+    return 1 if failures else 0
+
+########################################
+# Entry point ##########################
+########################################
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+(pathname, basename) = os.path.split(__file__)
+if pathname and (pathname != "."):
+    sys.path.append(pathname + "/..")
+
+from dnload.common import executable_check
+from dnload.common import executable_search
+from dnload.common import is_verbose
+from dnload.common import run_command
+from dnload.common import set_verbose
+from dnload.custom_help_formatter import CustomHelpFormatter
+from dnload.option_search import is_clean_exit
+from loader_startup import build_benchmark
+from loader_startup import measure_benchmark
+
+########################################
+# Globals ##############################
+########################################
+
+FILEDROP_MODES = ("header", "native", "cross")
+
+METHODS = ("vanilla", "dlfcn", "hash", "maximum")
+
+UNPACK_HEADERS = ("lzma", "xz")
+
+# Environment variables that would make programs open windows or audio devices.
+HEADLESS_REMOVE = ("DISPLAY", "WAYLAND_DISPLAY")
+
+# Environment variables for running programs without a display or audio device.
+HEADLESS_SET = {"SDL_AUDIODRIVER": "dummy", "SDL_VIDEODRIVER": "dummy"}
+
+########################################
+# Functions ############################
+########################################
+
+def benchmark(binary, resolve_program, iterations, env):
+    """Benchmark binary phases, return dictionary of results."""
+    unpacked_file = binary + ".unpacked"
+    (unpack_script, exec_command) = split_binary(binary, unpacked_file)
+    ret = {"size": os.path.getsize(binary), "phases": {}}
+    phases = (("unpack", ["/bin/sh", unpack_script]), ("exec", exec_command), ("total", ["/bin/sh", binary]))
+    # Symbol resolution is timed by the benchmark program, which reports nanoseconds.
+    samples = {"dnload": [x / 1000.0 for x in measure_benchmark(resolve_program, iterations)], "loader": []}
+    for (name, command) in phases:
+        samples[name] = []
+    for ii in range(iterations):
+        for (name, command) in phases:
+            (elapsed, returncode) = measure(command, env)
+            if not is_clean_exit(returncode):
+                raise RuntimeError("phase '%s' of '%s' failed: %i" % (name, binary, returncode))
+            samples[name] += [elapsed]
+        cycles = measure_loader(exec_command, env)
+        if cycles is not None:
+            samples["loader"] += [cycles]
+    for (name, command) in phases:
+        ret["phases"][name] = calculate_distribution(samples[name], "us")
+    ret["phases"]["dnload"] = calculate_distribution(samples["dnload"], "us")
+    if samples["loader"]:
+        ret["phases"]["loader"] = calculate_distribution(samples["loader"], "cycles")
+    return ret
+
+def build_binary(source, method, filedrop_mode, unpack_header, directory):
+    """Build source file with given options, return output filename."""
+    output_file = os.path.join(directory, "%s_%s_%s_%s" % (os.path.splitext(os.path.basename(source))[0], method,
+                                                           filedrop_mode, unpack_header))
+    dnload = os.path.join(pathname or ".", "..", "dnload.py")
+    command = [sys.executable, dnload, source, "-m", method, "-F", filedrop_mode, "-u", unpack_header, "-o",
+               output_file]
+    # Dynamic loading needs libc even if no symbols are otherwise linked from it.
+    if "dlfcn" == method:
+        command += ["-l", "c"]
+    run_command(command)
+    if is_verbose():
+        print("Built '%s'." % (output_file))
+    return output_file
+
+def calculate_distribution(lst, unit):
+    """Calculate distribution of samples."""
+    lst = sorted(lst)
+    count = len(lst)
+    return {
+        "unit": unit,
+        "count": count,
+        "min": lst[0],
+        "median": lst[count // 2],
+        "mean": sum(lst) / float(count),
+        "p90": lst[min(count * 9 // 10, count - 1)],
+        "max": lst[-1],
+    }
+
+def find_symbols(source):
+    """Find dnload symbols referenced by given source file, return sorted list."""
+    with open(source, "r") as fd:
+        return sorted(set(re.findall(r'\bdnload_(\w+)\s*\(', fd.read())))
+
+def generate_environment():
+    """Generate environment for running binaries headless."""
+    ret = dict(os.environ)
+    for ii in HEADLESS_REMOVE:
+        ret.pop(ii, None)
+    ret.update(HEADLESS_SET)
+    return ret
+
+def measure(command, env):
+    """Run command once, return wall clock time in microseconds and return code."""
+    start_time = time.perf_counter()
+    returncode = subprocess.call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    return ((time.perf_counter() - start_time) * 1000000.0, returncode)
+
+def measure_loader(command, env):
+    """Run command once with dynamic loader statistics, return loader startup cycles or None if not available."""
+    env = dict(env)
+    env["LD_DEBUG"] = "statistics"
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env)
+    (proc_stdout, proc_stderr) = proc.communicate()
+    match = re.search(r'total startup time in dynamic loader:\s+(\d+)', proc_stderr.decode(errors="replace"))
+    if not match:
+        return None
+    return int(match.group(1))
+
+def split_binary(op, unpacked_file):
+    """Split self-extracting binary into an unpack script and command to execute the unpacked file.
+
+    Returns tuple of (unpack script filename, execution command)."""
+    with open(op, "rb") as fd:
+        data = fd.read()
+    match = re.search(br'I=(\S+?);(.*?);exit\n', data)
+    if not match:
+        raise RuntimeError("could not find unpack header in '%s'" % (op))
+    unpack = []
+    exec_command = None
+    for ii in match.group(2).decode().split(";"):
+        if (">$I" in ii) or ii.startswith("chmod"):
+            unpack += [ii]
+        elif ii.endswith("$I"):
+            exec_command = ii.split()[:-1] + [unpacked_file]
+        else:
+            raise RuntimeError("unknown unpack header command '%s' in '%s'" % (ii, op))
+    if not exec_command:
+        raise RuntimeError("could not find execution command in '%s'" % (op))
+    # Line count of the header must not change, the payload is found by skipping lines.
+    header = "I=%s;%s;exit\n" % (unpacked_file, ";".join(unpack))
+    ret = op + ".unpack"
+    with open(ret, "wb") as fd:
+        fd.write(data[:match.start()] + header.encode() + data[match.end():])
+    return (ret, exec_command)
+
+########################################
+# Main #################################
+########################################
+
+def main():
+    """Main function."""
+    default_compiler_list = ["cc", "gcc", "clang"]
+    compiler = None
+
+    parser = argparse.ArgumentParser(usage="Startup latency benchmark for generated binaries.", formatter_class=CustomHelpFormatter, add_help=False)
+    parser.add_argument("-c", "--compiler", default=None, help="Try to use given compiler executable for symbol resolution programs as opposed to autodetect.")
+    parser.add_argument("-F", "--filedrop-mode", default=list(FILEDROP_MODES), nargs="+", choices=FILEDROP_MODES, help="Filedrop modes to benchmark.\n(default: %(default)s)")
+    parser.add_argument("-h", "--help", action="store_true", help="Print this help string and exit.")
+    parser.add_argument("-m", "--method", default=list(METHODS), nargs="+", choices=METHODS, help="Methods to benchmark.\n(default: %(default)s)")
+    parser.add_argument("-n", "--iterations", default=20, type=int, help="Number of runs per binary.\n(default: %(default)s)")
+    parser.add_argument("-o", "--output-file", default=None, help="Write JSON results into given file instead of stdout.")
+    parser.add_argument("-s", "--source", default=os.path.join(pathname or ".", "..", "src", "hello_world.cpp"), help="Source file to build.\n(default: %(default)s)")
+    parser.add_argument("-u", "--unpack-header", default=list(UNPACK_HEADERS), nargs="+", choices=UNPACK_HEADERS, help="Unpack headers to benchmark.\n(default: %(default)s)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print more info about what is being done.")
+
+    args = parser.parse_args()
+
+    compiler = args.compiler
+
+    if args.help:
+        print(parser.format_help().strip())
+        return 0
+
+    # Verbosity.
+    if args.verbose:
+        set_verbose(True)
+
+    if 0 >= args.iterations:
+        raise RuntimeError("invalid iteration count: %i" % (args.iterations))
+
+    # Find compiler.
+    if compiler:
+        if not executable_check(compiler):
+            raise RuntimeError("could not use supplied compiler '%s'" % (compiler))
+    else:
+        compiler = executable_search(default_compiler_list, "compiler")
+    if not compiler:
+        raise RuntimeError("suitable compiler not found")
+
+    env = generate_environment()
+    results = []
+    temporary_directory = tempfile.mkdtemp(prefix="startup_latency_")
+    try:
+        # Build in a copy of the source directory, building rewrites the header file next to the source.
+        source_directory = os.path.join(temporary_directory, "src")
+        shutil.copytree(os.path.dirname(os.path.abspath(args.source)), source_directory)
+        source = os.path.join(source_directory, os.path.basename(args.source))
+        symbols = find_symbols(source)
+        for method in args.method:
+            # Symbol resolution does not depend on filedrop mode or unpack header.
+            try:
+                resolve_directory = os.path.join(temporary_directory, "resolve_" + method)
+                os.mkdir(resolve_directory)
+                resolve_program = build_benchmark(compiler, None, symbols, resolve_directory, method)
+                resolve_error = None
+            except (OSError, RuntimeError) as err:
+                resolve_error = "symbol resolution program: %s" % (str(err).strip().split("\n")[0])
+            for filedrop_mode in args.filedrop_mode:
+                for unpack_header in args.unpack_header:
+                    result = {"method": method, "filedrop_mode": filedrop_mode, "unpack_header": unpack_header}
+                    try:
+                        if resolve_error:
+                            raise RuntimeError(resolve_error)
+                        binary = build_binary(source, method, filedrop_mode, unpack_header, temporary_directory)
+                        result.update(benchmark(binary, resolve_program, args.iterations, env))
+                    except (OSError, RuntimeError) as err:
+                        result["error"] = str(err).strip().split("\n")[0]
+                    if is_verbose():
+                        print("%s/%s/%s: %s" % (method, filedrop_mode, unpack_header, result.get("error", "ok")))
+                    results += [result]
+    finally:
+        shutil.rmtree(temporary_directory, True)
+
+    output = json.dumps({"source": os.path.basename(args.source), "iterations": args.iterations, "results": results},
+                        indent=2, sort_keys=True)
+    if args.output_file:
+        with open(args.output_file, "w") as fd:
+            fd.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+########################################
+# Entry point ##########################
+########################################
+
+if __name__ == "__main__":
+    sys.exit(main())